@@ -0,0 +1,393 @@
+"""SNS投稿の一括生成（Streamlitを使わないバッチモード）
+
+使い方:
+    python batch_generate.py --output posts.jsonl                 # GitHubの一覧から生成
+    python batch_generate.py --folder ./vibe-cording-writing      # ローカルフォルダから生成
+    python batch_generate.py --ai --model deepseek/deepseek-r1-0528:free --rpm 20   # AIで投稿を生成
+    python batch_generate.py --skip-duplicates                    # ほぼ同じ内容のファイルは代表の1件だけ生成
+
+結果は1行1レコード（ファイル × プラットフォーム、AIモードはさらに × モデル）のJSONLとして逐次書き出す。
+出力ファイルが既にある場合は生成済みのレコードを読み飛ばして再開する。
+AIモードのAPIキーは環境変数 ``OPENROUTER_API_KEY`` または ``--api-key`` で指定する。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import social_media_post_generator as sgp
+from social_media_post_generator import (
+    AIArticleGenerator, PostStore, SocialMediaPostGenerator, file_content_hash, get_duplicate_index, get_post_store,
+    git_blob_sha
+)
+
+PLATFORMS = ['Twitter', 'LinkedIn', 'note']
+
+_worker_generator = None
+_worker_store = None
+_worker_config_hash = None
+
+
+def _init_worker(folder, use_store=True):
+    """ワーカープロセスごとにジェネレーターと投稿ストアを1つだけ作成"""
+    global _worker_generator, _worker_store, _worker_config_hash
+    _worker_generator = SocialMediaPostGenerator(folder)
+    _worker_store = PostStore() if use_store else None
+    _worker_config_hash = _worker_generator.config_hash()
+
+
+def generate_file_posts(file, platforms):
+    """1ファイル分の投稿を全プラットフォーム分生成"""
+    content = _worker_generator.read_file_content(file['path'], file.get('source', 'local'), sha=file.get('sha'))
+    base = {
+        'relative_path': file['relative_path'],
+        'title': file['title'],
+        'category': file.get('category', ''),
+    }
+    if content.startswith('ファイル読み取りエラー'):
+        return [dict(base, platform=platform, error=content) for platform in platforms]
+
+    content_sha = git_blob_sha(content.encode('utf-8'))
+    records = []
+    for platform in platforms:
+        if _worker_store is not None:
+            # アプリと同じ投稿ストアを使い、生成済みなら読み出すだけにする
+            post = _worker_store.get_or_create(
+                _worker_generator, content, platform, file['title'],
+                file_content_hash(file, content), _worker_config_hash
+            )
+        else:
+            post = _worker_generator.create_post(platform, content, file['title'])
+        records.append(dict(base, platform=platform, post=post, chars=len(post), content_sha=content_sha))
+    return records
+
+
+def load_completed(output_path, key_fields=('relative_path', 'platform')):
+    """出力済みJSONLから完了済みのレコードのキー（デフォルトは (relative_path, platform)）を読み込み"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 中断時に途中まで書かれた行
+            if 'error' not in record:
+                completed.add(tuple(record.get(field) for field in key_fields))
+    return completed
+
+
+def run_batch(md_files, output_path, platforms, folder=None, workers=None, resume=True, use_store=True,
+              log=sys.stderr):
+    """ファイル一覧をプロセスプールで処理し、結果をJSONLに逐次書き出す"""
+    completed = load_completed(output_path) if resume else set()
+    pending = []
+    for file in md_files:
+        todo = [p for p in platforms if (file['relative_path'], p) not in completed]
+        if todo:
+            pending.append((file, todo))
+
+    skipped = len(md_files) - len(pending)
+    if skipped:
+        print(f"⏭️  {skipped}件は生成済みのためスキップ", file=log)
+
+    workers = workers or os.cpu_count() or 1
+    max_inflight = workers * 4  # 投入数を抑えてメモリ使用量を一定に保つ
+    processed = 0
+    records_written = 0
+    started = time.perf_counter()
+
+    mode = 'a' if resume else 'w'
+    with open(output_path, mode, encoding='utf-8') as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(folder, use_store)) as executor:
+        queue = iter(pending)
+        inflight = set()
+        while True:
+            while len(inflight) < max_inflight:
+                item = next(queue, None)
+                if item is None:
+                    break
+                inflight.add(executor.submit(generate_file_posts, *item))
+            if not inflight:
+                break
+            done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                for record in future.result():
+                    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    records_written += 1
+                processed += 1
+            out.flush()
+            if processed % 20 == 0 or not inflight:
+                elapsed = time.perf_counter() - started
+                rate = processed / elapsed if elapsed else 0.0
+                print(f"📄 {processed}/{len(pending)} ファイル ({rate:.1f} files/sec)", file=log)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'files': processed,
+        'skipped': skipped,
+        'records': records_written,
+        'seconds': elapsed,
+        'files_per_sec': processed / elapsed if elapsed else 0.0,
+    }
+
+
+BACKOFF_BASE = 2.0   # 再試行の待ち時間の初期値（秒）
+BACKOFF_MAX = 120.0  # 再試行の待ち時間の上限（秒）
+
+
+class ModelRateLimiter:
+    """1モデルへのリクエスト間隔を守る非同期のレートリミッター（1分あたりの上限）"""
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        """次のリクエストを送ってよい時刻まで待つ"""
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        """レート制限を受けたので、このモデルへの全リクエストをしばらく止める"""
+        self._next_at = max(self._next_at, time.monotonic() + seconds)
+
+
+def is_retryable(error):
+    """再試行すべきエラー（レート制限・タイムアウト・サーバー側の一時的な失敗・空の応答）かどうか"""
+    if isinstance(error, (asyncio.TimeoutError, ValueError)):
+        return True
+    openai = sgp.load_openai()
+    return isinstance(error, (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    ))
+
+
+def retry_delay(error, attempt):
+    """再試行までの待ち秒数（Retry-Afterがあればそれに従い、なければジッター付き指数バックオフ）"""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after', '') if response is not None else ''
+    if retry_after.isdigit():
+        return float(retry_after)
+    ceiling = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+async def generate_ai_post(ai, client, limiter, model, platform, config, title, content, max_retries, use_cache):
+    """レート制限と再試行つきで1件生成し、(結果, 試行回数) を返す"""
+    for attempt in range(max_retries + 1):
+        await limiter.wait()
+        try:
+            result = await ai.generate_post_async(client, model, platform, config, title, content, use_cache,
+                                                  throttle=limiter.wait)
+            return result, attempt + 1
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            if isinstance(e, sgp.load_openai().RateLimitError):
+                limiter.pause(delay)
+            await asyncio.sleep(delay)
+
+
+async def run_ai_batch_async(md_files, output_path, platforms, models, generator, ai, concurrency=4,
+                             requests_per_minute=20, max_retries=5, resume=True, use_cache=True,
+                             timeout=120, log=sys.stderr):
+    """ファイル × プラットフォーム × モデルの投稿を、同時実行数とモデルごとのレート制限を守ってAIで生成
+
+    1件生成するたびにJSONLへ書き出してflushするので、中断しても再実行すれば続きから再開できる。
+    """
+    key_fields = ('relative_path', 'platform', 'model')
+    completed = load_completed(output_path, key_fields) if resume else set()
+    pending = []
+    for file in md_files:
+        todo = [(platform, model) for platform in platforms for model in models
+                if (file['relative_path'], platform, model) not in completed]
+        if todo:
+            pending.append((file, todo))
+    total_items = sum(len(todo) for _, todo in pending)
+    skipped = len(md_files) * len(platforms) * len(models) - total_items
+    if skipped:
+        print(f"⏭️  {skipped}件は生成済みのためスキップ", file=log)
+
+    limiters = {model: ModelRateLimiter(requests_per_minute) for model in models}
+    queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    totals = {'items': 0, 'errors': 0, 'cached': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost': 0.0}
+    started = time.perf_counter()
+
+    mode = 'a' if resume else 'w'
+    with open(output_path, mode, encoding='utf-8') as out:
+        def checkpoint(record):
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            out.flush()
+            totals['items'] += 1
+            if totals['items'] % 20 == 0 or totals['items'] == total_items:
+                elapsed = time.perf_counter() - started
+                print(f"🤖 {totals['items']}/{total_items} 件 ({totals['items'] / elapsed:.2f} items/sec, "
+                      f"費用 {totals['cost']:.4f})", file=log)
+
+        async def worker(client):
+            while True:
+                try:
+                    file, todo = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                content = await asyncio.to_thread(
+                    generator.read_file_content, file['path'], file.get('source', 'local'), file.get('sha')
+                )
+                base = {
+                    'relative_path': file['relative_path'],
+                    'title': file['title'],
+                    'category': file.get('category', ''),
+                }
+                for platform, model in todo:
+                    record = dict(base, platform=platform, model=model)
+                    if content.startswith('ファイル読み取りエラー'):
+                        totals['errors'] += 1
+                        checkpoint(dict(record, error=content))
+                        continue
+                    item_started = time.perf_counter()
+                    try:
+                        result, attempts = await generate_ai_post(
+                            ai, client, limiters[model], model, platform, generator.platform_configs[platform],
+                            file['title'], content, max_retries, use_cache
+                        )
+                    except Exception as e:
+                        totals['errors'] += 1
+                        checkpoint(dict(record, error=f"{type(e).__name__}: {e}"))
+                        continue
+                    totals['cached'] += int(result['cached'])
+                    for field in ('prompt_tokens', 'completion_tokens', 'cost'):
+                        totals[field] += result.get(field) or 0
+                    checkpoint(dict(
+                        record,
+                        post=result['content'],
+                        chars=len(result['content']),
+                        cached=result['cached'],
+                        attempts=attempts,
+                        seconds=time.perf_counter() - item_started,
+                        prompt_tokens=result.get('prompt_tokens'),
+                        completion_tokens=result.get('completion_tokens'),
+                        cost=result.get('cost'),
+                    ))
+
+        openai = sgp.load_openai()
+        async with openai.AsyncOpenAI(base_url=sgp.OPENROUTER_BASE_URL, api_key=ai.api_key, timeout=timeout,
+                                      max_retries=0) as client:
+            await asyncio.gather(*(worker(client) for _ in range(max(1, concurrency))))
+
+    elapsed = time.perf_counter() - started
+    return dict(
+        totals,
+        skipped=skipped,
+        seconds=elapsed,
+        items_per_sec=totals['items'] / elapsed if elapsed else 0.0,
+    )
+
+
+def run_ai_batch(md_files, output_path, platforms, models, generator, ai, **kwargs):
+    """AIでの一括生成（同期呼び出し用のラッパー）"""
+    return asyncio.run(run_ai_batch_async(md_files, output_path, platforms, models, generator, ai, **kwargs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Markdownファイルから全プラットフォームのSNS投稿を一括生成")
+    parser.add_argument('--folder', help="ローカルのWritingフォルダ（省略時はGitHubの一覧を使用）")
+    parser.add_argument('--output', default=None, help="出力するJSONLファイル（デフォルト: posts.jsonl / AIモードはai_posts.jsonl）")
+    parser.add_argument('--platforms', nargs='+', default=PLATFORMS, choices=PLATFORMS)
+    parser.add_argument('--workers', type=int, default=None, help="プロセス数（デフォルト: CPUコア数）")
+    parser.add_argument('--no-resume', action='store_true', help="既存の出力を破棄して最初から生成")
+    parser.add_argument('--no-store', action='store_true', help="アプリと共有する投稿ストアを使わない")
+    parser.add_argument('--skip-duplicates', action='store_true',
+                        help="ほぼ同じ内容のファイル（MinHashで検出）は代表の1件だけ生成")
+    ai_group = parser.add_argument_group("AIモード")
+    ai_group.add_argument('--ai', action='store_true', help="OpenRouterのモデルで投稿を生成")
+    ai_group.add_argument('--model', nargs='+', default=['deepseek/deepseek-r1-0528:free'], help="使用するモデル")
+    ai_group.add_argument('--api-key', default=os.environ.get('OPENROUTER_API_KEY'), help="OpenRouter APIキー")
+    ai_group.add_argument('--concurrency', type=int, default=4, help="同時に生成する件数")
+    ai_group.add_argument('--rpm', type=float, default=20, help="モデルごとの1分あたりのリクエスト上限")
+    ai_group.add_argument('--max-retries', type=int, default=5, help="1件あたりの再試行回数")
+    ai_group.add_argument('--timeout', type=float, default=120, help="1リクエストのタイムアウト（秒）")
+    ai_group.add_argument('--no-cache', action='store_true', help="LLM応答キャッシュを使わずに生成")
+    args = parser.parse_args(argv)
+    args.output = args.output or ('ai_posts.jsonl' if args.ai else 'posts.jsonl')
+
+    generator = SocialMediaPostGenerator(args.folder)
+    md_files = generator.get_all_md_files()
+    if not md_files:
+        print("❌ Markdownファイルが見つかりません", file=sys.stderr)
+        return 1
+
+    if args.skip_duplicates:
+        duplicate_index = get_duplicate_index(str(generator.writing_folder) if generator.writing_folder else generator.github_repo)
+        duplicate_index.update(md_files, generator)
+        redundant = duplicate_index.redundant_paths()
+        md_files = [f for f in md_files if f['relative_path'] not in redundant]
+        print(f"🧬 重複している{len(redundant)}件を除外（{len(duplicate_index.clusters())}クラスタ）", file=sys.stderr)
+
+    if args.ai:
+        if not sgp.OPENAI_AVAILABLE:
+            print("❌ AIモードにはopenaiパッケージが必要です", file=sys.stderr)
+            return 1
+        if not args.api_key:
+            print("❌ OpenRouter APIキーが必要です（OPENROUTER_API_KEY または --api-key）", file=sys.stderr)
+            return 1
+        stats = run_ai_batch(
+            md_files,
+            args.output,
+            args.platforms,
+            args.model,
+            generator,
+            AIArticleGenerator(api_key=args.api_key),
+            concurrency=args.concurrency,
+            requests_per_minute=args.rpm,
+            max_retries=args.max_retries,
+            resume=not args.no_resume,
+            use_cache=not args.no_cache,
+            timeout=args.timeout
+        )
+        print(
+            f"✅ {stats['items']}件（失敗 {stats['errors']}件・キャッシュ {stats['cached']}件）を"
+            f"{stats['seconds']:.1f}秒で生成 ({stats['items_per_sec']:.2f} items/sec)\n"
+            f"   トークン: 入力 {stats['prompt_tokens']} / 出力 {stats['completion_tokens']}、"
+            f"費用 {stats['cost']:.4f} → {args.output}",
+            file=sys.stderr
+        )
+        return 0
+
+    if not args.no_store:
+        get_post_store(generator.config_hash())  # 設定が変わって使われなくなった投稿を削除
+    stats = run_batch(
+        md_files,
+        args.output,
+        args.platforms,
+        folder=args.folder,
+        workers=args.workers,
+        resume=not args.no_resume,
+        use_store=not args.no_store
+    )
+    print(
+        f"✅ {stats['files']}ファイル / {stats['records']}件を{stats['seconds']:.2f}秒で生成 "
+        f"({stats['files_per_sec']:.1f} files/sec) → {args.output}",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+"""SNS投稿ジェネレーターのベンチマーク
+
+使い方:
+    python benchmarks/run_benchmarks.py --output bench_results.json
+    python benchmarks/run_benchmarks.py --quick --baseline bench_results.json --fail-on-regression 20
+
+GitHubとOpenRouterはローカルのスタブサーバー（benchmarks/stub_servers.py）に差し替えて計測する。
+結果はJSONで書き出し、``--baseline`` を指定すると前回結果との速度比を表示する。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+CORPUS_DIR = REPO_ROOT / 'vibe-cording-writing'
+
+sys.path.insert(0, str(REPO_ROOT))
+from stub_servers import StubGitHubServer, StubOpenRouterServer  # noqa: E402
+
+# スタブの接続先とキャッシュ先はモジュールの読み込み前に環境変数で渡す
+_WORK_DIR = Path(tempfile.mkdtemp(prefix='sns-bench-'))
+os.environ.setdefault('STREAMLIT_LOGGER_LEVEL', 'error')
+os.environ['SNS_CACHE_DIR'] = str(_WORK_DIR / 'cache')
+
+
+def load_corpus():
+    """ベンチマーク用に実際の記事フォルダを読み込み（リポジトリ内パス -> bytes）"""
+    files = {}
+    for path in sorted(CORPUS_DIR.rglob('*.md')):
+        files[path.relative_to(REPO_ROOT).as_posix()] = path.read_bytes()
+    return files
+
+
+def synthetic_markdown(size_bytes, seed=0):
+    """見出し・箇条書き・文章を混ぜた合成Markdownを作成"""
+    rng = random.Random(seed)
+    words = ['AI', '業務', '効率化', 'SNS', '運用', '事務', '自動化', 'note', '記事', '改善',
+             'データ', '分析', 'チーム', '働き方', 'DX', 'ツール', '導入', '成果', '課題', '仕組み']
+    parts = []
+    size = 0
+    while size < size_bytes:
+        kind = rng.random()
+        body = ''.join(rng.choice(words) for _ in range(rng.randint(4, 24)))
+        if kind < 0.08:
+            line = f"{'#' * rng.randint(1, 3)} {body}"
+        elif kind < 0.25:
+            line = f"{rng.choice(['-', '・', '✔️'])} {body}"
+        elif kind < 0.6:
+            line = f"{body}。{body}{rng.choice(['！', '。', ''])}"
+        elif kind < 0.7:
+            line = ''
+        else:
+            line = f"{body}、{body}"
+        parts.append(line)
+        size += len(line.encode('utf-8')) + 1
+    return '\n'.join(parts)
+
+
+def measure(fn, repeat, setup=None):
+    """fnをrepeat回実行して所要時間の統計を返す（setupは計測対象外）"""
+    timings = []
+    extra = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+        if isinstance(result, dict):
+            extra = result
+    stats = {
+        'unit': 'seconds',
+        'runs': len(timings),
+        'median': statistics.median(timings),
+        'min': min(timings),
+        'mean': statistics.fmean(timings),
+        'max': max(timings),
+    }
+    if extra:
+        stats['extra'] = extra
+    return stats
+
+
+class BenchmarkRunner:
+    """ベンチマークケースを順に実行して結果を集める"""
+
+    def __init__(self, repeat, only=None, log=sys.stderr):
+        self.repeat = repeat
+        self.only = only
+        self.log = log
+        self.results = {}
+
+    def run(self, name, fn, setup=None, repeat=None):
+        if self.only and not any(pattern in name for pattern in self.only):
+            return
+        stats = measure(fn, repeat or self.repeat, setup)
+        self.results[name] = stats
+        print(f"  {name:<48} median {stats['median'] * 1000:10.2f} ms  (min {stats['min'] * 1000:.2f} ms)",
+              file=self.log)
+
+
+def bench_parsing(runner, sgp, documents, label):
+    """extract_key_points と3プラットフォームの投稿作成"""
+    generator = sgp.SocialMediaPostGenerator()
+
+    def extract_all():
+        for title, content in documents:
+            generator.extract_key_points(content)
+
+    def build_all():
+        for title, content in documents:
+            for platform_name in ('Twitter', 'LinkedIn', 'note'):
+                generator.create_post(platform_name, content, title)
+
+    runner.run(f'parse.{label}.extract_key_points', extract_all, setup=sgp.clear_document_cache)
+    runner.run(f'parse.{label}.all_platforms', build_all, setup=sgp.clear_document_cache)
+    runner.run(f'parse.{label}.all_platforms_memoized', build_all)
+    for platform_name, method in (('twitter', 'create_twitter_post'), ('linkedin', 'create_linkedin_post'),
+                                  ('note', 'create_note_intro')):
+        def build_one(method=method):
+            for title, content in documents:
+                getattr(generator, method)(content, title)
+        runner.run(f'parse.{label}.{platform_name}', build_one, setup=sgp.clear_document_cache)
+
+
+def bench_local_listing(runner, sgp, dirs, files_per_dir):
+    """大きなローカルフォルダでの get_all_md_files"""
+    root = _WORK_DIR / f'tree_{dirs}x{files_per_dir}'
+    if not root.exists():
+        for d in range(dirs):
+            folder = root / f'category_{d // 10}' / f'folder_{d}'
+            folder.mkdir(parents=True, exist_ok=True)
+            for f in range(files_per_dir):
+                (folder / f'article_{f}.md').write_text(f'# 記事{f}\n本文です。\n', encoding='utf-8')
+                if f % 5 == 0:
+                    (folder / f'image_{f}.png').write_bytes(b'')
+    generator = sgp.SocialMediaPostGenerator(str(root))
+
+    def list_files():
+        return {'files': len(generator.get_all_md_files())}
+
+    runner.run(f'listing.local_{dirs}x{files_per_dir}', list_files)
+
+
+def bench_github(runner, sgp, corpus, latency, rate_limit):
+    """スタブGitHubに対する一覧取得とファイル取得"""
+    with StubGitHubServer(corpus, latency=latency) as github:
+        sgp.GITHUB_API_URL = github.api_url
+        sgp.GITHUB_RAW_URL = github.raw_url
+        counter = {'n': 0}
+
+        def fresh_generator(fresh_seconds=300, use_bundle=False):
+            counter['n'] += 1
+            cache_dir = _WORK_DIR / f'github_{counter["n"]}'
+            return sgp.SocialMediaPostGenerator(
+                file_cache=sgp.FileContentCache(cache_dir=cache_dir),
+                tree_cache=sgp.GitTreeCache(cache_dir=cache_dir, fresh_seconds=fresh_seconds),
+                github_budget=sgp.GitHubRateBudget(),
+                use_bundle=use_bundle
+            )
+
+        def listing_cold():
+            generator = fresh_generator()
+            before = github.request_count
+            files = generator.get_all_md_files()
+            return {'files': len(files), 'requests': github.request_count - before}
+
+        warm = fresh_generator()
+        warm.get_all_md_files()
+
+        def listing_warm():
+            before = github.request_count
+            warm.get_all_md_files()
+            return {'requests': github.request_count - before}
+
+        revalidating = fresh_generator(fresh_seconds=0)
+        revalidating.get_all_md_files()
+
+        def listing_revalidate():
+            before = github.request_count
+            revalidating.get_all_md_files()
+            return {'requests': github.request_count - before}
+
+        bundle_path = _WORK_DIR / 'corpus_bundle.sqlite'
+        sgp.build_corpus_bundle(REPO_ROOT / 'vibe-cording-writing', bundle_path)
+
+        def listing_and_read_bundle():
+            generator = fresh_generator()
+            generator.corpus_bundle = sgp.CorpusBundle(bundle_path)
+            before = github.request_count
+            files = generator.get_all_md_files()
+            for file in files:
+                generator.read_file_content(file['path'], 'github', sha=file['sha'])
+            return {'files': len(files), 'requests': github.request_count - before}
+
+        runner.run('github.listing.cold', listing_cold)
+        runner.run('github.bundle.cold_listing_and_read', listing_and_read_bundle)
+        runner.run('github.listing.warm', listing_warm)
+        runner.run('github.listing.revalidate_head', listing_revalidate)
+
+        md_files = warm.get_all_md_files()
+
+        def fetch_cold_sequential():
+            generator = fresh_generator()
+            for file in md_files:
+                generator.read_file_content(file['path'], 'github')
+            return {'files': len(md_files)}
+
+        def fetch_cold_prefetch():
+            generator = fresh_generator()
+            generator.prefetch_files(md_files, wait_for_completion=True)
+            return {'files': len(md_files)}
+
+        def fetch_warm():
+            for file in md_files:
+                warm.read_file_content(file['path'], 'github', sha=file.get('sha'))
+
+        # プレビューは先頭だけをRangeリクエストで読む（大きいファイルから20件）
+        largest = sorted(md_files, key=lambda file: len(corpus[file['relative_path']]), reverse=True)[:20]
+
+        def preview_cold():
+            generator = fresh_generator()
+            before_requests, before_bytes = github.request_count, github.bytes_sent
+            for file in largest:
+                sgp.LazyDocument(generator, file).preview(501)
+            return {'files': len(largest), 'requests': github.request_count - before_requests,
+                    'bytes': github.bytes_sent - before_bytes,
+                    'full_bytes': sum(len(corpus[file['relative_path']]) for file in largest)}
+
+        runner.run('github.preview.range_read', preview_cold)
+
+        warm.prefetch_files(md_files, wait_for_completion=True)
+        runner.run('github.fetch.cold_sequential', fetch_cold_sequential, repeat=min(runner.repeat, 3))
+        runner.run('github.fetch.cold_prefetch', fetch_cold_prefetch, repeat=min(runner.repeat, 3))
+        runner.run('github.fetch.warm', fetch_warm)
+
+        articles = list(corpus.items())[:100]
+
+        def save_batch(conflicts=0):
+            counter['n'] += 1
+            queue = sgp.GitHubCommitQueue(github.repo, github.branch, _WORK_DIR / f'save_{counter["n"]}.sqlite',
+                                          client=sgp.GitHubClient(sgp.get_http_session(), sgp.GitHubRateBudget()))
+            for i, (path, data) in enumerate(articles):
+                queue.enqueue(f"generated/articles/{counter['n']}_{i}.md", data.decode('utf-8'))
+            github.pending_conflicts = conflicts
+            before = github.request_count
+            result = queue.flush({'Authorization': 'token stub'})
+            return {'files': result['files'], 'requests': github.request_count - before,
+                    'attempts': result['attempts']}
+
+        runner.run('github.save.batch_commit_100', save_batch)
+        runner.run('github.save.batch_commit_100_ref_conflict', lambda: save_batch(conflicts=1))
+
+    with StubGitHubServer(corpus, latency=latency, rate_limit=rate_limit) as github:
+        sgp.GITHUB_API_URL = github.api_url
+        sgp.GITHUB_RAW_URL = github.raw_url
+
+        def listing_rate_limited():
+            generator = fresh_generator()
+            before = github.request_count
+            files = generator.get_all_md_files()
+            return {'files': len(files), 'requests': github.request_count - before}
+
+        runner.run('github.listing.rate_limited', listing_rate_limited)
+
+
+def bench_openrouter(runner, sgp, ttft, tokens_per_sec):
+    """スタブOpenRouterに対する記事生成"""
+    from openai import OpenAI
+
+    with StubOpenRouterServer(time_to_first_token=ttft, tokens_per_sec=tokens_per_sec) as openrouter:
+        sgp.OPENROUTER_BASE_URL = openrouter.api_url
+        ai = sgp.AIArticleGenerator(
+            response_cache=sgp.LLMResponseCache(db_path=_WORK_DIR / 'llm_bench.sqlite'),
+            api_key='bench'
+        )
+        ai.client = OpenAI(base_url=openrouter.api_url, api_key='bench')
+
+        def generate_uncached():
+            ai.generate_article('ベンチマーク', model='stub/model', use_cache=False)
+
+        def generate_cached():
+            ai.generate_article('ベンチマーク', model='stub/model')
+
+        def stream_first_token():
+            started = time.perf_counter()
+            stream = ai.generate_article_stream('ベンチマーク', model='stub/stream', use_cache=False)
+            next(stream)
+            first = time.perf_counter() - started
+            for _ in stream:
+                pass
+            return {'time_to_first_token': first}
+
+        def fan_out():
+            ai.generate_articles_concurrently('ベンチマーク', [f'stub/model-{i}' for i in range(4)], use_cache=False)
+
+        runner.run('openrouter.generate.uncached', generate_uncached, repeat=min(runner.repeat, 5))
+        generate_uncached()
+        runner.run('openrouter.generate.cached', generate_cached)
+        runner.run('openrouter.stream.full', stream_first_token, repeat=min(runner.repeat, 5))
+        runner.run('openrouter.fan_out_4_models', fan_out, repeat=min(runner.repeat, 3))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', '-C', str(REPO_ROOT), 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, log=sys.stderr):
+    """前回結果と比較し、ケースごとの速度比（>1で高速化）を返す"""
+    comparison = {}
+    print(f"\n{'benchmark':<50} {'baseline':>12} {'current':>12} {'speedup':>9}", file=log)
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not current['median']:
+            continue
+        speedup = previous['median'] / current['median']
+        comparison[name] = speedup
+        print(f"{name:<50} {previous['median'] * 1000:10.2f}ms {current['median'] * 1000:10.2f}ms "
+              f"{speedup:8.2f}x", file=log)
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SNS投稿ジェネレーターのベンチマーク")
+    parser.add_argument('--output', default='bench_results.json', help="結果を書き出すJSONファイル")
+    parser.add_argument('--baseline', help="比較対象の過去の結果JSON")
+    parser.add_argument('--fail-on-regression', type=float, metavar='PERCENT',
+                        help="ベースラインよりこの割合以上遅くなったケースがあれば終了コード1")
+    parser.add_argument('--repeat', type=int, default=5, help="各ケースの繰り返し回数")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50], help="合成Markdownのサイズ（MB）")
+    parser.add_argument('--quick', action='store_true', help="合成ファイルを1MBのみ・繰り返し3回で実行")
+    parser.add_argument('--only', nargs='+', help="名前にこの文字列を含むケースだけ実行")
+    parser.add_argument('--latency', type=float, default=0.02, help="スタブGitHubの応答遅延（秒）")
+    parser.add_argument('--rate-limit', type=int, default=1, help="レート制限ケースで許可するAPIリクエスト数")
+    parser.add_argument('--llm-ttft', type=float, default=0.1, help="スタブOpenRouterの初回トークンまでの遅延（秒）")
+    parser.add_argument('--llm-tokens-per-sec', type=float, default=2000, help="スタブOpenRouterの生成速度")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.sizes = [1]
+        args.repeat = min(args.repeat, 3)
+
+    import social_media_post_generator as sgp
+
+    runner = BenchmarkRunner(args.repeat, only=args.only)
+    corpus = load_corpus()
+    documents = [(Path(path).stem, data.decode('utf-8')) for path, data in corpus.items()]
+
+    try:
+        print("📄 解析・投稿作成", file=sys.stderr)
+        bench_parsing(runner, sgp, documents, 'corpus')
+        for size_mb in args.sizes:
+            document = synthetic_markdown(size_mb * 1024 * 1024, seed=size_mb)
+            bench_parsing(runner, sgp, [(f'synthetic_{size_mb}mb', document)], f'synthetic_{size_mb}mb')
+
+        print("📂 ローカル一覧", file=sys.stderr)
+        bench_local_listing(runner, sgp, 50, 40)
+        bench_local_listing(runner, sgp, 200, 50)
+
+        print("🐙 GitHub（スタブ）", file=sys.stderr)
+        bench_github(runner, sgp, corpus, args.latency, args.rate_limit)
+
+        print("🤖 OpenRouter（スタブ）", file=sys.stderr)
+        bench_openrouter(runner, sgp, args.llm_ttft, args.llm_tokens_per_sec)
+    finally:
+        shutil.rmtree(_WORK_DIR, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'stub_latency': args.latency,
+        },
+        'results': runner.results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['comparison'] = compare(runner.results, baseline)
+        if args.fail_on_regression is not None:
+            threshold = 1 / (1 + args.fail_on_regression / 100)
+            regressions = [name for name, speedup in report['comparison'].items() if speedup < threshold]
+            if regressions:
+                print(f"\n❌ {len(regressions)}件のケースが{args.fail_on_regression}%以上遅くなりました: "
+                      f"{', '.join(regressions)}", file=sys.stderr)
+                exit_code = 1
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 結果を書き出しました: {args.output}", file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
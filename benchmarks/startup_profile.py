@@ -0,0 +1,121 @@
+"""起動時間（コールドスタート）の内訳を計測
+
+使い方:
+    python benchmarks/startup_profile.py                     # 読み込み・初期化の内訳を表示
+    python benchmarks/startup_profile.py --budget-ms 800     # 起動時間が予算を超えたら終了コード1
+
+毎回新しいPythonプロセスで ``social_media_post_generator`` を読み込み、``-X importtime`` で
+直接読み込んでいるパッケージごとの時間と、ジェネレーターなどの初期化時間を測る。
+AIタブや関連記事検索を使うまで読み込まない openai / numpy は「遅延」として別に表示する。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# 子プロセスで実行する計測コード（結果はJSONで標準出力に書き出す）
+CHILD_CODE = r'''
+import json, sys, time
+started = time.perf_counter()
+import social_media_post_generator as sgp
+timings = {'import.app': time.perf_counter() - started}
+preloaded = {name: name in sys.modules for name in ('openai', 'numpy')}
+
+def measure(name, fn):
+    started = time.perf_counter()
+    fn()
+    timings[name] = time.perf_counter() - started
+
+measure('init.corpus_bundle', sgp.get_corpus_bundle)
+measure('init.post_generator', sgp.SocialMediaPostGenerator)
+measure('init.ai_generator', lambda: sgp.AIArticleGenerator(api_key='startup-profile'))
+measure('deferred.openai', sgp.load_openai)
+measure('deferred.numpy', lambda: __import__('numpy'))
+print(json.dumps({'timings': timings, 'preloaded': preloaded}))
+'''
+
+APP_MODULE = 'social_media_post_generator'
+
+
+def parse_importtime(stderr):
+    """``-X importtime`` の出力から、アプリが直接読み込んだパッケージごとの累積時間（秒）を取り出す"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1e6))
+
+    for index, (depth, name, _) in enumerate(entries):
+        if depth == 0 and name == APP_MODULE:
+            break
+    else:
+        return {}
+    components = {}
+    # 子の行は親より先に出力されるので、アプリの行から遡って1段下の行を集める
+    for depth, name, seconds in reversed(entries[:index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            components[f'import.{name}'] = seconds
+    return components
+
+
+def profile_once(python=sys.executable):
+    """新しいプロセスで1回計測"""
+    env = dict(os.environ, STREAMLIT_LOGGER_LEVEL='error')
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', CHILD_CODE],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['components'] = parse_importtime(result.stderr)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="起動時間の内訳を計測")
+    parser.add_argument('--runs', type=int, default=5, help="計測回数（中央値を表示）")
+    parser.add_argument('--top', type=int, default=10, help="表示するパッケージ数")
+    parser.add_argument('--budget-ms', type=float, help="起動時間（読み込み＋初期化）の予算（ミリ秒）")
+    parser.add_argument('--output', help="結果を書き出すJSONファイル")
+    args = parser.parse_args(argv)
+
+    runs = [profile_once() for _ in range(args.runs)]
+    timings = {name: statistics.median(run['timings'][name] for run in runs) for name in runs[0]['timings']}
+    components = {}
+    for run in runs:
+        for name, seconds in run['components'].items():
+            components.setdefault(name, []).append(seconds)
+    components = {name: statistics.median(values) for name, values in components.items()}
+    startup = sum(seconds for name, seconds in timings.items() if not name.startswith('deferred.'))
+
+    print(f"🚀 起動時間（{args.runs}回の中央値）: {startup * 1000:.1f} ms", file=sys.stderr)
+    for name, seconds in timings.items():
+        print(f"  {name:<40} {seconds * 1000:10.1f} ms", file=sys.stderr)
+    print(f"\n📦 アプリが読み込むパッケージ（上位{args.top}件）", file=sys.stderr)
+    for name, seconds in sorted(components.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {name:<40} {seconds * 1000:10.1f} ms", file=sys.stderr)
+    preloaded = [name for name, loaded in runs[0]['preloaded'].items() if loaded]
+    if preloaded:
+        print(f"\n⚠️  遅延させるはずのパッケージが起動時に読み込まれています: {', '.join(preloaded)}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'startup': startup, 'timings': timings, 'components': components,
+                       'preloaded': preloaded}, f, ensure_ascii=False, indent=2)
+
+    if args.budget_ms is not None and startup * 1000 > args.budget_ms:
+        print(f"\n❌ 起動時間が予算（{args.budget_ms:.0f} ms）を超えています", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
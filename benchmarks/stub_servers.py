@@ -0,0 +1,406 @@
+"""ベンチマーク用のローカルスタブサーバー（GitHub API / raw / OpenRouter）
+
+どちらのサーバーも ``with`` で起動し、``base_url`` を環境変数
+``SNS_GITHUB_API_URL`` / ``SNS_GITHUB_RAW_URL`` / ``SNS_OPENROUTER_BASE_URL`` に渡して使う。
+遅延とレート制限は引数で調整できる。
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+
+def _git_blob_sha(data):
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+class _RateLimiter:
+    """固定ウィンドウのレート制限（GitHubのX-RateLimit-*ヘッダーを模倣）"""
+
+    def __init__(self, limit, window_seconds):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._used = 0
+
+    def take(self):
+        """1リクエスト分を消費し (許可されたか, 残り, リセット時刻) を返す"""
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= self.window_seconds:
+                self._window_start, self._used = now, 0
+            reset_at = int(self._window_start + self.window_seconds)
+            if self.limit is not None and self._used >= self.limit:
+                return False, 0, reset_at
+            self._used += 1
+            remaining = self.limit - self._used if self.limit is not None else 5000
+            return True, remaining, reset_at
+
+
+class _StubServer:
+    """スレッドで動かすHTTPサーバーの共通部分"""
+
+    handler_class = None
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = ThreadingHTTPServer((host, port), self.handler_class)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+        self.request_count = 0
+        self.bytes_sent = 0  # 応答本文の合計バイト数
+        self._count_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._count_lock:
+            self.request_count += 1
+
+    def count_bytes(self, size):
+        with self._count_lock:
+            self.bytes_sent += size
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _GitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024  # ヘッダーと本文をまとめて送る（応答ごとに自動でflushされる）
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.server.stub.count_bytes(len(body))
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # クライアントが途中で読むのをやめた場合
+
+    def _send_json(self, status, data, headers=None):
+        headers = dict(headers or {})
+        headers['Content-Type'] = 'application/json'
+        self._send(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), headers)
+
+    def _api_prelude(self):
+        """APIリクエストの遅延とレート制限を処理（制限中ならFalse）"""
+        stub = self.server.stub
+        stub.count_request()
+        time.sleep(stub.latency)
+        allowed, remaining, reset_at = stub.rate_limiter.take()
+        self._rate_headers = {
+            'X-RateLimit-Limit': str(stub.rate_limiter.limit or 5000),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(reset_at),
+        }
+        if not allowed:
+            self._send_json(403, {'message': 'API rate limit exceeded'}, self._rate_headers)
+            return False
+        return True
+
+    def do_GET(self):
+        stub = self.server.stub
+        path = unquote(urlparse(self.path).path)
+
+        if path.startswith('/raw/'):
+            stub.count_request()
+            time.sleep(stub.latency)
+            # /raw/{owner}/{repo}/{branch}/{path}
+            parts = path[len('/raw/'):].split('/', 3)
+            data = stub.files.get(parts[3]) if len(parts) == 4 else None
+            if data is None:
+                return self._send(404)
+            etag = f'"{_git_blob_sha(data)}"'
+            if self.headers.get('If-None-Match') == etag:
+                return self._send(304, headers={'ETag': etag})
+            range_header = self.headers.get('Range', '')
+            if range_header.startswith('bytes='):
+                start, _, end = range_header[len('bytes='):].partition('-')
+                start = int(start or 0)
+                end = min(int(end) if end else len(data) - 1, len(data) - 1)
+                return self._send(206, data[start:end + 1], {
+                    'ETag': etag,
+                    'Content-Range': f'bytes {start}-{end}/{len(data)}'
+                })
+            return self._send(200, data, {'ETag': etag})
+
+        if not self._api_prelude():
+            return
+
+        repo_prefix = f'/repos/{stub.repo}'
+        if not path.startswith(repo_prefix):
+            return self._send_json(404, {'message': 'Not Found'}, self._rate_headers)
+        rest = path[len(repo_prefix):]
+
+        if rest.startswith('/branches/'):
+            etag = f'"{stub.commit_sha}"'
+            if self.headers.get('If-None-Match') == etag:
+                return self._send(304, headers=dict(self._rate_headers, ETag=etag))
+            body = {'name': stub.branch, 'commit': {'sha': stub.commit_sha,
+                                                     'commit': {'tree': {'sha': stub.tree_sha}}}}
+            return self._send_json(200, body, dict(self._rate_headers, ETag=etag))
+
+        if rest.startswith('/git/trees/'):
+            tree = [{'path': p, 'mode': '100644', 'type': 'blob', 'sha': _git_blob_sha(d), 'size': len(d)}
+                    for p, d in sorted(stub.files.items())]
+            return self._send_json(200, {'sha': stub.tree_sha, 'tree': tree, 'truncated': False}, self._rate_headers)
+
+        if rest.startswith('/contents'):
+            folder = rest[len('/contents'):].strip('/')
+            prefix = f'{folder}/' if folder else ''
+            entries = {}
+            for file_path, data in stub.files.items():
+                if not file_path.startswith(prefix):
+                    continue
+                name, _, remainder = file_path[len(prefix):].partition('/')
+                entry_path = prefix + name
+                if remainder:
+                    entries[entry_path] = {'name': name, 'path': entry_path, 'type': 'dir'}
+                else:
+                    entries[entry_path] = {
+                        'name': name,
+                        'path': entry_path,
+                        'type': 'file',
+                        'sha': _git_blob_sha(data),
+                        'download_url': f"{stub.base_url}/raw/{stub.repo}/{stub.branch}/{entry_path}"
+                    }
+            return self._send_json(200, list(entries.values()), self._rate_headers)
+
+        return self._send_json(404, {'message': 'Not Found'}, self._rate_headers)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_POST(self):
+        """Git Data APIのblob・ツリー・コミットの作成"""
+        stub = self.server.stub
+        path = unquote(urlparse(self.path).path)
+        body = self._read_json()
+        if not self._api_prelude():
+            return
+        rest = path[len(f'/repos/{stub.repo}'):] if path.startswith(f'/repos/{stub.repo}/') else ''
+
+        if rest == '/git/blobs':
+            data = body['content'].encode('utf-8')
+            sha = _git_blob_sha(data)
+            with stub.lock:
+                stub.blobs[sha] = data
+            return self._send_json(201, {'sha': sha}, self._rate_headers)
+
+        if rest == '/git/trees':
+            with stub.lock:
+                if body.get('base_tree') not in stub.trees:
+                    return self._send_json(422, {'message': 'base_tree not found'}, self._rate_headers)
+                files = dict(stub.trees[body['base_tree']])
+                for entry in body.get('tree', []):
+                    if 'content' in entry:
+                        files[entry['path']] = entry['content'].encode('utf-8')
+                    elif entry.get('sha') in stub.blobs:
+                        files[entry['path']] = stub.blobs[entry['sha']]
+                    else:
+                        return self._send_json(422, {'message': 'blob not found'}, self._rate_headers)
+                sha = hashlib.sha1(repr(sorted(files.items())).encode('utf-8')).hexdigest()
+                stub.trees[sha] = files
+            return self._send_json(201, {'sha': sha}, self._rate_headers)
+
+        if rest == '/git/commits':
+            with stub.lock:
+                if body.get('tree') not in stub.trees:
+                    return self._send_json(422, {'message': 'tree not found'}, self._rate_headers)
+                sha = hashlib.sha1(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+                stub.commits[sha] = {'tree': body['tree'], 'parents': body.get('parents', []),
+                                     'message': body.get('message', '')}
+            return self._send_json(201, {'sha': sha, 'tree': {'sha': body['tree']}}, self._rate_headers)
+
+        return self._send_json(404, {'message': 'Not Found'}, self._rate_headers)
+
+    def do_PATCH(self):
+        """ブランチの更新（fast-forwardでなければ422）"""
+        stub = self.server.stub
+        path = unquote(urlparse(self.path).path)
+        body = self._read_json()
+        if not self._api_prelude():
+            return
+        if path != f'/repos/{stub.repo}/git/refs/heads/{stub.branch}':
+            return self._send_json(404, {'message': 'Not Found'}, self._rate_headers)
+        with stub.lock:
+            if stub.pending_conflicts:
+                # 別の書き込みが先にブランチを進めた状況を再現する
+                stub.pending_conflicts -= 1
+                stub.advance_branch({f'conflict/{len(stub.commits)}.md': b'concurrent change'})
+            commit = stub.commits.get(body.get('sha'))
+            if commit is None:
+                return self._send_json(422, {'message': 'Object does not exist'}, self._rate_headers)
+            if not body.get('force') and stub.commit_sha not in commit['parents']:
+                return self._send_json(422, {'message': 'Update is not a fast forward'}, self._rate_headers)
+            stub.commit_sha, stub.tree_sha = body['sha'], commit['tree']
+            stub.files = stub.trees[commit['tree']]
+        return self._send_json(200, {'ref': f'refs/heads/{stub.branch}', 'object': {'sha': body['sha']}},
+                               self._rate_headers)
+
+
+class StubGitHubServer(_StubServer):
+    """GitHubのContents / Trees / Git Data APIとraw配信を模倣するサーバー
+
+    raw配信は ``{base_url}/raw/{owner}/{repo}/{branch}/{path}`` で提供する。
+    ``pending_conflicts`` を設定すると、その回数だけブランチ更新の直前に別のコミットでブランチを進める。
+    """
+
+    handler_class = _GitHubHandler
+
+    def __init__(self, files, repo='HAL86AI/sns-post-generator', branch='main', latency=0.0,
+                 rate_limit=None, rate_window=3600, **kwargs):
+        super().__init__(**kwargs)
+        self.files = dict(files)  # リポジトリ内パス -> bytes
+        self.repo = repo
+        self.branch = branch
+        self.latency = latency
+        self.rate_limiter = _RateLimiter(rate_limit, rate_window)
+        self.tree_sha = hashlib.sha1(repr(sorted(self.files)).encode('utf-8')).hexdigest()
+        self.commit_sha = hashlib.sha1(self.tree_sha.encode('utf-8')).hexdigest()
+        self.lock = threading.Lock()
+        self.blobs = {}
+        self.trees = {self.tree_sha: self.files}
+        self.commits = {self.commit_sha: {'tree': self.tree_sha, 'parents': [], 'message': 'initial'}}
+        self.pending_conflicts = 0
+
+    def advance_branch(self, changes):
+        """ファイルを追加したコミットでブランチを進める（呼び出し側でlockを取る）"""
+        files = dict(self.files, **changes)
+        tree_sha = hashlib.sha1(repr(sorted(files.items())).encode('utf-8')).hexdigest()
+        commit_sha = hashlib.sha1(f'{self.commit_sha}:{tree_sha}'.encode('utf-8')).hexdigest()
+        self.trees[tree_sha] = files
+        self.commits[commit_sha] = {'tree': tree_sha, 'parents': [self.commit_sha], 'message': 'concurrent'}
+        self.files, self.tree_sha, self.commit_sha = files, tree_sha, commit_sha
+
+    @property
+    def api_url(self):
+        return self.base_url
+
+    @property
+    def raw_url(self):
+        return f"{self.base_url}/raw"
+
+
+class _OpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _write_chunk(self, data):
+        self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        self.wfile.flush()
+
+    def do_POST(self):
+        stub = self.server.stub
+        stub.count_request()
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        model = body.get('model', 'stub-model')
+
+        allowed, _, reset_at = stub.rate_limiter.take()
+        if not allowed:
+            data = json.dumps({'error': {'message': 'Rate limit exceeded', 'code': 429}}).encode('utf-8')
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Retry-After', str(max(1, reset_at - int(time.time()))))
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        tokens = [stub.token_text] * stub.completion_tokens
+        usage = {
+            'prompt_tokens': len(str(body.get('messages', ''))) // 4,
+            'completion_tokens': stub.completion_tokens,
+            'total_tokens': len(str(body.get('messages', ''))) // 4 + stub.completion_tokens,
+        }
+        time.sleep(stub.time_to_first_token)
+
+        if body.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            interval = 1.0 / stub.tokens_per_sec if stub.tokens_per_sec else 0.0
+            try:
+                for token in tokens:
+                    chunk = {'id': 'stub', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                             'model': model,
+                             'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]}
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    if interval:
+                        time.sleep(interval)
+                final = {'id': 'stub', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                         'model': model, 'choices': [], 'usage': usage}
+                self._write_chunk(f"data: {json.dumps(final)}\n\n".encode('utf-8'))
+                self._write_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # クライアント側のキャンセル
+            return
+
+        if stub.tokens_per_sec:
+            time.sleep(stub.completion_tokens / stub.tokens_per_sec)
+        data = json.dumps({
+            'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                         'finish_reason': 'stop'}],
+            'usage': usage,
+        }, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubOpenRouterServer(_StubServer):
+    """OpenRouter（OpenAI互換）のchat completionsを模倣するサーバー
+
+    ``base_url`` に ``/v1`` を付けたものをクライアントのbase_urlに指定する。
+    """
+
+    handler_class = _OpenRouterHandler
+
+    def __init__(self, time_to_first_token=0.05, tokens_per_sec=2000, completion_tokens=200,
+                 token_text='テスト', rate_limit=None, rate_window=60, **kwargs):
+        super().__init__(**kwargs)
+        self.time_to_first_token = time_to_first_token
+        self.tokens_per_sec = tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.token_text = token_text
+        self.rate_limiter = _RateLimiter(rate_limit, rate_window)
+
+    @property
+    def api_url(self):
+        return f"{self.base_url}/v1"
@@ -0,0 +1,37 @@
+"""Writingフォルダをアプリ同梱用のコーパスバンドル（SQLite）にまとめる
+
+使い方:
+    python build_corpus_bundle.py                                   # ./vibe-cording-writing → ./corpus_bundle.sqlite
+    python build_corpus_bundle.py --folder ./vibe-cording-writing --output corpus_bundle.sqlite
+
+バンドルには一覧（パス・タイトル・カテゴリ・blob SHA）、圧縮した本文、解析結果が入る。
+アプリはGitHubモードでもこのバンドルから一覧と本文を読むため、起動時に通信しない。
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from social_media_post_generator import APP_DIR, CORPUS_BUNDLE_PATH, build_corpus_bundle
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Writingフォルダからコーパスバンドルを作成")
+    parser.add_argument('--folder', default=str(APP_DIR / 'vibe-cording-writing'), help="Writingフォルダ")
+    parser.add_argument('--output', default=str(CORPUS_BUNDLE_PATH), help="出力するSQLiteファイル")
+    args = parser.parse_args(argv)
+
+    if not Path(args.folder).is_dir():
+        print(f"❌ フォルダが見つかりません: {args.folder}", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    count = build_corpus_bundle(args.folder, args.output)
+    size_kb = Path(args.output).stat().st_size / 1024
+    print(f"✅ {count}ファイルを{time.perf_counter() - started:.2f}秒でまとめました "
+          f"({size_kb:.0f}KB) → {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,309 +1,3530 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 import streamlit as st
 import re
 from pathlib import Path
+from stat import S_ISDIR
+import codecs
 import hashlib
 import json
+import math
+import unicodedata
+import zlib
 import requests
+import asyncio
+import atexit
+import random
+import importlib.util
+import sqlite3
+import sys
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 from io import StringIO
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+
 try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
-class SocialMediaPostGenerator:
-    def __init__(self, writing_folder_path=None):
-        self.writing_folder = Path(writing_folder_path) if writing_folder_path else None
-        self.github_repo = "HAL86AI/sns-post-generator"  # GitHubリポジトリ
-        self.github_branch = "main"
-        self.base_github_url = f"https://api.github.com/repos/{self.github_repo}/contents"
-        self.platform_configs = {
-            'Twitter': {
-                'max_chars': 280,
-                'hashtag_limit': 3,
-                'tone': 'カジュアル、親しみやすい',
-                'format': 'ツイート形式'
-            },
-            'LinkedIn': {
-                'max_chars': 1300,
-                'hashtag_limit': 5,
-                'tone': 'プロフェッショナル、丁寧',
-                'format': 'ビジネス記事形式'
-            },
-            'note': {
-                'max_chars': 200,
-                'hashtag_limit': 5,
-                'tone': '読みやすく、親しみやすい',
-                'format': 'ブログ導入文'
+# openai（約0.5秒）とnumpyは読み込みが重いため、AI機能・関連記事検索を使うときに初めて読み込む
+OPENAI_AVAILABLE = importlib.util.find_spec('openai') is not None
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+# ファイルキャッシュの保存先（環境変数で上書き可能）
+DEFAULT_CACHE_DIR = Path(os.environ.get('SNS_CACHE_DIR', Path.home() / '.cache' / 'sns-post-generator'))
+
+# GitHubの接続先（ローカルのスタブサーバーなどに差し替え可能）
+GITHUB_API_URL = os.environ.get('SNS_GITHUB_API_URL', 'https://api.github.com').rstrip('/')
+GITHUB_RAW_URL = os.environ.get('SNS_GITHUB_RAW_URL', 'https://raw.githubusercontent.com').rstrip('/')
+
+
+# 処理段階ごとの計測（SNS_TRACE=1で有効。全セッションで共有するため画面からは切り替えない）
+TRACE_FILE = Path(os.environ.get('SNS_TRACE_FILE', DEFAULT_CACHE_DIR / 'trace.jsonl'))
+TRACE_HISTORY = 200  # 段階ごとに保持する直近の計測数
+
+
+class _NullSpan:
+    """計測が無効なときに返す何もしないスパン"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """1つの処理段階の所要時間を測るスパン（``set`` でトークン数などを添付できる）"""
+
+    __slots__ = ('tracer', 'stage', 'attrs', 'started')
+
+    def __init__(self, tracer, stage, attrs):
+        self.tracer = tracer
+        self.stage = stage
+        self.attrs = attrs
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.record(self.stage, time.perf_counter() - self.started, **self.attrs)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """処理段階ごとの所要時間・LLMのトークン数を記録する軽量な計測器
+
+    無効なときの ``span()`` は共有の何もしないスパンを返すだけなので、計測のコストはほぼかからない。
+    有効なときは1スパン1行のJSONLに追記し、段階ごとの直近の値をメモリに残して集計に使う。
+    """
+
+    def __init__(self, trace_path=None, enabled=False, history=TRACE_HISTORY):
+        self.trace_path = Path(trace_path) if trace_path else TRACE_FILE
+        self.enabled = enabled
+        self.history = history
+        self._lock = threading.Lock()
+        self._samples = {}  # stage -> deque[{'seconds', ...}]
+        self._file = None
+        self._local = threading.local()
+        self._run_counter = 0
+
+    def span(self, stage, **attrs):
+        """処理段階を測るコンテキストマネージャー"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage, attrs)
+
+    def begin_run(self):
+        """Streamlitの再実行ごとに呼び、このスレッドのスパンに再実行番号を付ける"""
+        with self._lock:
+            self._run_counter += 1
+            self._local.run = self._run_counter
+
+    def record(self, stage, seconds, **attrs):
+        """計測結果を1件記録してトレースファイルに追記"""
+        if not self.enabled:
+            return
+        entry = {'ts': time.time(), 'stage': stage, 'seconds': seconds,
+                 'run': getattr(self._local, 'run', None), **attrs}
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.history)
+            samples.append(entry)
+            try:
+                if self._file is None:
+                    self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+                    self._file = open(self.trace_path, 'a', encoding='utf-8')
+                self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+                self._file.flush()
+            except OSError:
+                pass  # トレースの書き込み失敗は致命的ではない
+
+    @staticmethod
+    def _percentile(sorted_values, ratio):
+        """最近傍順位法のパーセンタイル"""
+        index = max(0, math.ceil(ratio * len(sorted_values)) - 1)
+        return sorted_values[index]
+
+    def stage_stats(self):
+        """段階ごとの件数・p50・p95（秒）とトークン数の合計"""
+        with self._lock:
+            snapshot = {stage: list(samples) for stage, samples in self._samples.items()}
+        stats = {}
+        for stage, samples in sorted(snapshot.items()):
+            seconds = sorted(s['seconds'] for s in samples)
+            stats[stage] = {
+                'count': len(samples),
+                'p50': self._percentile(seconds, 0.5),
+                'p95': self._percentile(seconds, 0.95),
+                'prompt_tokens': sum(s.get('prompt_tokens') or 0 for s in samples),
+                'completion_tokens': sum(s.get('completion_tokens') or 0 for s in samples),
+                'cost': sum(s.get('cost') or 0 for s in samples),
             }
-        }
+        return stats
 
-    def get_github_files(self, path=""):
-        """GitHubからファイル一覧を取得"""
+    def clear(self):
+        """メモリ上の計測結果を破棄（トレースファイルは残す）"""
+        with self._lock:
+            self._samples.clear()
+
+
+_tracer = Tracer(enabled=os.environ.get('SNS_TRACE') == '1')
+_tracer.record('import.modules', _IMPORT_SECONDS)
+
+
+def get_tracer():
+    """プロセス内で共有する計測器を取得"""
+    return _tracer
+
+
+def load_openai():
+    """openaiパッケージを読み込む（初回の読み込み時間は ``import.openai`` として計測）"""
+    if 'openai' in sys.modules:
+        return sys.modules['openai']
+    with get_tracer().span('import.openai'):
+        import openai
+    return openai
+
+
+def usage_attrs(usage):
+    """completion応答のusageからトークン数と費用（OpenRouterが返す場合）を取り出す"""
+    if usage is None:
+        return {}
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+        'completion_tokens': getattr(usage, 'completion_tokens', None),
+        'cost': getattr(usage, 'cost', None),
+    }
+
+
+def get_secret(name):
+    """Streamlit Secretsから値を取得（secrets.tomlがない場合はNone）"""
+    try:
+        if hasattr(st, 'secrets') and name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        pass
+    return None
+
+
+def git_blob_sha(data):
+    """GitのblobSHA（コンテンツハッシュ）を計算"""
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+@contextmanager
+def locked_file(lock_path):
+    """プロセス間の排他ロック（同じキャッシュを使うアプリとバッチのワーカーの書き込みを直列化）"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
         try:
-            url = f"{self.base_github_url}/{path}"
-            
-            # GitHub認証ヘッダー（オプション）
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write_bytes(path, data):
+    """一時ファイル経由でアトミックに書き込み（一時ファイル名は書き込みごとに一意）"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+BLOB_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+CACHE_INDEX_SAVE_INTERVAL = 5.0  # インデックスを書き出す最短間隔（秒）
+CACHE_TMP_MAX_AGE = 3600         # これより古い書きかけの一時ファイルは削除
+
+
+class FileContentCache:
+    """コンテンツハッシュで本文を保存するディスクキャッシュ（LRU・サイズ上限付き）
+
+    本文は ``blobs/<sha>`` に保存し、URLごとのETag/Last-Modifiedは ``index.json`` で管理する。
+    ``fresh_seconds`` 以内に検証済みのURLはネットワークに出ずにメモリから返す。
+    インデックスは ``save_interval`` 秒ごとにまとめて書き出し、その際ファイルロックの下で
+    他のプロセスが書いた内容と合わせる。インデックスに載っていないblobは読み込み時に取り込む。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=200 * 1024 * 1024, fresh_seconds=300,
+                 memory_max_chars=32 * 1024 * 1024, save_interval=CACHE_INDEX_SAVE_INTERVAL):
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.blob_dir = self.cache_dir / 'blobs'
+        self.index_path = self.cache_dir / 'index.json'
+        self.lock_path = self.cache_dir / 'index.lock'
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.memory_max_chars = memory_max_chars
+        self.save_interval = save_interval
+        self._lock = threading.RLock()
+        self._memory = OrderedDict()  # sha -> 本文（デコード済み）
+        self._memory_chars = 0
+        self._urls = {}   # url -> {'sha', 'etag', 'last_modified', 'validated_at'}
+        self._blobs = {}  # sha -> {'size', 'last_access'}
+        self._dirty = False
+        self._saved_at = 0.0
+        self._load_index()
+
+    def _read_index(self):
+        """ディスク上のインデックスを読み込み（壊れていれば空）"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            return index.get('urls', {}), index.get('blobs', {})
+        except (OSError, ValueError):
+            return {}, {}
+
+    def _load_index(self):
+        """インデックスを読み込み、インデックスに載っていないblobを取り込む"""
+        self._urls, self._blobs = self._read_index()
+        if self._adopt_orphans():
+            self._evict()
+            self._dirty = True
+            self.flush()
+        self._saved_at = time.monotonic()
+
+    def _adopt_orphans(self):
+        """blobフォルダにあるのにインデックスにないファイルをサイズ計算に含める"""
+        adopted = False
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.blob_dir))
+        except OSError:
+            return False
+        for entry in entries:
+            try:
+                if BLOB_SHA_PATTERN.match(entry.name):
+                    if entry.name not in self._blobs:
+                        stat = entry.stat()
+                        self._blobs[entry.name] = {'size': stat.st_size, 'last_access': stat.st_mtime}
+                        adopted = True
+                elif entry.name.endswith('.tmp') and now - entry.stat().st_mtime > CACHE_TMP_MAX_AGE:
+                    os.unlink(entry.path)  # 書き込み途中で終了したプロセスの一時ファイル
+            except OSError:
+                continue
+        return adopted
+
+    def _merge_index(self, urls, blobs):
+        """他のプロセスが書いたインデックスを取り込む
+
+        片方にしかないblobは、ファイルが残っていれば追加されたもの、なければ削除されたものとみなす。
+        """
+        merged = {}
+        for sha in self._blobs.keys() | blobs.keys():
+            mine, theirs = self._blobs.get(sha), blobs.get(sha)
+            if mine and theirs:
+                merged[sha] = dict(mine, last_access=max(mine['last_access'], theirs['last_access']))
+            elif (self.blob_dir / sha).exists():
+                merged[sha] = mine or theirs
+            else:
+                text = self._memory.pop(sha, None)
+                if text is not None:
+                    self._memory_chars -= len(text)
+        self._blobs = merged
+        for url, entry in urls.items():
+            current = self._urls.get(url)
+            if current is None or entry.get('validated_at', 0) > current.get('validated_at', 0):
+                self._urls[url] = entry
+
+    def _save_index(self, force=False):
+        """変更があれば、前回の書き出しから ``save_interval`` 秒以上たっている場合にインデックスを書き出す"""
+        if self._dirty and (force or time.monotonic() - self._saved_at >= self.save_interval):
+            self.flush()
+
+    def flush(self):
+        """ファイルロックの下でディスク上のインデックスと合わせてアトミックに書き出し"""
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                with locked_file(self.lock_path):
+                    self._merge_index(*self._read_index())
+                    self._evict()
+                    data = json.dumps({'urls': self._urls, 'blobs': self._blobs}, ensure_ascii=False)
+                    atomic_write_bytes(self.index_path, data.encode('utf-8'))
+                self._dirty = False
+            except OSError:
+                pass  # キャッシュの書き込み失敗は致命的ではない
+            self._saved_at = time.monotonic()
+
+    def _remember(self, sha, text):
+        """メモリ上のLRUに本文を載せる"""
+        if sha in self._memory:
+            self._memory.move_to_end(sha)
+            return
+        self._memory[sha] = text
+        self._memory_chars += len(text)
+        while self._memory_chars > self.memory_max_chars and len(self._memory) > 1:
+            _, old_text = self._memory.popitem(last=False)
+            self._memory_chars -= len(old_text)
+
+    def get_blob(self, sha):
+        """コンテンツハッシュから本文を取得（なければNone）"""
+        with self._lock:
+            text = self._memory.get(sha)
+            if text is not None:
+                self._memory.move_to_end(sha)
+                self._blobs.get(sha, {})['last_access'] = time.time()
+                return text
+            if sha not in self._blobs:
+                return None
+            try:
+                text = (self.blob_dir / sha).read_bytes().decode('utf-8', errors='replace')
+            except OSError:
+                self._blobs.pop(sha, None)
+                return None
+            self._blobs[sha]['last_access'] = time.time()
+            self._remember(sha, text)
+            return text
+
+    def get_fresh(self, url):
+        """検証期限内のURLなら本文を返す（再検証不要）"""
+        with self._lock:
+            entry = self._urls.get(url)
+            if not entry or time.time() - entry.get('validated_at', 0) > self.fresh_seconds:
+                return None
+            return self.get_blob(entry['sha'])
+
+    def get_stale(self, url):
+        """期限切れでもキャッシュ済みの本文を返す（通信エラー時のフォールバック）"""
+        with self._lock:
+            entry = self._urls.get(url)
+            return self.get_blob(entry['sha']) if entry else None
+
+    def conditional_headers(self, url):
+        """条件付きGET用のヘッダーを作成"""
+        with self._lock:
+            entry = self._urls.get(url)
+            if not entry or entry['sha'] not in self._blobs:
+                return {}
             headers = {}
-            if hasattr(st, 'secrets') and 'GITHUB_TOKEN' in st.secrets:
-                headers['Authorization'] = f"token {st.secrets['GITHUB_TOKEN']}"
-            elif 'github_token' in st.session_state:
-                headers['Authorization'] = f"token {st.session_state['github_token']}"
-            
-            response = requests.get(url, headers=headers)
-            
-            if response.status_code == 200:
-                files = response.json()
-                return files
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+    def revalidated(self, url):
+        """304応答を受けたURLの検証時刻を更新して本文を返す"""
+        with self._lock:
+            entry = self._urls.get(url)
+            if not entry:
+                return None
+            text = self.get_blob(entry['sha'])
+            if text is not None:
+                entry['validated_at'] = time.time()
+                self._dirty = True
+                self._save_index()
+            return text
+
+    def store(self, url, data, etag=None, last_modified=None):
+        """取得した本文を保存してデコード済みテキストを返す"""
+        sha = git_blob_sha(data)
+        text = data.decode('utf-8', errors='replace')
+        with self._lock:
+            if sha not in self._blobs:
+                try:
+                    self.blob_dir.mkdir(parents=True, exist_ok=True)
+                    atomic_write_bytes(self.blob_dir / sha, data)
+                    self._blobs[sha] = {'size': len(data), 'last_access': time.time()}
+                except OSError:
+                    pass
             else:
-                if response.status_code == 403:
-                    st.warning("💡 GitHub APIレート制限に達しています。GitHubトークンを設定すると制限が緩和されます。")
-                else:
-                    st.error(f"GitHub APIエラー: {response.status_code}")
-            return []
-        except Exception as e:
-            st.error(f"GitHub API エラー: {str(e)}")
-            return []
+                self._blobs[sha]['last_access'] = time.time()
+            if url:
+                self._urls[url] = {
+                    'sha': sha,
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'validated_at': time.time()
+                }
+            self._remember(sha, text)
+            self._evict()
+            self._dirty = True
+            self._save_index()
+        return text
 
-    def get_static_md_files(self):
-        """静的なファイルリスト（レート制限回避）"""
-        return [
-            {
-                'title': 'haruka', 
-                'path': f'https://raw.githubusercontent.com/{self.github_repo}/main/vibe-cording-writing/haruka.md', 
-                'relative_path': 'vibe-cording-writing/haruka.md',
-                'category': 'メイン', 
-                'source': 'github'
-            },
-            {
-                'title': 'note0630', 
-                'path': f'https://raw.githubusercontent.com/{self.github_repo}/main/vibe-cording-writing/note0630.md', 
-                'relative_path': 'vibe-cording-writing/note0630.md',
-                'category': 'メイン', 
-                'source': 'github'
-            },
-            {
-                'title': '001_最初のアイデア', 
-                'path': f'https://raw.githubusercontent.com/{self.github_repo}/main/vibe-cording-writing/私の仕事のまんなかシリーズ/001_最初のアイデア.md', 
-                'relative_path': 'vibe-cording-writing/私の仕事のまんなかシリーズ/001_最初のアイデア.md',
-                'category': '仕事のまんなか', 
-                'source': 'github'
-            },
-            {
-                'title': 'Gemini vs ChatGPT｜SNS運用・記事作成に最', 
-                'path': f'https://raw.githubusercontent.com/{self.github_repo}/main/vibe-cording-writing/note/konomi_md_files/01_Gemini%20vs%20ChatGPT｜SNS運用・記事作成に最.md', 
-                'relative_path': 'vibe-cording-writing/note/konomi_md_files/01_Gemini vs ChatGPT｜SNS運用・記事作成に最.md',
-                'category': 'konomi記事', 
-                'source': 'github'
-            },
-            {
-                'title': 'SNS×AIで"ゼロから収益化"までの完全ロードマ', 
-                'path': f'https://raw.githubusercontent.com/{self.github_repo}/main/vibe-cording-writing/note/konomi_md_files/02_【保存版】SNS×AIで"ゼロから収益化"までの完全ロードマ.md', 
-                'relative_path': 'vibe-cording-writing/note/konomi_md_files/02_【保存版】SNS×AIで"ゼロから収益化"までの完全ロードマ.md',
-                'category': 'konomi記事', 
-                'source': 'github'
-            },
-            {
-                'title': 'AI活用で業務効率化', 
-                'path': f'https://raw.githubusercontent.com/{self.github_repo}/main/vibe-cording-writing/note/company_up/2025年最新_AI活用で実現する業務効率化の成功事例と実践ポイント.md', 
-                'relative_path': 'vibe-cording-writing/note/company_up/2025年最新_AI活用で実現する業務効率化の成功事例と実践ポイント.md',
-                'category': '企業向け', 
-                'source': 'github'
-            },
-        ]
-    
-    def get_all_md_files(self):
-        """GitHubまたはローカルフォルダからすべての.mdファイルを取得"""
-        md_files = []
-        
-        if self.writing_folder and self.writing_folder.exists():
-            # ローカルファイルシステムから取得
-            for root, dirs, files in os.walk(self.writing_folder):
-                for file in files:
-                    if file.endswith('.md'):
-                        file_path = Path(root) / file
-                        relative_path = file_path.relative_to(self.writing_folder)
-                        md_files.append({
-                            'title': file[:-3],
-                            'path': str(file_path),
-                            'relative_path': str(relative_path),
-                            'category': str(relative_path.parent),
-                            'source': 'local'
-                        })
+    def _evict(self):
+        """サイズ上限を超えたら最も古いblobから削除"""
+        total = sum(b['size'] for b in self._blobs.values())
+        if total > self.max_bytes:
+            for sha, blob in sorted(self._blobs.items(), key=lambda item: item[1]['last_access']):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    (self.blob_dir / sha).unlink()
+                except OSError:
+                    pass
+                total -= blob['size']
+                del self._blobs[sha]
+                text = self._memory.pop(sha, None)
+                if text is not None:
+                    self._memory_chars -= len(text)
+        # 参照先のなくなったURLエントリを整理
+        self._urls = {url: entry for url, entry in self._urls.items() if entry['sha'] in self._blobs}
+
+
+class GitTreeCache:
+    """ブランチ先頭の確認結果とツリーSHAごとのファイル一覧をディスクに保存"""
+
+    def __init__(self, cache_dir=None, fresh_seconds=300):
+        self.cache_dir = (Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR) / 'trees'
+        self.heads_path = self.cache_dir / 'heads.json'
+        self.fresh_seconds = fresh_seconds
+        self._lock = threading.Lock()
+        self._memory = {}  # tree_sha -> ファイル一覧
+        try:
+            with open(self.heads_path, 'r', encoding='utf-8') as f:
+                self._heads = json.load(f)
+        except (OSError, ValueError):
+            self._heads = {}
+
+    def get_head(self, key):
+        """ブランチの最終確認結果 {'tree_sha', 'etag', 'checked_at'} を取得"""
+        with self._lock:
+            return self._heads.get(key)
+
+    def is_fresh(self, key):
+        """先頭確認が有効期限内かどうか"""
+        head = self.get_head(key)
+        return bool(head) and time.time() - head.get('checked_at', 0) <= self.fresh_seconds
+
+    def set_head(self, key, tree_sha, etag=None):
+        """ブランチの先頭確認結果を保存"""
+        with self._lock:
+            head = {'tree_sha': tree_sha, 'etag': etag, 'checked_at': time.time()}
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                # 他のプロセスが書き込んだ他のブランチの結果を消さないよう、ロックを取って読み直してから書き込む
+                with locked_file(self.cache_dir / 'heads.lock'):
+                    try:
+                        with open(self.heads_path, 'r', encoding='utf-8') as f:
+                            self._heads = json.load(f)
+                    except (OSError, ValueError):
+                        pass
+                    self._heads[key] = head
+                    self._write_json(self.heads_path, self._heads)
+            except OSError:
+                self._heads[key] = head
+
+    def get_tree(self, tree_sha):
+        """ツリーSHAに対応するファイル一覧を取得（なければNone）"""
+        with self._lock:
+            if tree_sha in self._memory:
+                return self._memory[tree_sha]
+            try:
+                with open(self.cache_dir / f'{tree_sha}.json', 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._memory[tree_sha] = entries
+            return entries
+
+    def put_tree(self, tree_sha, entries):
+        """ツリーSHAに対応するファイル一覧を保存"""
+        with self._lock:
+            self._memory[tree_sha] = entries
+            self._write_json(self.cache_dir / f'{tree_sha}.json', entries)
+
+    def _write_json(self, path, data):
+        """JSONをアトミックに書き込み（一時ファイル名は書き込みごとに一意なので、同時に書き込んでも壊れない）"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            atomic_write_bytes(path, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        except OSError:
+            pass
+
+
+# GitHubのレート制限まわりの設定
+GITHUB_RATE_BURST = int(os.environ.get('SNS_GITHUB_RATE_BURST', 20))      # 連続して送れるAPIリクエスト数
+GITHUB_RATE_RESERVE = int(os.environ.get('SNS_GITHUB_RATE_RESERVE', 5))    # 先読みが使わずに対話的な読み込み用に残す件数
+GITHUB_INTERACTIVE_MAX_WAIT = 10  # 対話的な読み込みが予算の回復を待つ最大秒数
+GITHUB_BACKGROUND_MAX_WAIT = 120  # 先読みが予算の回復を待つ最大秒数
+GITHUB_BACKOFF_BASE = 2.0       # 二次レート制限のバックオフ初期値（秒）
+GITHUB_BACKOFF_MAX = 120.0      # バックオフの上限（秒）
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BACKGROUND = 'background'
+
+
+class GitHubRateLimitError(requests.RequestException):
+    """レート制限の予算が回復するまで待てずにリクエストを諦めた"""
+
+    def __init__(self, retry_at):
+        super().__init__(f"GitHub APIレート制限中（{max(0, int(retry_at - time.time()))}秒後に再開）")
+        self.retry_at = retry_at
+
+
+class GitHubRateBudget:
+    """GitHubのレート制限をプロセス内の全セッションで共有するトークンバケット
+
+    応答ごとの ``X-RateLimit-Remaining`` / ``X-RateLimit-Reset`` で残数を更新し、
+    リセットまでの残り時間に残数を均等に配分した速度でトークンを補充する。
+    先読みは ``reserve`` 件を対話的な読み込み用に残し、対話的な読み込みが待っている間は順番を譲る。
+    """
+
+    def __init__(self, burst=GITHUB_RATE_BURST, reserve=GITHUB_RATE_RESERVE):
+        self.burst = burst
+        self.reserve = reserve
+        self._cond = threading.Condition()
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.blocked_until = 0.0
+        self.throttled = 0  # 予算不足で諦めたリクエスト数
+        self._tokens = float(burst)
+        self._last_refill = time.time()
+        self._failures = 0
+        self._interactive_waiting = 0
+
+    def _refill(self, now):
+        """経過時間分のトークンを補充（ヘッダー未受信なら制限なし）"""
+        if self.reset_at is not None and now >= self.reset_at:
+            # ウィンドウが切り替わったので上限まで回復したとみなす
+            self.remaining, self.reset_at = self.limit, None
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.remaining is None or self.reset_at is None:
+            self._tokens = float(self.burst)
         else:
-            # 静的リストを使用（レート制限回避）
-            md_files = self.get_static_md_files()
-        
-        return md_files
-    
-    def _get_github_md_files_recursive(self, path):
-        """GitHubから再帰的に.mdファイルを取得"""
-        md_files = []
-        files = self.get_github_files(path)
-        
-        for file in files:
-            if file['type'] == 'file' and file['name'].endswith('.md'):
-                relative_path = file['path']
-                category = '/'.join(relative_path.split('/')[:-1]) if '/' in relative_path else ''
-                md_files.append({
-                    'title': file['name'][:-3],
-                    'path': file['download_url'],
-                    'relative_path': relative_path,
-                    'category': category,
-                    'source': 'github'
-                })
-            elif file['type'] == 'dir':
-                md_files.extend(self._get_github_md_files_recursive(file['path']))
-        
-        return md_files
+            rate = self.remaining / max(self.reset_at - now, 1.0)
+            self._tokens = min(float(self.burst), self._tokens + rate * elapsed)
 
-    def read_file_content(self, file_path, source='local'):
-        """ファイルの内容を読み取り（ローカルまたはGitHub）"""
+    def _available(self, priority):
+        """今すぐ使えるトークン数"""
+        if self.remaining is None:
+            return self._tokens
+        floor = self.reserve if priority == PRIORITY_BACKGROUND else 0
+        return min(self._tokens, self.remaining - floor)
+
+    def _seconds_until_available(self, priority, now):
+        """次のトークンが使えるようになるまでの見込み秒数"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if priority == PRIORITY_BACKGROUND and self._interactive_waiting:
+            return 0.1  # 対話的な読み込みが終わると通知される
+        floor = self.reserve if priority == PRIORITY_BACKGROUND else 0
+        if self.remaining is not None and self.remaining - floor < 1:
+            return self.reset_at - now if self.reset_at else 1.0
+        rate = self.remaining / max(self.reset_at - now, 1.0) if self.reset_at else float(self.burst)
+        return (1 - self._tokens) / rate if rate > 0 else float('inf')
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, max_wait=0.0):
+        """1リクエスト分の予算を確保（max_wait秒以内に確保できなければFalse）"""
+        deadline = time.time() + max_wait
+        interactive = priority != PRIORITY_BACKGROUND
+        with self._cond:
+            if interactive:
+                self._interactive_waiting += 1
+            try:
+                while True:
+                    now = time.time()
+                    self._refill(now)
+                    yielding = not interactive and self._interactive_waiting > 0
+                    if now >= self.blocked_until and not yielding and self._available(priority) >= 1:
+                        self._tokens -= 1
+                        if self.remaining is not None:
+                            self.remaining -= 1
+                        return True
+                    wait_seconds = self._seconds_until_available(priority, now)
+                    if now + wait_seconds > deadline:
+                        self.throttled += 1
+                        return False
+                    self._cond.wait(min(wait_seconds, deadline - now))
+            finally:
+                if interactive:
+                    self._interactive_waiting -= 1
+                    self._cond.notify_all()
+
+    def retry_at(self):
+        """予算が回復する見込みの時刻"""
+        with self._cond:
+            now = time.time()
+            if now < self.blocked_until:
+                return self.blocked_until
+            if self.remaining is not None and self.remaining < 1 and self.reset_at:
+                return self.reset_at
+            return now
+
+    def update(self, headers):
+        """応答ヘッダーのX-RateLimit-*で残数とリセット時刻を更新"""
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset_at = float(headers['X-RateLimit-Reset'])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self._cond:
+            try:
+                self.limit = int(headers.get('X-RateLimit-Limit'))
+            except (TypeError, ValueError):
+                self.limit = max(self.limit or 0, remaining)
+            # 並列の応答は前後して届くので、同じウィンドウ内では少ない方を信じる
+            if self.reset_at == reset_at and self.remaining is not None:
+                remaining = min(remaining, self.remaining)
+            self.remaining, self.reset_at = remaining, reset_at
+            self._cond.notify_all()
+
+    def record_success(self):
+        """成功した応答でバックオフの段階を戻す"""
+        with self._cond:
+            self._failures = 0
+
+    @staticmethod
+    def is_rate_limited(response):
+        """403/429のうちレート制限（二次レート制限を含む）によるものかどうか"""
+        if response.status_code == 429:
+            return True
+        if response.status_code != 403:
+            return False
+        if response.headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in response.headers:
+            return True
+        return 'rate limit' in response.text.lower()
+
+    def backoff(self, response):
+        """レート制限の応答を受けて全リクエストを一時停止し、待ち秒数を返す"""
+        now = time.time()
+        headers = response.headers
+        with self._cond:
+            self._failures += 1
+            retry_after = headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = float(retry_after)
+            elif headers.get('X-RateLimit-Remaining') == '0' and headers.get('X-RateLimit-Reset'):
+                # リセット直後に全セッションが一斉に再開しないよう少しずらす
+                delay = max(0.0, float(headers['X-RateLimit-Reset']) - now) + random.uniform(0, 1)
+            else:
+                # 二次レート制限はリセット時刻が分からないので指数バックオフ（ジッター付き）
+                ceiling = min(GITHUB_BACKOFF_MAX, GITHUB_BACKOFF_BASE * 2 ** (self._failures - 1))
+                delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+            self.blocked_until = max(self.blocked_until, now + delay)
+            self._cond.notify_all()
+            return delay
+
+    def snapshot(self):
+        """UI表示用の現在の予算"""
+        with self._cond:
+            now = time.time()
+            self._refill(now)
+            return {
+                'limit': self.limit,
+                'remaining': self.remaining,
+                'reset_in': max(0.0, self.reset_at - now) if self.reset_at else None,
+                'blocked_for': max(0.0, self.blocked_until - now),
+                'tokens': self._tokens,
+                'throttled': self.throttled,
+            }
+
+
+class GitHubClient:
+    """共有のレート制限予算を守ってGitHubにリクエストするクライアント
+
+    予算が尽きたら優先度ごとの上限まで待ち、待てなければ ``GitHubRateLimitError`` を投げる
+    （呼び出し側はキャッシュにフォールバックする）。403/429はバックオフしてから再試行する。
+    """
+
+    def __init__(self, session, budget=None, max_retries=3):
+        self.session = session
+        self.budget = budget  # 指定がなければ認証ごとの共有予算を使う
+        self.max_retries = max_retries
+
+    def budget_for(self, url, headers=None):
+        """リクエスト先と認証に対応する予算"""
+        if self.budget is not None:
+            return self.budget
+        if not url.startswith(GITHUB_API_URL):
+            # raw配信はAPIの残数に数えられないので、バックオフだけを共有する
+            return get_github_budget('raw')
+        token = (headers or {}).get('Authorization')
+        key = 'token:' + hashlib.sha256(token.encode('utf-8')).hexdigest()[:12] if token else 'anonymous'
+        return get_github_budget(key)
+
+    def get(self, url, headers=None, priority=PRIORITY_INTERACTIVE, **kwargs):
+        """予算を確保してGET（403/429はジッター付きで待ってから再試行）"""
+        return self.request('GET', url, headers, priority, **kwargs)
+
+    def request(self, method, url, headers=None, priority=PRIORITY_INTERACTIVE, **kwargs):
+        """予算を確保してリクエスト（403/429はジッター付きで待ってから再試行）"""
+        budget = self.budget_for(url, headers)
+        max_wait = GITHUB_BACKGROUND_MAX_WAIT if priority == PRIORITY_BACKGROUND else GITHUB_INTERACTIVE_MAX_WAIT
+        deadline = time.time() + max_wait
+        for attempt in range(self.max_retries + 1):
+            if not budget.acquire(priority, max(0.0, deadline - time.time())):
+                raise GitHubRateLimitError(budget.retry_at())
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            budget.update(response.headers)
+            if not budget.is_rate_limited(response):
+                budget.record_success()
+                return response
+            delay = budget.backoff(response)
+            if attempt == self.max_retries or time.time() + delay > deadline:
+                return response
+            response.close()
+        return response
+
+
+_shared_file_cache = None
+_shared_tree_cache = None
+_shared_http_session = None
+_shared_prefetch_executor = None
+_shared_github_budgets = {}
+_shared_file_cache_lock = threading.Lock()
+
+# 先読みの同時接続数
+PREFETCH_WORKERS = 8
+
+
+def get_http_session():
+    """GitHub通信用に共有するHTTPセッション（keep-alive・コネクションプール付き）"""
+    global _shared_http_session
+    with _shared_file_cache_lock:
+        if _shared_http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=PREFETCH_WORKERS * 2)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _shared_http_session = session
+        return _shared_http_session
+
+
+def get_prefetch_executor():
+    """ファイル先読み用に共有するスレッドプール"""
+    global _shared_prefetch_executor
+    with _shared_file_cache_lock:
+        if _shared_prefetch_executor is None:
+            _shared_prefetch_executor = ThreadPoolExecutor(
+                max_workers=PREFETCH_WORKERS,
+                thread_name_prefix='sns-prefetch'
+            )
+        return _shared_prefetch_executor
+
+
+def get_shared_file_cache():
+    """プロセス内で共有するファイルキャッシュを取得"""
+    global _shared_file_cache
+    with _shared_file_cache_lock:
+        if _shared_file_cache is None:
+            _shared_file_cache = FileContentCache()
+            atexit.register(_shared_file_cache.flush)
+        return _shared_file_cache
+
+
+def get_shared_tree_cache():
+    """プロセス内で共有するツリーキャッシュを取得"""
+    global _shared_tree_cache
+    with _shared_file_cache_lock:
+        if _shared_tree_cache is None:
+            _shared_tree_cache = GitTreeCache()
+        return _shared_tree_cache
+
+
+def get_github_budget(key='anonymous'):
+    """プロセス内で共有するGitHubのレート制限予算を認証ごとに取得"""
+    with _shared_file_cache_lock:
+        if key not in _shared_github_budgets:
+            _shared_github_budgets[key] = GitHubRateBudget()
+        return _shared_github_budgets[key]
+
+
+# 生成した記事・投稿のGitHubへの保存（キューにためて1コミットにまとめる）
+SAVE_DIR = 'generated'                                                 # 保存先のリポジトリ内フォルダ
+SAVE_FLUSH_COUNT = int(os.environ.get('SNS_SAVE_FLUSH_COUNT', 20))     # この件数たまったらコミット
+SAVE_FLUSH_SECONDS = float(os.environ.get('SNS_SAVE_FLUSH_SECONDS', 600))  # 最古の1件がこの秒数待ったらコミット
+SAVE_INLINE_MAX_BYTES = 100 * 1024  # これ以下のファイルはblobを作らずツリーに直接含める
+SAVE_BLOB_WORKERS = 8
+SAVE_MAX_RETRIES = 3                # ブランチが先に進んでいた場合の作り直し回数
+SAVE_BACKOFF_SECONDS = 60           # 一時的なエラーで保存に失敗したら、この秒数は自動で保存し直さない
+SAVE_PARK_SECONDS = 24 * 60 * 60    # 権限・保護ブランチなどのエラーでは、手動で保存するまで（最長この秒数）止めておく
+SAVE_FILENAME_PATTERN = re.compile(r'[\\/:*?"<>|#\s]+')
+
+
+def generated_file_path(title, kind='articles', platform=None, now=None):
+    """生成物の保存先パス（例: generated/articles/20250630-120000_タイトル.md）"""
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now))
+    name = SAVE_FILENAME_PATTERN.sub('_', title or 'untitled').strip('_.')[:50] or 'untitled'
+    suffix = f"_{platform}" if platform else ''
+    return f"{SAVE_DIR}/{kind}/{stamp}_{name}{suffix}.md"
+
+
+class GitHubSaveError(requests.RequestException):
+    """GitHubへの保存（コミットの作成・ブランチの更新）に失敗した
+
+    ``retryable`` は時間をおけば成功しうるエラー（5xx・レート制限・競合が続いた場合）かどうか。
+    """
+
+    def __init__(self, message, status_code=None, retryable=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable if retryable is not None else (
+            status_code is None or status_code >= 500 or status_code == 429
+        )
+
+
+class GitHubCommitQueue:
+    """保存する記事・投稿をローカルのキューにため、まとめて1つのコミットとしてGitHubに書き込む
+
+    Contents APIで1ファイルずつ保存すると件数分のコミットとリクエストが必要になるため、
+    Git Data APIでブランチ先頭の取得・ツリーの作成・コミットの作成・ブランチの更新の4リクエストにまとめる
+    （大きなファイルだけは先にblobを並列に作成する）。ブランチが先に進んでいた場合は新しい先頭の上に作り直す。
+    キューはSQLiteに保存するので、トークン未設定や再起動で保存前の分が失われることはない。
+    各ファイルには追加した利用者（``owner``）を記録し、書き込みはその利用者の分だけを、その利用者の
+    トークンで行う。失敗した分は一時的なエラーなら少し待ってから、権限・保護ブランチなどのエラーなら
+    手動で保存し直すまで、自動では書き込まない。
+    """
+
+    def __init__(self, github_repo, branch='main', db_path=None, client=None,
+                 flush_count=SAVE_FLUSH_COUNT, flush_seconds=SAVE_FLUSH_SECONDS):
+        self.github_repo = github_repo
+        self.branch = branch
+        self.db_path = Path(db_path) if db_path else DEFAULT_CACHE_DIR / 'save_queue.sqlite'
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.client = client or GitHubClient(get_http_session())
+        self.flush_count = flush_count
+        self.flush_seconds = flush_seconds
+        self.last_result = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS pending (
+                    path TEXT PRIMARY KEY,
+                    content TEXT,
+                    message TEXT,
+                    queued_at REAL,
+                    owner TEXT DEFAULT '',
+                    retry_at REAL DEFAULT 0,
+                    last_error TEXT
+                )"""
+            )
+            # 利用者・失敗の列がない古いDBに列を追加
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(pending)')}
+            if 'owner' not in columns:
+                self._conn.execute("ALTER TABLE pending ADD COLUMN owner TEXT DEFAULT ''")
+                self._conn.execute('ALTER TABLE pending ADD COLUMN retry_at REAL DEFAULT 0')
+                self._conn.execute('ALTER TABLE pending ADD COLUMN last_error TEXT')
+
+    @staticmethod
+    def _owner_filter(owners):
+        """利用者で絞り込むWHERE句とパラメータ（Noneなら全員分）"""
+        if owners is None:
+            return '', ()
+        owners = tuple(owners)
+        return f" WHERE owner IN ({', '.join('?' * len(owners))})", owners
+
+    def __len__(self):
+        return self.count()
+
+    def count(self, owners=None):
+        """保存待ちの件数（ownersを指定するとその利用者の分だけ）"""
+        where, params = self._owner_filter(owners)
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM pending{where}', params).fetchone()[0]
+
+    def enqueue(self, path, content, message=None, owner=''):
+        """保存するファイルをキューに追加し、その利用者の待っている件数を返す（同じパスは新しい内容で置き換え）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pending (path, content, message, queued_at, owner) VALUES (?, ?, ?, ?, ?)',
+                (path, content, message or f"{path}を追加", time.time(), owner)
+            )
+            return self._conn.execute('SELECT COUNT(*) FROM pending WHERE owner = ?', (owner,)).fetchone()[0]
+
+    def pending(self, owners=None):
+        """キューにたまっているファイルの一覧"""
+        where, params = self._owner_filter(owners)
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT path, message, queued_at, owner FROM pending{where} ORDER BY queued_at', params
+            ).fetchall()
+        return [{'path': path, 'message': message, 'queued_at': queued_at, 'owner': owner}
+                for path, message, queued_at, owner in rows]
+
+    def failure(self, owners=None):
+        """自動での保存を止めている直近の失敗 ``{'error', 'retry_at'}``（止めていなければNone）"""
+        where, params = self._owner_filter(owners)
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT last_error, retry_at FROM pending{where} ORDER BY retry_at DESC LIMIT 1', params
+            ).fetchone()
+        if not row or not row[1] or row[1] <= time.time():
+            return None
+        return {'error': row[0], 'retry_at': row[1]}
+
+    def is_due(self, owners=None, now=None):
+        """件数か待ち時間が閾値に達したかどうか（失敗して待っている間は達していても自動では保存しない）"""
+        where, params = self._owner_filter(owners)
+        with self._lock:
+            count, oldest, retry_at = self._conn.execute(
+                f'SELECT COUNT(*), MIN(queued_at), MAX(retry_at) FROM pending{where}', params
+            ).fetchone()
+        now = now or time.time()
+        if not count or (retry_at or 0) > now:
+            return False
+        return count >= self.flush_count or now - oldest >= self.flush_seconds
+
+    def flush_if_due(self, headers, owners=None):
+        """閾値に達していればコミットして結果を返す（達していなければNone）"""
+        return self.flush(headers, owners=owners) if self.is_due(owners) else None
+
+    def flush(self, headers, message=None, owners=None):
+        """キューのファイル（ownersを指定するとその利用者の分だけ）を1つのコミットとしてブランチに書き込み、結果を返す
+
+        戻り値は ``{'commit', 'files', 'requests', 'attempts'}``。キューが空か、別のスレッドが
+        書き込み中の場合はNone。失敗した場合は ``GitHubSaveError`` などを投げ、キューはそのまま残して
+        失敗を記録する（``is_due`` はしばらくの間、または手動で保存し直すまで False を返す）。
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return None
         try:
-            if source == 'github' or file_path.startswith('http'):
-                # GitHubからファイルを読み取り
-                response = requests.get(file_path)
+            where, params = self._owner_filter(owners)
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT path, content, message, queued_at FROM pending{where} ORDER BY queued_at', params
+                ).fetchall()
+            if not rows:
+                return None
+            try:
+                return self._commit(rows, headers, message)
+            except requests.RequestException as e:
+                self._record_failure(rows, e)
+                raise
+        finally:
+            self._flush_lock.release()
+
+    def _record_failure(self, rows, error):
+        """失敗した分に、次に自動で保存し直す時刻とエラーを記録"""
+        retryable = getattr(error, 'retryable', True)
+        retry_at = time.time() + (SAVE_BACKOFF_SECONDS if retryable else SAVE_PARK_SECONDS)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE pending SET retry_at = ?, last_error = ? WHERE path = ? AND queued_at = ?',
+                [(retry_at, str(error), path, queued_at) for path, _, _, queued_at in rows]
+            )
+
+    def _commit(self, rows, headers, message=None):
+        """ファイルを1つのコミットにまとめてブランチを更新し、キューから取り除く"""
+        counter = {'requests': 0}
+        with get_tracer().span('save.commit', files=len(rows)) as span:
+            entries = self._tree_entries(rows, headers, counter)
+            commit_message = message or self._commit_message(rows)
+            for attempt in range(SAVE_MAX_RETRIES + 1):
+                head_sha, base_tree = self._branch_head(headers, counter)
+                tree = self._post('/git/trees', headers, counter, {'base_tree': base_tree, 'tree': entries})
+                commit = self._post('/git/commits', headers, counter, {
+                    'message': commit_message,
+                    'tree': tree['sha'],
+                    'parents': [head_sha],
+                })
+                response = self._send('PATCH', f"/git/refs/heads/{self.branch}", headers, counter,
+                                      json={'sha': commit['sha'], 'force': False})
                 if response.status_code == 200:
-                    return response.text
-                else:
-                    return f"ファイル読み取りエラー: HTTP {response.status_code}"
+                    break
+                conflict = response.status_code == 409 or (
+                    response.status_code == 422 and 'fast forward' in response.text.lower()
+                )
+                if not conflict or attempt == SAVE_MAX_RETRIES:
+                    raise GitHubSaveError(
+                        f"ブランチを更新できませんでした: {response.status_code} {response.text[:200]}",
+                        response.status_code, retryable=conflict or None
+                    )
+                # 他の書き込みでブランチが先に進んだので、新しい先頭の上にツリーとコミットを作り直す
+                time.sleep(random.uniform(0.1, 0.5) * 2 ** attempt)
+            span.set(requests=counter['requests'], attempts=attempt + 1)
+
+        # 書き込み中に同じパスへ追加された新しい内容はキューに残す
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'DELETE FROM pending WHERE path = ? AND queued_at = ?',
+                [(path, queued_at) for path, _, _, queued_at in rows]
+            )
+        self.last_result = {
+            'commit': commit['sha'],
+            'files': len(rows),
+            'requests': counter['requests'],
+            'attempts': attempt + 1,
+        }
+        return self.last_result
+
+    @staticmethod
+    def _commit_message(rows):
+        """キューの各ファイルのメッセージをまとめたコミットメッセージ"""
+        if len(rows) == 1:
+            return rows[0][2]
+        lines = '\n'.join(f"- {message}" for _, _, message, _ in rows)
+        return f"生成した記事・投稿を{len(rows)}件保存\n\n{lines}"
+
+    def _tree_entries(self, rows, headers, counter):
+        """ツリーの要素（小さいファイルは本文を直接含め、大きいファイルは並列に作成したblobを参照）"""
+        entries = {}
+        large = []
+        for path, content, _, _ in rows:
+            if len(content.encode('utf-8')) <= SAVE_INLINE_MAX_BYTES:
+                entries[path] = {'path': path, 'mode': '100644', 'type': 'blob', 'content': content}
             else:
-                # ローカルファイルから読み取り
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-        except Exception as e:
-            return f"ファイル読み取りエラー: {str(e)}"
+                large.append((path, content))
+        if large:
+            with ThreadPoolExecutor(max_workers=SAVE_BLOB_WORKERS, thread_name_prefix='sns-save') as executor:
+                blobs = executor.map(
+                    lambda item: (item[0], self._post('/git/blobs', headers, counter,
+                                                      {'content': item[1], 'encoding': 'utf-8'})),
+                    large
+                )
+                for path, blob in blobs:
+                    entries[path] = {'path': path, 'mode': '100644', 'type': 'blob', 'sha': blob['sha']}
+        return [entries[path] for path, _, _, _ in rows]
 
-    def extract_key_points(self, content):
-        """コンテンツから主要なポイントを抽出"""
-        lines = content.split('\n')
-        key_points = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            # ヘッダー、リスト項目、重要そうな行を抽出
-            if (line.startswith('#') or 
-                line.startswith('✔️') or 
-                line.startswith('・') or
-                line.startswith('-') or
-                '！' in line or
-                '。' in line[:50]):  # 最初の50文字以内に句点があるものを重要文として扱う
-                key_points.append(line)
-        
-        return key_points[:10]  # 上位10個まで
+    def _branch_head(self, headers, counter):
+        """ブランチ先頭のコミットSHAとツリーSHA"""
+        response = self._send('GET', f"/branches/{quote(self.branch)}", headers, counter)
+        if response.status_code != 200:
+            raise GitHubSaveError(f"ブランチを取得できませんでした: {response.status_code}", response.status_code)
+        commit = response.json()['commit']
+        return commit['sha'], commit['commit']['tree']['sha']
+
+    def _post(self, path, headers, counter, body):
+        """Git Data APIにオブジェクトを作成（201以外は失敗）"""
+        response = self._send('POST', path, headers, counter, json=body)
+        if response.status_code != 201:
+            raise GitHubSaveError(f"{path}の作成に失敗しました: {response.status_code} {response.text[:200]}",
+                                  response.status_code)
+        return response.json()
+
+    def _send(self, method, path, headers, counter, **kwargs):
+        counter['requests'] += 1
+        return self.client.request(
+            method, f"{GITHUB_API_URL}/repos/{self.github_repo}{path}", headers=headers, timeout=30, **kwargs
+        )
+
+
+_shared_commit_queues = {}
+_shared_commit_queue_lock = threading.Lock()
+
+
+def get_commit_queue(github_repo, branch='main'):
+    """プロセス内で共有する保存キューをリポジトリ・ブランチごとに取得"""
+    key = f"{github_repo}@{branch}"
+    with _shared_commit_queue_lock:
+        if key not in _shared_commit_queues:
+            digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]
+            _shared_commit_queues[key] = GitHubCommitQueue(
+                github_repo, branch, DEFAULT_CACHE_DIR / f'save_queue_{digest}.sqlite'
+            )
+        return _shared_commit_queues[key]
+
+
+class LocalManifest:
+    """ローカルのWritingフォルダの.mdファイル一覧（パス・更新日時・サイズ・ハッシュ・カテゴリ）を保存
+
+    再走査はディレクトリの更新日時が変わったフォルダだけに限定する。ディレクトリの更新日時は
+    ファイルの追加・削除・名前変更でしか変わらないため、``refresh()`` だけでは既存ファイルの上書きは
+    検知できない。上書きは ``refresh(check_files=True)``（全ファイルのstat）か監視（``start_watcher``）で
+    一覧全体に反映し、1ファイルだけなら ``refresh_file`` で確認する。
+    監視中は変更通知のあったパスのディレクトリだけを処理するので、一覧取得は変更件数に比例した時間で済む。
+    ディレクトリごとのファイル名の索引と並べ替え済みの一覧はメモリに持ち、一覧が変わったときだけ作り直す。
+    """
+
+    def __init__(self, root, manifest_path=None):
+        self.root = Path(root)
+        digest = hashlib.sha256(str(self.root.resolve()).encode('utf-8')).hexdigest()[:12]
+        self.manifest_path = Path(manifest_path) if manifest_path else DEFAULT_CACHE_DIR / f'manifest_{digest}.json'
+        self._lock = threading.RLock()
+        self._dirs = {}   # 相対ディレクトリ -> {'mtime_ns', 'subdirs'}
+        self._files = {}  # 相対パス -> {'mtime_ns', 'size', 'sha', 'category'}
+        self._dir_files = {}  # 相対ディレクトリ -> 直下の.mdファイルの相対パス
+        self._md_files = None  # md_files() の結果（_filesが変わったら作り直す）
+        self._loaded = False
+        self._watcher = None
+        self._dirty_paths = set()
+        self._watcher_stop = threading.Event()
+
+    def _load(self):
+        """保存済みのマニフェストを読み込み"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('root') == str(self.root):
+                self._dirs = data.get('dirs', {})
+                self._files = data.get('files', {})
+        except (OSError, ValueError):
+            pass
+        self._dir_files = {}
+        for relative_path in self._files:
+            self._dir_files.setdefault(os.path.dirname(relative_path), set()).add(relative_path)
+        self._md_files = None
+        self._loaded = True
+
+    def _save(self):
+        """マニフェストをアトミックに書き込み（一時ファイル名は書き込みごとに一意）"""
+        try:
+            self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            data = json.dumps({'root': str(self.root), 'dirs': self._dirs, 'files': self._files}, ensure_ascii=False)
+            atomic_write_bytes(self.manifest_path, data.encode('utf-8'))
+        except OSError:
+            pass
+
+    def _relative(self, path):
+        relative = os.path.relpath(path, self.root)
+        return '' if relative == '.' else relative
+
+    def _set_file(self, relative_path, entry):
+        self._files[relative_path] = entry
+        self._dir_files.setdefault(os.path.dirname(relative_path), set()).add(relative_path)
+        self._md_files = None
+
+    def _drop_file(self, relative_path):
+        """ファイルのエントリを削除（あればTrue）"""
+        if self._files.pop(relative_path, None) is None:
+            return False
+        self._dir_files.get(os.path.dirname(relative_path), set()).discard(relative_path)
+        self._md_files = None
+        return True
+
+    def _update_file(self, relative_path, stat=None):
+        """1ファイル分のエントリを更新（内容が変わっていればハッシュを計算し直す）"""
+        absolute = self.root / relative_path
+        try:
+            stat = stat or absolute.stat()
+        except OSError:
+            return self._drop_file(relative_path)
+        entry = self._files.get(relative_path)
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return False
+        try:
+            sha = git_blob_sha(absolute.read_bytes())
+        except OSError:
+            return self._drop_file(relative_path)
+        self._set_file(relative_path, {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha': sha,
+            'category': str(Path(relative_path).parent)
+        })
+        return True
+
+    def _forget_dir(self, relative_dir):
+        """ディレクトリ配下のエントリをすべて削除"""
+        entry = self._dirs.pop(relative_dir, None)
+        for relative_path in list(self._dir_files.pop(relative_dir, ())):
+            self._files.pop(relative_path, None)
+            self._md_files = None
+        for name in (entry or {}).get('subdirs', []):
+            self._forget_dir(os.path.join(relative_dir, name))
+
+    def _scan_dir(self, relative_dir, dir_stat):
+        """1ディレクトリの直下だけを読み直し、子ディレクトリ名を返す（読めなければ配下を削除）"""
+        absolute = self.root / relative_dir
+        subdirs, md_paths = [], set()
+        try:
+            with os.scandir(absolute) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.name.endswith('.md') and entry.is_file():
+                        relative_path = os.path.join(relative_dir, entry.name)
+                        md_paths.add(relative_path)
+                        self._update_file(relative_path, entry.stat())
+        except OSError:
+            # 走査中に削除された・ディレクトリでなくなった・権限がない
+            self._forget_dir(relative_dir)
+            return []
+
+        # 消えたファイル・ディレクトリを削除
+        for relative_path in self._dir_files.get(relative_dir, set()) - md_paths:
+            self._drop_file(relative_path)
+        for name in self._dirs.get(relative_dir, {}).get('subdirs', []):
+            if name not in subdirs:
+                self._forget_dir(os.path.join(relative_dir, name))
+
+        self._dirs[relative_dir] = {'mtime_ns': dir_stat.st_mtime_ns, 'subdirs': sorted(subdirs)}
+        return subdirs
+
+    def _revalidate(self, start_dirs, check_files=False, recursive=True):
+        """ディレクトリの更新日時を確認し、変わったディレクトリだけ再走査
+
+        recursive=Falseでは、子ディレクトリは新しく見つかったものだけをたどる（監視の通知は
+        変更のあったディレクトリごとに届くため）。
+        """
+        changed = False
+        stack = list(start_dirs)
+        while stack:
+            relative_dir = stack.pop()
+            try:
+                dir_stat = os.stat(self.root / relative_dir)
+            except OSError:
+                dir_stat = None
+            if dir_stat is None or not S_ISDIR(dir_stat.st_mode):
+                if relative_dir in self._dirs:
+                    self._forget_dir(relative_dir)
+                    changed = True
+                continue
+            entry = self._dirs.get(relative_dir)
+            if entry and entry['mtime_ns'] == dir_stat.st_mtime_ns:
+                subdirs = entry['subdirs']
+                if check_files:
+                    for relative_path in list(self._dir_files.get(relative_dir, ())):
+                        changed |= self._update_file(relative_path)
+            else:
+                subdirs = self._scan_dir(relative_dir, dir_stat)
+                changed = True
+            subdirs = [os.path.join(relative_dir, name) for name in subdirs]
+            stack.extend(subdirs if recursive else [d for d in subdirs if d not in self._dirs])
+        return changed
+
+    def refresh(self, check_files=False):
+        """マニフェストを最新化（監視中は通知のあったパスだけを処理）"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if self._watcher is not None and self._dirs:
+                dirty, self._dirty_paths = self._dirty_paths, set()
+                try:
+                    changed = self._apply_dirty(dirty)
+                except Exception:
+                    self._dirty_paths |= dirty  # 次の更新でやり直す
+                    raise
+            else:
+                changed = self._revalidate([''], check_files=check_files)
+            if changed:
+                self._save()
+            return changed
+
+    def _apply_dirty(self, dirty_paths):
+        """監視で通知されたパスを反映（.md以外のファイル・エディタの一時ファイルなどは無視）"""
+        changed = False
+        dirs = set()
+        for path in dirty_paths:
+            relative = self._relative(path)
+            if relative.startswith('..'):
+                continue
+            if relative.endswith('.md'):
+                changed |= self._update_file(relative)
+                dirs.add(os.path.dirname(relative))
+            elif relative in self._dirs or os.path.isdir(path):
+                dirs.add(relative)
+        # 追加・削除・名前変更はディレクトリごと確認する
+        if dirs:
+            changed |= self._revalidate(sorted(dirs), recursive=False)
+        return changed
+
+    def refresh_file(self, relative_path):
+        """1ファイルだけ更新日時とサイズを確認し、最新の一覧の要素を返す（なくなっていればNone）
+
+        ディレクトリの更新日時が変わらない上書きも、選択中のファイルなどはこれで毎回反映できる。
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if self._update_file(relative_path):
+                self._save()
+            entry = self._files.get(relative_path)
+            return self._md_file(relative_path, entry) if entry else None
+
+    def _md_file(self, relative_path, entry):
+        return {
+            'title': os.path.basename(relative_path)[:-3],
+            'path': str(self.root / relative_path),
+            'relative_path': relative_path,
+            'category': entry['category'],
+            'source': 'local',
+            'content_hash': entry['sha']
+        }
+
+    def md_files(self):
+        """ファイル一覧（get_all_md_filesと同じ形式）を返す"""
+        with self._lock:
+            if self._md_files is None:
+                self._md_files = [
+                    self._md_file(relative_path, entry) for relative_path, entry in sorted(self._files.items())
+                ]
+            return list(self._md_files)
+
+    def start_watcher(self, poll_interval=5.0):
+        """変更監視を開始（watchdogがあればinotify等、なければポーリング）し、方式名を返す"""
+        with self._lock:
+            if self._watcher is not None:
+                return self._watcher[0]
+            self.refresh()
+            try:
+                from watchdog.events import FileSystemEventHandler
+                from watchdog.observers import Observer
+            except ImportError:
+                thread = threading.Thread(target=self._poll, args=(poll_interval,), daemon=True,
+                                          name='sns-manifest-poll')
+                self._watcher = ('polling', thread)
+                thread.start()
+                return 'polling'
+
+            manifest = self
+
+            class _Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    with manifest._lock:
+                        manifest._dirty_paths.add(event.src_path)
+                        if getattr(event, 'dest_path', None):
+                            manifest._dirty_paths.add(event.dest_path)
+
+            observer = Observer()
+            observer.schedule(_Handler(), str(self.root), recursive=True)
+            observer.daemon = True
+            observer.start()
+            self._watcher = ('watchdog', observer)
+            return 'watchdog'
+
+    def _poll(self, interval):
+        """ポーリングでマニフェストを更新し続ける"""
+        while not self._watcher_stop.wait(interval):
+            with self._lock:
+                if self._revalidate([''], check_files=True):
+                    self._save()
+
+    def stop_watcher(self):
+        """変更監視を停止"""
+        with self._lock:
+            watcher, self._watcher = self._watcher, None
+        if watcher is None:
+            return
+        self._watcher_stop.set()
+        if watcher[0] == 'watchdog':
+            watcher[1].stop()
+        watcher[1].join(timeout=5)
+        self._watcher_stop = threading.Event()
+
+    @property
+    def watcher_mode(self):
+        return self._watcher[0] if self._watcher else None
+
+
+# 主要ポイントとして扱う最大件数
+KEY_POINT_LIMIT = 10
+
+# 行頭の記号（見出し・箇条書き）を除去するパターン
+POINT_PREFIX_PATTERN = re.compile(r'^[#\-\*\•✔️]+\s*')
+
+# キーワード→ハッシュタグのルール（上から順に採用、キーワードは大文字小文字を区別しない）
+DEFAULT_HASHTAG_RULES = [
+    {'keywords': ['AI'], 'hashtag': '#AI活用'},
+    {'keywords': ['事務', '業務'], 'hashtag': '#業務効率化'},
+    {'keywords': ['SNS'], 'hashtag': '#SNS運用'},
+]
+
+# 解析結果のメモ化件数
+PARSED_DOCUMENT_CACHE_SIZE = 256
+
+# 投稿生成ロジックのバージョン（create_*の出力が変わる変更をしたら上げる）
+POST_GENERATOR_VERSION = 3
+
+# 解析ロジックのバージョン（ParsedDocumentの解析結果が変わる変更をしたら上げる）
+PARSED_DOCUMENT_VERSION = 1
+
+
+class HashtagEngine:
+    """ハッシュタグのルールを1つの正規表現にまとめ、本文を1回の走査で判定
+
+    全キーワードを先読み（lookahead）の選択としてコンパイルし、各位置で一致を調べるので、
+    走査はCの正規表現エンジンで1回だけ行い、重なり合うキーワードもすべて一致する。
+    同じ位置で始まるキーワードは長い方だけが報告されるため、その先頭部分にあたる短いキーワードの
+    ルールもあらかじめまとめておく（「AIツール」が一致した位置では「AI」も一致している）。
+    """
+
+    def __init__(self, rules):
+        self.rules = [{'keywords': list(rule['keywords']), 'hashtag': rule['hashtag']} for rule in rules]
+        keyword_rules = {}  # 小文字化したキーワード -> ルール番号
+        for index, rule in enumerate(self.rules):
+            for keyword in rule['keywords']:
+                keyword_rules.setdefault(keyword.lower(), set()).add(index)
+        self._keyword_rules = {
+            keyword: sorted(set().union(*(indexes for other, indexes in keyword_rules.items()
+                                          if keyword.startswith(other))))
+            for keyword in keyword_rules
+        }
+        keywords = sorted(keyword_rules, key=len, reverse=True)
+        self._pattern = re.compile(
+            '(?=(' + '|'.join(re.escape(k) for k in keywords) + '))', re.IGNORECASE
+        ) if keywords else None
+        payload = json.dumps(self.rules, ensure_ascii=False, sort_keys=True)
+        self.signature = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def match(self, text):
+        """本文に一致したルールのハッシュタグをルール順で返す"""
+        if self._pattern is None:
+            return []
+        matched = set()
+        for found in self._pattern.finditer(text):
+            matched.update(self._keyword_rules.get(found.group(1).lower(), ()))
+            if len(matched) == len(self.rules):
+                break  # 全ルールが一致したら残りは読まない
+        return [self.rules[index]['hashtag'] for index in sorted(matched)]
+
+
+def classify_line(line):
+    """前後の空白を除いた行の種類を判定（'heading' / 'list' / 'sentence' / None）"""
+    # ヘッダー、リスト項目、重要そうな行を抽出
+    if line.startswith('#'):
+        return 'heading'
+    if line.startswith(('✔️', '・', '-')):
+        return 'list'
+    if '！' in line or '。' in line[:50]:  # 最初の50文字以内に句点があるものを重要文として扱う
+        return 'sentence'
+    return None
+
+
+class ParsedDocument:
+    """1回の走査で作成する解析済みドキュメント（各プラットフォームの投稿作成で共有）"""
+
+    __slots__ = (
+        'headings', 'list_items', 'key_sentences', 'key_points',
+        'clean_key_points', 'normalized_text', '_hashtag_hits', '_content_hash', '_content'
+    )
+
+    def __init__(self, content):
+        headings, list_items, key_sentences, key_points = [], [], [], []
+        normalized_lines = []
+
+        for line in content.split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            normalized_lines.append(line)
+
+            # classify_lineと同じ判定（大きな本文で行ごとの関数呼び出しを避けるためインライン化）
+            if line.startswith('#'):
+                headings.append(line)
+            elif line.startswith(('✔️', '・', '-')):
+                list_items.append(line)
+            elif '！' in line or '。' in line[:50]:
+                key_sentences.append(line)
+            else:
+                continue
+            if len(key_points) < KEY_POINT_LIMIT:
+                key_points.append(line)
+
+        self.headings = headings
+        self.list_items = list_items
+        self.key_sentences = key_sentences
+        self.key_points = key_points
+        self.clean_key_points = [POINT_PREFIX_PATTERN.sub('', point) for point in key_points]
+        self.normalized_text = '\n'.join(normalized_lines)
+        self._hashtag_hits = {}
+        self._content = content
+        self._content_hash = None
+
+    @classmethod
+    def from_fields(cls, content, fields, content_hash=None):
+        """保存済みの解析結果から作成（本文を走査しない）"""
+        document = cls.__new__(cls)
+        for field in PARSED_FIELDS:
+            setattr(document, field, fields[field])
+        document._hashtag_hits = {}
+        document._content = content
+        document._content_hash = content_hash
+        return document
+
+    @property
+    def content_hash(self):
+        """本文のコンテンツハッシュ（GitのblobSHA）"""
+        if self._content_hash is None:
+            self._content_hash = git_blob_sha(self._content.encode('utf-8'))
+        return self._content_hash
+
+    def matched_hashtags(self, engine):
+        """ハッシュタグのルールに一致した結果（ルールセットごとにメモ化）"""
+        hits = self._hashtag_hits.get(engine.signature)
+        if hits is None:
+            hits = engine.match(self._content)
+            self._hashtag_hits[engine.signature] = hits
+        return list(hits)
+
+
+_parsed_documents = OrderedDict()
+_parsed_documents_lock = threading.Lock()
+
+
+def parse_document(content):
+    """本文を解析してParsedDocumentを返す（同じ本文はメモ化した結果を再利用）"""
+    # 文字列のハッシュはオブジェクトにキャッシュされるため、同じ本文の再検索はほぼ無コスト
+    with _parsed_documents_lock:
+        document = _parsed_documents.get(content)
+        if document is not None:
+            _parsed_documents.move_to_end(content)
+            return document
+
+    return remember_parsed_document(content, ParsedDocument(content))
+
+
+def remember_parsed_document(content, document):
+    """解析結果をメモ化に登録"""
+    with _parsed_documents_lock:
+        _parsed_documents[content] = document
+        _parsed_documents.move_to_end(content)
+        while len(_parsed_documents) > PARSED_DOCUMENT_CACHE_SIZE:
+            _parsed_documents.popitem(last=False)
+    return document
+
+
+def clear_document_cache():
+    """解析結果のメモ化をすべて破棄（ベンチマークなどで毎回解析させたい場合用）"""
+    with _parsed_documents_lock:
+        _parsed_documents.clear()
+
+# リポジトリ同梱のコーパスバンドル（build_corpus_bundle.pyで作成）
+APP_DIR = Path(__file__).resolve().parent
+CORPUS_BUNDLE_PATH = Path(os.environ.get('SNS_CORPUS_BUNDLE', APP_DIR / 'corpus_bundle.sqlite'))
+CORPUS_BUNDLE_VERSION = 1
+PARSED_FIELDS = ('headings', 'list_items', 'key_sentences', 'key_points', 'clean_key_points', 'normalized_text')
+
+
+def parser_signature():
+    """解析結果を左右する設定（解析ロジックのバージョン・主要ポイントの件数・行頭記号・ハッシュタグのルール）のハッシュ"""
+    payload = json.dumps(
+        [PARSED_DOCUMENT_VERSION, KEY_POINT_LIMIT, POINT_PREFIX_PATTERN.pattern, DEFAULT_HASHTAG_RULES],
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def parsed_document_fields(document):
+    """ParsedDocumentの解析結果をバンドル保存用の辞書にする"""
+    return {field: getattr(document, field) for field in PARSED_FIELDS}
+
+
+def corpus_source_signature(folder):
+    """Writingフォルダの.mdファイル一覧（パス・サイズ・更新日時）のハッシュ"""
+    folder = Path(folder)
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.endswith('.md'):
+                continue
+            path = Path(dirpath) / name
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            digest.update(f"{path.relative_to(folder).as_posix()}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def build_corpus_bundle(folder, output_path, generator=None):
+    """Writingフォルダの全.mdファイルを、一覧・圧縮本文・解析結果ごと1つのSQLiteファイルにまとめる
+
+    一覧はGitHubモードと同じ形式（raw URL・カテゴリ・blob SHA）で保存するので、
+    アプリはネットワークに出ずにGitHubモードの一覧と本文を表示できる。
+    """
+    folder = Path(folder)
+    output_path = Path(output_path)
+    generator = generator or SocialMediaPostGenerator(use_bundle=False)
+    prefix = generator.github_content_root or folder.name
+    tree_entries, bodies = [], {}
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.endswith('.md'):
+                continue
+            path = Path(dirpath) / name
+            data = path.read_bytes()
+            sha = git_blob_sha(data)
+            tree_entries.append({'path': f"{prefix}/{path.relative_to(folder).as_posix()}", 'type': 'blob', 'sha': sha})
+            bodies[sha] = data
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix('.tmp')
+    tmp_path.unlink(missing_ok=True)
+    conn = sqlite3.connect(str(tmp_path))
+    try:
+        with conn:
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute(
+                """CREATE TABLE files (
+                    relative_path TEXT PRIMARY KEY,
+                    title TEXT,
+                    category TEXT,
+                    sha TEXT,
+                    size INTEGER
+                )"""
+            )
+            conn.execute('CREATE TABLE blobs (sha TEXT PRIMARY KEY, body BLOB, parsed BLOB)')
+            for file in generator._md_files_from_tree(tree_entries):
+                conn.execute(
+                    'INSERT INTO files VALUES (?, ?, ?, ?, ?)',
+                    (file['relative_path'], file['title'], file['category'], file['sha'], len(bodies[file['sha']]))
+                )
+            for sha, data in bodies.items():
+                document = ParsedDocument(data.decode('utf-8', errors='replace'))
+                parsed = json.dumps(parsed_document_fields(document), ensure_ascii=False).encode('utf-8')
+                conn.execute(
+                    'INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)',
+                    (sha, zlib.compress(data, 9), zlib.compress(parsed, 9))
+                )
+            conn.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ('version', str(CORPUS_BUNDLE_VERSION)),
+                ('parser_signature', parser_signature()),
+                ('repo', generator.github_repo),
+                ('branch', generator.github_branch),
+                ('source_signature', corpus_source_signature(folder)),
+                ('built_at', str(time.time())),
+            ])
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    os.replace(tmp_path, output_path)
+    return len(tree_entries)
+
+
+class CorpusBundle:
+    """build_corpus_bundleで作ったSQLiteバンドルを読み取り専用で開く
+
+    一覧はメモリに載せ、本文と解析結果はblob SHAを指定したときだけ読み出して展開する
+    （ファイル全体はmmapで参照するので、起動時に全件を読み込むことはない）。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        self._conn.execute('PRAGMA mmap_size = 268435456')
+        self.meta = dict(self._conn.execute('SELECT key, value FROM meta').fetchall())
+        if int(self.meta.get('version', 0)) != CORPUS_BUNDLE_VERSION:
+            self._conn.close()
+            raise ValueError(f"未対応のバンドル形式です: {self.path}")
+        # 解析ロジックやルールが変わっていたら、保存済みの解析結果は使わない
+        self.parsed_usable = self.meta.get('parser_signature') == parser_signature()
+        self._files = self._conn.execute(
+            'SELECT relative_path, title, category, sha FROM files ORDER BY relative_path'
+        ).fetchall()
+        self._shas = {row[3] for row in self._files}
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, sha):
+        return sha in self._shas
+
+    def md_files(self, raw_url):
+        """GitHubモードと同じ形式のファイル一覧（raw_urlはリポジトリ内パス→URLの関数）"""
+        return [
+            {
+                'title': title,
+                'path': raw_url(relative_path),
+                'relative_path': relative_path,
+                'category': category,
+                'source': 'github',
+                'sha': sha
+            }
+            for relative_path, title, category, sha in self._files
+        ]
+
+    def get_body(self, sha):
+        """blob SHAから本文を取得し、保存済みの解析結果で解析キャッシュを温める（なければNone）"""
+        if sha not in self._shas:
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT body, parsed FROM blobs WHERE sha = ?', (sha,)).fetchone()
+        if row is None:
+            return None
+        content = zlib.decompress(row[0]).decode('utf-8', errors='replace')
+        if self.parsed_usable and row[1]:
+            fields = json.loads(zlib.decompress(row[1]))
+            remember_parsed_document(content, ParsedDocument.from_fields(content, fields, content_hash=sha))
+        return content
+
+
+_shared_corpus_bundle = None
+_shared_corpus_bundle_lock = threading.Lock()
+
+
+def get_corpus_bundle():
+    """プロセス内で共有するコーパスバンドル（なければNone）
+
+    同梱のバンドルがなくてもWritingフォルダがアプリと一緒に配置されていれば、
+    キャッシュ保存先にバンドルを作成して使う（フォルダが変わっていれば作り直す）。
+    """
+    global _shared_corpus_bundle
+    with _shared_corpus_bundle_lock:
+        if _shared_corpus_bundle is not None:
+            return _shared_corpus_bundle or None
+        bundle = None
+        try:
+            if CORPUS_BUNDLE_PATH.exists():
+                bundle = CorpusBundle(CORPUS_BUNDLE_PATH)
+            else:
+                source_dir = APP_DIR / 'vibe-cording-writing'
+                if source_dir.is_dir():
+                    built_path = DEFAULT_CACHE_DIR / 'corpus_bundle.sqlite'
+                    if built_path.exists():
+                        bundle = CorpusBundle(built_path)
+                        if (bundle.meta.get('source_signature') != corpus_source_signature(source_dir)
+                                or not bundle.parsed_usable):
+                            bundle = None
+                    if bundle is None:
+                        build_corpus_bundle(source_dir, built_path)
+                        bundle = CorpusBundle(built_path)
+        except (OSError, ValueError, sqlite3.Error):
+            bundle = None
+        _shared_corpus_bundle = bundle or False
+        return bundle
+
+
+class SocialMediaPostGenerator:
+    def __init__(self, writing_folder_path=None, file_cache=None, tree_cache=None, github_budget=None,
+                 use_bundle=True):
+        self.writing_folder = Path(writing_folder_path) if writing_folder_path else None
+        self.local_manifest = LocalManifest(self.writing_folder) if self.writing_folder else None
+        self.file_cache = file_cache or get_shared_file_cache()
+        self.tree_cache = tree_cache or get_shared_tree_cache()
+        self.http = get_http_session()
+        self.github = GitHubClient(self.http, github_budget)
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_inflight = set()
+        self.github_repo = "HAL86AI/sns-post-generator"  # GitHubリポジトリ
+        self.github_branch = "main"
+        self.github_content_root = "vibe-cording-writing"  # 投稿元として扱うフォルダ
+        self.base_github_url = f"{GITHUB_API_URL}/repos/{self.github_repo}/contents"
+        # GitHubモードは同梱バンドルから一覧と本文を読み、最新の一覧は更新を求められたときだけ取得する
+        self.corpus_bundle = get_corpus_bundle() if use_bundle and not self.writing_folder else None
+        self.live_listing = os.environ.get('SNS_LIVE_LISTING') == '1'
+        self.platform_configs = {
+            'Twitter': {
+                'max_chars': 280,
+                'hashtag_limit': 3,
+                'tone': 'カジュアル、親しみやすい',
+                'format': 'ツイート形式',
+                'base_hashtags': []
+            },
+            'LinkedIn': {
+                'max_chars': 1300,
+                'hashtag_limit': 5,
+                'tone': 'プロフェッショナル、丁寧',
+                'format': 'ビジネス記事形式',
+                'base_hashtags': ['#働き方改革', '#DX', '#業務効率化', '#AI活用', '#キャリアデザイン']
+            },
+            'note': {
+                'max_chars': 200,
+                'hashtag_limit': 5,
+                'tone': '読みやすく、親しみやすい',
+                'format': 'ブログ導入文',
+                'base_hashtags': ['#働き方', '#AI', '#業務効率化', '#キャリア', '#フリーランス']
+            }
+        }
+        self.hashtag_engine = HashtagEngine(DEFAULT_HASHTAG_RULES)
+
+    def get_github_files(self, path=""):
+        """GitHubからファイル一覧を取得"""
+        try:
+            url = f"{self.base_github_url}/{path}"
+            
+            response = self.github.get(url, headers=self._github_headers(), timeout=30)
+            
+            if response.status_code == 200:
+                files = response.json()
+                return files
+            else:
+                if response.status_code in (403, 429):
+                    st.warning("💡 GitHub APIレート制限に達しています。GitHubトークンを設定すると制限が緩和されます。")
+                else:
+                    st.error(f"GitHub APIエラー: {response.status_code}")
+            return []
+        except GitHubRateLimitError as e:
+            st.warning(f"💡 {str(e)}")
+            return []
+        except Exception as e:
+            st.error(f"GitHub API エラー: {str(e)}")
+            return []
+
+    def _github_headers(self):
+        """GitHub認証ヘッダー（オプション）"""
+        headers = {}
+        token = get_secret('GITHUB_TOKEN')
+        if token:
+            headers['Authorization'] = f"token {token}"
+        elif 'github_token' in st.session_state:
+            headers['Authorization'] = f"token {st.session_state['github_token']}"
+        return headers
+
+    def _raw_github_url(self, path):
+        """リポジトリ内パスからraw.githubusercontent.comのURLを作成"""
+        return f"{GITHUB_RAW_URL}/{self.github_repo}/{self.github_branch}/{quote(path)}"
+
+    def _resolve_github_tree_sha(self, force=False):
+        """ブランチ先頭のツリーSHAを取得（ETag付きで先頭が動いたかだけを確認）"""
+        key = f"{self.github_repo}@{self.github_branch}"
+        head = self.tree_cache.get_head(key)
+        if head and not force and self.tree_cache.is_fresh(key):
+            return head['tree_sha']
+
+        headers = self._github_headers()
+        if head and head.get('etag'):
+            headers['If-None-Match'] = head['etag']
+        url = f"{GITHUB_API_URL}/repos/{self.github_repo}/branches/{quote(self.github_branch)}"
+        try:
+            response = self.github.get(url, headers=headers, timeout=30)
+        except GitHubRateLimitError as e:
+            if not head:
+                raise
+            # 予算が回復するまでは前回確認したツリーを使う
+            st.warning(f"💡 {str(e)}。前回取得したファイル一覧を表示しています。")
+            return head['tree_sha']
+
+        if response.status_code == 304 and head:
+            self.tree_cache.set_head(key, head['tree_sha'], head.get('etag'))
+            return head['tree_sha']
+        if response.status_code == 200:
+            tree_sha = response.json()['commit']['commit']['tree']['sha']
+            self.tree_cache.set_head(key, tree_sha, response.headers.get('ETag'))
+            return tree_sha
+        if response.status_code in (403, 429):
+            st.warning("💡 GitHub APIレート制限に達しています。GitHubトークンを設定すると制限が緩和されます。")
+        else:
+            st.error(f"GitHub APIエラー: {response.status_code}")
+        # 確認に失敗しても以前のツリーがあればそれを使う
+        return head['tree_sha'] if head else None
+
+    def get_github_tree_md_files(self, force_refresh=False):
+        """Git Trees APIで.mdファイル一覧を1リクエストで取得（ツリーSHAでキャッシュ）"""
+        try:
+            tree_sha = self._resolve_github_tree_sha(force=force_refresh)
+            if not tree_sha:
+                return []
+
+            md_files = self.tree_cache.get_tree(tree_sha)
+            if md_files is not None:
+                return md_files
+
+            url = f"{GITHUB_API_URL}/repos/{self.github_repo}/git/trees/{tree_sha}?recursive=1"
+            response = self.github.get(url, headers=self._github_headers(), timeout=30)
+            if response.status_code != 200:
+                st.error(f"GitHub APIエラー: {response.status_code}")
+                return []
+            tree = response.json()
+            if tree.get('truncated'):
+                # ツリーが大きすぎる場合はContents APIで辿る
+                md_files = self._get_github_md_files_recursive(self.github_content_root)
+            else:
+                md_files = self._md_files_from_tree(tree.get('tree', []))
+            self.tree_cache.put_tree(tree_sha, md_files)
+            return md_files
+        except GitHubRateLimitError as e:
+            st.warning(f"💡 {str(e)}")
+            return []
+        except Exception as e:
+            st.error(f"GitHub API エラー: {str(e)}")
+            return []
+
+    def _md_files_from_tree(self, tree_entries):
+        """Git Trees APIの結果から.mdファイル情報を作成"""
+        root_prefix = f"{self.github_content_root}/" if self.github_content_root else ''
+        md_files = []
+        for entry in tree_entries:
+            relative_path = entry['path']
+            if entry.get('type') != 'blob' or not relative_path.endswith('.md'):
+                continue
+            if not relative_path.startswith(root_prefix):
+                continue
+            folder = '/'.join(relative_path[len(root_prefix):].split('/')[:-1])
+            md_files.append({
+                'title': relative_path.split('/')[-1][:-3],
+                'path': self._raw_github_url(relative_path),
+                'relative_path': relative_path,
+                'category': folder or 'メイン',
+                'source': 'github',
+                'sha': entry.get('sha')
+            })
+        return md_files
+
+    def get_all_md_files(self, force_refresh=False):
+        """GitHubまたはローカルフォルダからすべての.mdファイルを取得"""
+        md_files = []
+        
+        with get_tracer().span('listing') as span:
+            if self.writing_folder and self.writing_folder.exists():
+                # ローカルファイルシステムから取得（マニフェストで変更のあったフォルダだけ再走査）
+                self.local_manifest.refresh(check_files=force_refresh)
+                md_files = self.local_manifest.md_files()
+                span.set(source='local')
+            else:
+                # 同梱バンドルがない場合と最新の一覧を求められた場合だけGit Trees APIで一括取得
+                if self.corpus_bundle is None or self.live_listing or force_refresh:
+                    md_files = self.get_github_tree_md_files(force_refresh=force_refresh)
+                    if md_files and force_refresh:
+                        self.live_listing = True
+                span.set(source='github')
+                if not md_files and self.corpus_bundle is not None:
+                    # 一覧の取得に失敗してもバンドルの内容は表示できる
+                    md_files = self.corpus_bundle.md_files(self._raw_github_url)
+                    span.set(source='bundle')
+            span.set(files=len(md_files))
+        
+        return md_files
+    
+    def refresh_file(self, file):
+        """選択されたファイルの一覧の情報を最新にする（ローカルは上書きされていればハッシュを計算し直す）"""
+        if file.get('source', 'local') != 'local' or self.local_manifest is None:
+            return file
+        return self.local_manifest.refresh_file(file['relative_path']) or file
+
+    def _get_github_md_files_recursive(self, path):
+        """GitHubから再帰的に.mdファイルを取得"""
+        md_files = []
+        files = self.get_github_files(path)
+        
+        for file in files:
+            if file['type'] == 'file' and file['name'].endswith('.md'):
+                relative_path = file['path']
+                category = '/'.join(relative_path.split('/')[:-1]) if '/' in relative_path else ''
+                md_files.append({
+                    'title': file['name'][:-3],
+                    'path': file['download_url'],
+                    'relative_path': relative_path,
+                    'category': category,
+                    'source': 'github',
+                    'sha': file.get('sha')
+                })
+            elif file['type'] == 'dir':
+                md_files.extend(self._get_github_md_files_recursive(file['path']))
+        
+        return md_files
+
+    def cached_body(self, sha):
+        """blob SHAに対応する本文をキャッシュか同梱バンドルから取得（なければNone）"""
+        if not sha:
+            return None
+        body = self.file_cache.get_blob(sha)
+        if body is None and self.corpus_bundle is not None:
+            body = self.corpus_bundle.get_body(sha)
+        return body
+
+    def has_cached_body(self, sha):
+        """blob SHAに対応する本文が通信なしで読めるかどうか（展開はしない）"""
+        if self.corpus_bundle is not None and sha in self.corpus_bundle:
+            return True
+        return self.file_cache.get_blob(sha) is not None
+
+    def read_file_content(self, file_path, source='local', sha=None, priority=PRIORITY_INTERACTIVE):
+        """ファイルの内容を読み取り（ローカルまたはGitHub）"""
+        with get_tracer().span('fetch', source=source, priority=priority) as span:
+            try:
+                if source == 'github' or file_path.startswith('http'):
+                    content = self._read_github_file(file_path, sha=sha, priority=priority)
+                else:
+                    # ローカルファイルから読み取り
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+            except Exception as e:
+                content = f"ファイル読み取りエラー: {str(e)}"
+            span.set(chars=len(content))
+            return content
+
+    def _read_github_file(self, url, sha=None, priority=PRIORITY_INTERACTIVE):
+        """GitHubのファイルをキャッシュ経由で読み取り（ETagで条件付きGET）"""
+        # 一覧のblob SHAと一致する本文（キャッシュまたは同梱バンドル）があれば通信しない
+        cached = self.cached_body(sha)
+        if cached is None:
+            cached = self.file_cache.get_fresh(url)
+        if cached is not None:
+            return cached
+
+        try:
+            response = self.github.get(
+                url, headers=self.file_cache.conditional_headers(url), priority=priority, timeout=30
+            )
+        except requests.RequestException:
+            stale = self.file_cache.get_stale(url)
+            if stale is not None:
+                return stale
+            raise
+
+        if response.status_code == 304:
+            cached = self.file_cache.revalidated(url)
+            if cached is not None:
+                return cached
+            # キャッシュ本体が消えていた場合は取り直す
+            response = self.github.get(url, priority=priority, timeout=30)
+
+        if response.status_code == 200:
+            return self.file_cache.store(
+                url,
+                response.content,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified')
+            )
+        return f"ファイル読み取りエラー: HTTP {response.status_code}"
+
+    def read_file_prefix(self, url, max_chars=500):
+        """GitHubのファイルの先頭だけをRangeリクエストで取得"""
+        # UTF-8は1文字最大4バイト（日本語は3バイト）
+        max_bytes = max_chars * 4
+        try:
+            response = self.github.get(url, headers={'Range': f'bytes=0-{max_bytes - 1}'}, timeout=30)
+        except requests.RequestException as e:
+            return f"ファイル読み取りエラー: {str(e)}"
+        if response.status_code == 206:
+            # 途中で切れた最後の文字は捨てる
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            return decoder.decode(response.content, final=False)[:max_chars]
+        if response.status_code == 200:
+            # Range非対応のサーバーは全体を返すので、そのままキャッシュしておく
+            return self.file_cache.store(
+                url,
+                response.content,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified')
+            )[:max_chars]
+        return f"ファイル読み取りエラー: HTTP {response.status_code}"
+
+    def prefetch_files(self, md_files, wait_for_completion=False):
+        """ファイル本文をスレッドプールで並列に先読みしてキャッシュを温める"""
+        executor = get_prefetch_executor()
+        futures = []
+        with self._prefetch_lock:
+            for file in md_files:
+                if file.get('source') != 'github' and not str(file['path']).startswith('http'):
+                    continue  # ローカルファイルは先読み不要
+                if file.get('sha') and self.has_cached_body(file['sha']):
+                    continue
+                if file['path'] in self._prefetch_inflight:
+                    continue
+                self._prefetch_inflight.add(file['path'])
+                futures.append(executor.submit(self._prefetch_one, file))
+        if wait_for_completion and futures:
+            wait(futures)
+        return len(futures)
+
+    def _prefetch_one(self, file):
+        """1ファイルを先読み"""
+        try:
+            self.read_file_content(file['path'], 'github', sha=file.get('sha'), priority=PRIORITY_BACKGROUND)
+        finally:
+            with self._prefetch_lock:
+                self._prefetch_inflight.discard(file['path'])
+
+    def github_budget_status(self):
+        """現在の認証で使っているGitHub APIのレート制限予算"""
+        url = f"{GITHUB_API_URL}/repos/{self.github_repo}"
+        return self.github.budget_for(url, self._github_headers()).snapshot()
+
+    def config_hash(self):
+        """投稿生成の設定とロジックのバージョンを表すハッシュ"""
+        payload = json.dumps(
+            [POST_GENERATOR_VERSION, self.platform_configs, self.hashtag_engine.rules],
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def create_post(self, platform, content, title):
+        """プラットフォーム名を指定して投稿を作成"""
+        with get_tracer().span(f'generate.{platform}'):
+            if platform == 'Twitter':
+                return self.create_twitter_post(content, title)
+            elif platform == 'LinkedIn':
+                return self.create_linkedin_post(content, title)
+            elif platform == 'note':
+                return self.create_note_intro(content, title)
+            raise ValueError(f"未対応のプラットフォーム: {platform}")
+
+    def select_hashtags(self, document, platform):
+        """ルールに一致したハッシュタグ→プラットフォームの定番タグの順に、hashtag_limitまで選ぶ"""
+        config = self.platform_configs[platform]
+        hashtags = []
+        for hashtag in document.matched_hashtags(self.hashtag_engine) + config.get('base_hashtags', []):
+            if hashtag not in hashtags:
+                hashtags.append(hashtag)
+        return hashtags[:config['hashtag_limit']]
+
+    def parse_document(self, content):
+        """コンテンツを1回だけ走査して解析結果を取得"""
+        with get_tracer().span('extract', chars=len(content)):
+            return parse_document(content)
+
+    def extract_key_points(self, content):
+        """コンテンツから主要なポイントを抽出"""
+        return list(self.parse_document(content).key_points)  # 上位10個まで
+
+    def create_twitter_post(self, content, title):
+        """Twitter用投稿作成"""
+        document = self.parse_document(content)
+        key_points = document.key_points
+        
+        # タイトルから主要テーマを抽出
+        main_theme = title.split('_')[0] if '_' in title else title[:20]
+        
+        # ハッシュタグを抽出・生成（hashtag_limitまで）
+        hashtag_text = ' '.join(self.select_hashtags(document, 'Twitter'))
+        
+        # メイン文章作成（ハッシュタグを除いた文字数で制限）
+        char_limit = 280 - len(hashtag_text) - 5  # 余白を考慮
+        
+        if key_points:
+            main_text = f"{main_theme}について、{key_points[0][:50]}..."
+        else:
+            main_text = f"{main_theme}について書きました！"
+        
+        # 文字数調整
+        if len(main_text) > char_limit:
+            main_text = main_text[:char_limit-3] + "..."
+        
+        tweet = f"{main_text}\n\n{hashtag_text}"
+        
+        return tweet
+
+    def create_linkedin_post(self, content, title):
+        """LinkedIn用投稿作成"""
+        document = self.parse_document(content)
+        
+        # プロフェッショナルな導入
+        intro = f"【{title.replace('_', ' ')}】\n\n"
+        
+        # 主要ポイントを箇条書きで
+        main_content = "主要なポイント：\n"
+        for clean_point in document.clean_key_points[:5]:
+            if clean_point:
+                main_content += f"• {clean_point[:100]}\n"
+        
+        # クロージング
+        closing = "\n皆様の業務効率化や働き方改善の参考になれば幸いです。"
+        
+        # ハッシュタグ
+        hashtags = "\n\n" + ' '.join(self.select_hashtags(document, 'LinkedIn'))
+        
+        post = intro + main_content + closing + hashtags
+        
+        # 文字数制限
+        if len(post) > 1300:
+            post = post[:1297] + "..."
+        
+        return post
+
+    def create_note_intro(self, content, title):
+        """note用導入文作成"""
+        document = self.parse_document(content)
+        
+        # タイトル改善
+        clean_title = title.replace('_', ' ').replace('【', '').replace('】', '')
+        
+        # 導入文作成
+        if document.clean_key_points:
+            first_point = document.clean_key_points[0]
+            intro = f"こんにちは！\n\n{first_point[:80]}...\n\nこのような経験から、今回は{clean_title}について詳しくお話しします。"
+        else:
+            intro = f"こんにちは！\n\n今回は「{clean_title}」について、私の実体験を交えながらお話しします。"
+        
+        # ハッシュタグ
+        hashtags = "\n\n" + ' '.join(self.select_hashtags(document, 'note'))
+        
+        note_post = intro + hashtags
+        
+        return note_post
+
+
+# 検索用トークン：英数字は単語、それ以外（日本語など）は文字bigram
+SEARCH_WORD_PATTERN = re.compile(r'[a-z0-9]+|[^\sa-z0-9!-/:-@\[-`{-~、。，．・「」『』（）【】！？：；〜…]+')
+
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+SEARCH_TITLE_WEIGHT = 3  # タイトル中の語は本文の3倍として数える
+
+
+def tokenize_for_search(text):
+    """検索用にテキストをトークン化（日本語は文字bigram）"""
+    tokens = []
+    for run in SEARCH_WORD_PATTERN.findall(unicodedata.normalize('NFKC', text).lower()):
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def file_version_key(file):
+    """ファイルの変更検知用キー（GitHubはblob SHA、ローカルは更新日時とサイズ）"""
+    if file.get('sha'):
+        return file['sha']
+    try:
+        stat = os.stat(file['path'])
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+    except OSError:
+        return None
+
+
+def file_content_hash(file, content=None):
+    """投稿ストアやハッシュタグ候補のキーにする本文ハッシュ（書き込みと読み出しで必ずこれを使う）
+
+    GitHubは一覧のblob SHA（本文はそのSHAで取得するので、読み込んだ本文と一致する）。
+    ローカルは読み込んだ本文から計算する。マニフェストのハッシュは上書き直後には古いことがあり、
+    改行コードも読み込んだ本文と異なるため使わない。本文を渡さず一覧からも決まらない場合はNone。
+    """
+    if file.get('sha'):
+        return file['sha']
+    if content is None:
+        return None
+    return git_blob_sha(content.encode('utf-8'))
+
+
+class CorpusSearchIndex:
+    """記事フォルダ全体の転置インデックス（SQLiteに保存・BM25でランキング）
+
+    本文のハッシュが変わったファイルだけを索引し直すため、検索時に本文の取得は発生しない。
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path) if db_path else DEFAULT_CACHE_DIR / 'search_index.sqlite'
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._last_signature = None
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS docs (
+                    doc_key TEXT PRIMARY KEY,
+                    title TEXT,
+                    category TEXT,
+                    path TEXT,
+                    source TEXT,
+                    version TEXT,
+                    sha TEXT,
+                    length INTEGER
+                )"""
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS postings (term TEXT, doc_key TEXT, tf INTEGER)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS postings_term ON postings (term)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_key)')
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+
+    def stale_files(self, md_files):
+        """索引が古い（または未登録の）ファイルを返す"""
+        with self._lock:
+            versions = dict(self._conn.execute('SELECT doc_key, version FROM docs'))
+        return [f for f in md_files if versions.get(f['relative_path']) != file_version_key(f)]
+
+    def update(self, md_files, generator):
+        """ファイル一覧に合わせて索引を差分更新し、索引し直した件数を返す"""
+        signature = tuple((f['relative_path'], file_version_key(f)) for f in md_files)
+        if signature == self._last_signature:
+            return 0
+
+        stale = self.stale_files(md_files)
+        # GitHubのファイルは並列に先読みしてから索引する
+        generator.prefetch_files(stale, wait_for_completion=True)
+
+        with self._lock:
+            known_shas = dict(self._conn.execute('SELECT doc_key, sha FROM docs'))
+        reindexed = 0
+        for file in stale:
+            content = generator.read_file_content(file['path'], file.get('source', 'local'), sha=file.get('sha'))
+            if content.startswith('ファイル読み取りエラー'):
+                continue
+            sha = file.get('sha') or git_blob_sha(content.encode('utf-8'))
+            if known_shas.get(file['relative_path']) == sha:
+                self._touch(file, sha)  # 更新日時だけが変わった場合
+            else:
+                self._index_document(file, content, sha)
+                reindexed += 1
+
+        # 一覧から消えたファイルを削除
+        current_keys = {f['relative_path'] for f in md_files}
+        with self._lock, self._conn:
+            removed = [key for (key,) in self._conn.execute('SELECT doc_key FROM docs') if key not in current_keys]
+            for key in removed:
+                self._conn.execute('DELETE FROM docs WHERE doc_key = ?', (key,))
+                self._conn.execute('DELETE FROM postings WHERE doc_key = ?', (key,))
+
+        self._last_signature = signature
+        return reindexed
+
+    def _touch(self, file, sha):
+        """本文が同じファイルの変更検知用キーだけを更新"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE docs SET version = ?, path = ?, sha = ? WHERE doc_key = ?',
+                (file_version_key(file), file['path'], sha, file['relative_path'])
+            )
+
+    def _index_document(self, file, content, sha):
+        """1ファイル分の索引を作り直す"""
+        term_counts = {}
+        for token in tokenize_for_search(content):
+            term_counts[token] = term_counts.get(token, 0) + 1
+        for token in tokenize_for_search(file['title']):
+            term_counts[token] = term_counts.get(token, 0) + SEARCH_TITLE_WEIGHT
+        length = sum(term_counts.values())
+
+        key = file['relative_path']
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM postings WHERE doc_key = ?', (key,))
+            self._conn.executemany(
+                'INSERT INTO postings VALUES (?, ?, ?)',
+                [(term, key, tf) for term, tf in term_counts.items()]
+            )
+            self._conn.execute(
+                'INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, file['title'], file.get('category', ''), file['path'], file.get('source', 'local'),
+                 file_version_key(file), sha, length)
+            )
+
+    def search(self, query, limit=20):
+        """クエリに一致するファイルをBM25スコア順に返す"""
+        terms = sorted(set(tokenize_for_search(query)))
+        if not terms:
+            return []
+
+        placeholders = ','.join('?' * len(terms))
+        with self._lock:
+            doc_count, avg_length = self._conn.execute('SELECT COUNT(*), AVG(length) FROM docs').fetchone()
+            if not doc_count:
+                return []
+            rows = self._conn.execute(
+                f'SELECT p.term, p.doc_key, p.tf, d.length FROM postings p '
+                f'JOIN docs d ON d.doc_key = p.doc_key WHERE p.term IN ({placeholders})',
+                terms
+            ).fetchall()
+
+        document_frequency = {}
+        for term, _, _, _ in rows:
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        scores = {}
+        for term, doc_key, tf, length in rows:
+            df = document_frequency[term]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+            scores[doc_key] = scores.get(doc_key, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        if not ranked:
+            return []
+        keys = [key for key, _ in ranked]
+        with self._lock:
+            docs = {
+                row[0]: row for row in self._conn.execute(
+                    f'SELECT doc_key, title, category, path, source, sha FROM docs '
+                    f'WHERE doc_key IN ({",".join("?" * len(keys))})',
+                    keys
+                )
+            }
+        results = []
+        for key, score in ranked:
+            doc_key, title, category, path, source, sha = docs[key]
+            result = {
+                'title': title,
+                'path': path,
+                'relative_path': doc_key,
+                'category': category,
+                'source': source,
+                'score': score
+            }
+            if source == 'github':
+                result['sha'] = sha
+            results.append(result)
+        return results
+
+
+class LazyDocument:
+    """本文を必要になるまで読み込まないドキュメントハンドル
+
+    プレビューは先頭だけを読み（GitHubはRangeリクエスト、ローカルは部分読み込み）、
+    本文全体は ``content`` にアクセスしたときに初めて取得する。
+    """
+
+    def __init__(self, generator, file):
+        self.generator = generator
+        self.file = file
+        self._content = None
+
+    @property
+    def is_remote(self):
+        return self.file.get('source') == 'github' or str(self.file['path']).startswith('http')
+
+    @property
+    def is_loaded(self):
+        return self._content is not None
+
+    def _cached_body(self):
+        """読み込み済み、またはキャッシュ済みの本文（なければNone）"""
+        if self._content is None and self.is_remote and self.file.get('sha'):
+            self._content = self.generator.cached_body(self.file['sha'])
+        return self._content
+
+    @property
+    def content(self):
+        """本文全体（初回アクセス時に取得）"""
+        if self._content is None:
+            self._content = load_file_content(self.generator, self.file)
+        return self._content
+
+    def preview(self, max_chars=500):
+        """先頭max_chars文字だけを読み込む"""
+        body = self._cached_body()
+        if body is not None:
+            return body[:max_chars]
+        if self.is_remote:
+            return self.generator.read_file_prefix(self.file['path'], max_chars)
+        try:
+            with open(self.file['path'], 'r', encoding='utf-8') as f:
+                return f.read(max_chars)
+        except Exception as e:
+            return f"ファイル読み取りエラー: {str(e)}"
+
+
+_shared_search_indexes = {}
+_shared_search_index_lock = threading.Lock()
+
+
+def get_search_index(source_key):
+    """プロセス内で共有する検索インデックスをデータソースごとに取得"""
+    with _shared_search_index_lock:
+        if source_key not in _shared_search_indexes:
+            digest = hashlib.sha256(source_key.encode('utf-8')).hexdigest()[:12]
+            _shared_search_indexes[source_key] = CorpusSearchIndex(DEFAULT_CACHE_DIR / f'search_index_{digest}.sqlite')
+        return _shared_search_indexes[source_key]
+
+
+# ハッシュタグ候補として扱う語（カタカナ3文字以上・漢字2〜6文字・英数字2文字以上）
+HASHTAG_CANDIDATE_PATTERN = re.compile(r'[ァ-ヶー]{3,}|[一-龥]{2,6}|[A-Za-z][A-Za-z0-9]+')
+HASHTAG_STOPWORDS = frozenset([
+    '場合', '今回', '自分', '必要', '方法', '以下', '以上', '本当', '時間', '今日', '最初', '最後',
+    '意味', '部分', '全部', '理由', '結果', '可能', '問題', '内容', '状態', '他人', '相手', '一番',
+    'the', 'and', 'for', 'with', 'this', 'that', 'https', 'http', 'www', 'com', 'md',
+])
+HASHTAG_SUGGESTION_LIMIT = 5
+
+
+class HashtagSuggestionStore:
+    """コーパス全体のTF-IDFで記事ごとのハッシュタグ候補を事前計算して保存
+
+    計算はコーパスが変わったときに一度だけ行い、リクエスト時は本文ハッシュで引くだけにする。
+    """
+
+    def __init__(self, store_path=None):
+        self.store_path = Path(store_path) if store_path else DEFAULT_CACHE_DIR / 'hashtag_suggestions.json'
+        self._lock = threading.Lock()
+        try:
+            with open(self.store_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self._signature = data.get('signature')
+        self._suggestions = data.get('suggestions', {})
+
+    @staticmethod
+    def candidate_terms(text):
+        """本文からハッシュタグ候補の語を抽出"""
+        return [term for term in HASHTAG_CANDIDATE_PATTERN.findall(text) if term.lower() not in HASHTAG_STOPWORDS]
+
+    def is_current(self, md_files):
+        """保存済みの候補がファイル一覧と一致しているかどうか"""
+        return self._signature == self._corpus_signature(md_files)
+
+    # 保存形式のバージョン（候補のキーの付け方を変えたら上げて作り直させる）
+    STORE_VERSION = 3
+
+    @classmethod
+    def _corpus_signature(cls, md_files):
+        keys = sorted(f"{f['relative_path']}:{file_version_key(f)}" for f in md_files)
+        keys.insert(0, f"version:{cls.STORE_VERSION}")
+        return hashlib.sha256('\n'.join(keys).encode('utf-8')).hexdigest()
+
+    def build(self, md_files, generator, limit=HASHTAG_SUGGESTION_LIMIT):
+        """全ファイルのTF-IDFを計算して候補を保存（コーパスが変わっていなければ何もしない）"""
+        signature = self._corpus_signature(md_files)
+        if signature == self._signature:
+            return False
+
+        generator.prefetch_files(md_files, wait_for_completion=True)
+        term_counts = {}
+        document_frequency = {}
+        for file in md_files:
+            content = generator.read_file_content(file['path'], file.get('source', 'local'), sha=file.get('sha'))
+            if content.startswith('ファイル読み取りエラー'):
+                continue
+            sha = file_content_hash(file, content)
+            counts = {}
+            for term in self.candidate_terms(content):
+                counts[term] = counts.get(term, 0) + 1
+            term_counts[sha] = counts
+            for term in counts:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        doc_count = len(term_counts)
+        suggestions = {}
+        for sha, counts in term_counts.items():
+            total = sum(counts.values()) or 1
+            scored = []
+            for term, count in counts.items():
+                if document_frequency[term] == doc_count:
+                    continue  # 全記事に出る語は特徴にならない
+                idf = math.log(doc_count / document_frequency[term])
+                scored.append((count / total * idf, term))
+            scored.sort(reverse=True)
+            suggestions[sha] = [f"#{term}" for _, term in scored[:limit]]
+
+        with self._lock:
+            self._signature = signature
+            self._suggestions = suggestions
+            try:
+                self.store_path.parent.mkdir(parents=True, exist_ok=True)
+                data = json.dumps({'signature': signature, 'suggestions': suggestions}, ensure_ascii=False)
+                atomic_write_bytes(self.store_path, data.encode('utf-8'))
+            except OSError:
+                pass
+        return True
+
+    def suggest(self, content_hash, exclude=()):
+        """本文ハッシュに対応するハッシュタグ候補を取得"""
+        with self._lock:
+            return [tag for tag in self._suggestions.get(content_hash, []) if tag not in exclude]
+
+
+_shared_hashtag_suggestions = {}
+
+
+def get_hashtag_suggestions(source_key):
+    """プロセス内で共有するハッシュタグ候補をデータソースごとに取得"""
+    with _shared_search_index_lock:
+        if source_key not in _shared_hashtag_suggestions:
+            digest = hashlib.sha256(source_key.encode('utf-8')).hexdigest()[:12]
+            _shared_hashtag_suggestions[source_key] = HashtagSuggestionStore(
+                DEFAULT_CACHE_DIR / f'hashtag_suggestions_{digest}.json'
+            )
+        return _shared_hashtag_suggestions[source_key]
+
+
+# 類似記事検出（MinHash + LSH）のパラメータ
+DUPLICATE_SHINGLE_SIZE = 5      # 文字n-gramの長さ
+DUPLICATE_BANDS = 16            # LSHのバンド数
+DUPLICATE_ROWS = 4              # 1バンドあたりの行数（署名長 = バンド数 × 行数）
+DUPLICATE_THRESHOLD = 0.7       # 推定Jaccard類似度がこれ以上なら重複とみなす
+MINHASH_PRIME = (1 << 61) - 1
+MINHASH_SEED = 20240630
+
+
+def _minhash_params(num_perm):
+    """MinHashのハッシュ関数族 (a*x + b) mod p の係数（シード固定で再現可能）"""
+    rng = random.Random(MINHASH_SEED)
+    return [(rng.randrange(1, MINHASH_PRIME), rng.randrange(0, MINHASH_PRIME)) for _ in range(num_perm)]
+
+
+MINHASH_PARAMS = _minhash_params(DUPLICATE_BANDS * DUPLICATE_ROWS)
+
+
+def text_shingles(text, size=DUPLICATE_SHINGLE_SIZE):
+    """空白を除いて正規化した本文の文字n-gram（のハッシュ値）の集合"""
+    normalized = ''.join(unicodedata.normalize('NFKC', text).lower().split())
+    if len(normalized) <= size:
+        return {zlib.crc32(normalized.encode('utf-8'))} if normalized else set()
+    return {zlib.crc32(normalized[i:i + size].encode('utf-8')) for i in range(len(normalized) - size + 1)}
+
+
+def minhash_signature(shingles):
+    """shingle集合のMinHash署名"""
+    if not shingles:
+        return [MINHASH_PRIME] * len(MINHASH_PARAMS)
+    values = list(shingles)
+    return [min([(a * x + b) % MINHASH_PRIME for x in values]) for a, b in MINHASH_PARAMS]
+
+
+def estimate_jaccard(signature_a, signature_b):
+    """2つのMinHash署名から推定したJaccard類似度"""
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / len(signature_a)
+
+
+class NearDuplicateIndex:
+    """記事フォルダ全体の類似記事（ほぼ同じ内容のファイル）を検出する索引
+
+    ファイルごとのMinHash署名をSQLiteに保存し、変更されたファイルだけを計算し直す。
+    重複候補はLSHのバンドのバケットで絞り込むので、全ペアを比較せずにコーパスの大きさにほぼ比例する時間で済む。
+    """
+
+    def __init__(self, db_path=None, threshold=DUPLICATE_THRESHOLD):
+        self.db_path = Path(db_path) if db_path else DEFAULT_CACHE_DIR / 'duplicates.sqlite'
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._last_signature = None
+        self._clusters = None
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS signatures (
+                    doc_key TEXT PRIMARY KEY,
+                    title TEXT,
+                    category TEXT,
+                    path TEXT,
+                    source TEXT,
+                    version TEXT,
+                    sha TEXT,
+                    length INTEGER,
+                    minhash TEXT
+                )"""
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM signatures').fetchone()[0]
+
+    def stale_files(self, md_files):
+        """署名が古い（または未計算の）ファイルを返す"""
+        with self._lock:
+            versions = dict(self._conn.execute('SELECT doc_key, version FROM signatures'))
+        return [f for f in md_files if versions.get(f['relative_path']) != file_version_key(f)]
+
+    def update(self, md_files, generator):
+        """ファイル一覧に合わせて署名を差分更新し、計算し直した件数を返す"""
+        signature = tuple((f['relative_path'], file_version_key(f)) for f in md_files)
+        if signature == self._last_signature:
+            return 0
+
+        stale = self.stale_files(md_files)
+        generator.prefetch_files(stale, wait_for_completion=True)
+
+        with self._lock:
+            # 同じ本文（同じSHA）の署名は使い回す
+            known = {sha: (length, minhash) for sha, length, minhash in
+                     self._conn.execute('SELECT sha, length, minhash FROM signatures')}
+        recomputed = 0
+        rows = []
+        for file in stale:
+            content = generator.read_file_content(file['path'], file.get('source', 'local'), sha=file.get('sha'))
+            if content.startswith('ファイル読み取りエラー'):
+                continue
+            sha = file.get('sha') or git_blob_sha(content.encode('utf-8'))
+            if sha not in known:
+                known[sha] = (len(content), json.dumps(minhash_signature(text_shingles(content))))
+                recomputed += 1
+            length, minhash = known[sha]
+            rows.append((file['relative_path'], file['title'], file.get('category', ''), file['path'],
+                         file.get('source', 'local'), file_version_key(file), sha, length, minhash))
+
+        current_keys = {f['relative_path'] for f in md_files}
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            removed = [key for (key,) in self._conn.execute('SELECT doc_key FROM signatures') if key not in current_keys]
+            self._conn.executemany('DELETE FROM signatures WHERE doc_key = ?', [(key,) for key in removed])
+            if rows or removed:
+                self._clusters = None
+
+        self._last_signature = signature
+        return recomputed
+
+    def clusters(self):
+        """重複クラスタの一覧（各クラスタは代表ファイルが先頭、類似度つき）"""
+        with self._lock:
+            if self._clusters is not None:
+                return self._clusters
+            rows = self._conn.execute(
+                'SELECT doc_key, title, category, path, source, sha, length, minhash FROM signatures ORDER BY doc_key'
+            ).fetchall()
+
+        signatures = [json.loads(row[7]) for row in rows]
+        parent = list(range(len(rows)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        # 同じバンドのバケットに入ったファイル同士だけを候補として比較する
+        # （バケット内は全ペアを比較し、既に同じクラスタに入ったペアは飛ばす）
+        compared = set()
+        for band in range(DUPLICATE_BANDS):
+            start = band * DUPLICATE_ROWS
+            buckets = {}
+            for i, minhash in enumerate(signatures):
+                buckets.setdefault(tuple(minhash[start:start + DUPLICATE_ROWS]), []).append(i)
+            for members in buckets.values():
+                for position, first in enumerate(members):
+                    for other in members[position + 1:]:
+                        pair = (first, other)
+                        if pair in compared or find(first) == find(other):
+                            continue
+                        compared.add(pair)
+                        if estimate_jaccard(signatures[first], signatures[other]) >= self.threshold:
+                            parent[find(other)] = find(first)
+
+        groups = {}
+        for i in range(len(rows)):
+            groups.setdefault(find(i), []).append(i)
+
+        clusters = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            # 最も長い（加筆が最も進んだ）版を代表にする
+            members.sort(key=lambda i: (-rows[i][6], rows[i][0]))
+            representative = signatures[members[0]]
+            cluster = []
+            for i in members:
+                doc_key, title, category, path, source, sha, length, _ = rows[i]
+                entry = {
+                    'title': title,
+                    'path': path,
+                    'relative_path': doc_key,
+                    'category': category,
+                    'source': source,
+                    'length': length,
+                    'similarity': estimate_jaccard(representative, signatures[i])
+                }
+                if source == 'github':
+                    entry['sha'] = sha
+                cluster.append(entry)
+            clusters.append(cluster)
+        clusters.sort(key=lambda cluster: (-len(cluster), cluster[0]['relative_path']))
+
+        with self._lock:
+            self._clusters = clusters
+        return clusters
+
+    def redundant_paths(self):
+        """代表以外の重複ファイルの相対パス（一括生成で読み飛ばす対象）"""
+        return {entry['relative_path'] for cluster in self.clusters() for entry in cluster[1:]}
+
+    def duplicates_of(self, relative_path):
+        """指定したファイルと重複している他のファイル"""
+        for cluster in self.clusters():
+            if any(entry['relative_path'] == relative_path for entry in cluster):
+                return [entry for entry in cluster if entry['relative_path'] != relative_path]
+        return []
+
+
+_shared_duplicate_indexes = {}
+
+
+def get_duplicate_index(source_key):
+    """プロセス内で共有する類似記事の索引をデータソースごとに取得"""
+    with _shared_search_index_lock:
+        if source_key not in _shared_duplicate_indexes:
+            digest = hashlib.sha256(source_key.encode('utf-8')).hexdigest()[:12]
+            _shared_duplicate_indexes[source_key] = NearDuplicateIndex(DEFAULT_CACHE_DIR / f'duplicates_{digest}.sqlite')
+        return _shared_duplicate_indexes[source_key]
+
+
+# 関連記事の検索（文字n-gramを固定次元にハッシュしたベクトルのコサイン類似度）
+RELATED_NGRAM_SIZES = (2, 3)
+RELATED_DIMENSIONS = 4096       # ベクトルの次元数（1記事あたり16KB）
+RELATED_TOP_K = 3               # プロンプトに添える抜粋の数
+RELATED_EXCERPT_CHARS = 600     # 抜粋1件あたりの最大文字数
+RELATED_MIN_SCORE = 0.05        # これ未満の類似度の記事は関連なしとみなす
+RELATED_COMPACT_RATIO = 0.25    # 空き行がこの割合を超えたら行列を詰めて書き直す
+
+
+def hashed_ngram_vector(text, dimensions=RELATED_DIMENSIONS):
+    """本文の文字n-gramを符号付きハッシュで固定次元に集計したベクトル（頻度は対数で抑える）"""
+    import numpy as np
+    normalized = ''.join(unicodedata.normalize('NFKC', text).lower().split())
+    hashes = [
+        zlib.crc32(normalized[i:i + n].encode('utf-8'))
+        for n in RELATED_NGRAM_SIZES for i in range(len(normalized) - n + 1)
+    ]
+    if not hashes:
+        return np.zeros(dimensions, dtype=np.float32)
+    hashes = np.array(hashes, dtype=np.uint32)
+    signs = np.where(hashes >> 31, -1.0, 1.0)
+    counts = np.bincount(hashes % dimensions, weights=signs, minlength=dimensions)
+    return (np.sign(counts) * np.log1p(np.abs(counts))).astype(np.float32)
+
+
+def split_excerpts(content, max_chars=RELATED_EXCERPT_CHARS):
+    """本文を空行区切りの段落から最大max_chars文字の抜粋候補に分ける"""
+    excerpts, current = [], ''
+    for paragraph in re.split(r'\n\s*\n', content):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            excerpts.append(current)
+            current = ''
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+        while len(current) > max_chars:
+            excerpts.append(current[:max_chars])
+            current = current[max_chars:]
+    if current:
+        excerpts.append(current)
+    return excerpts
+
+
+class RelatedArticleIndex:
+    """記事フォルダ全体の関連記事検索用ベクトル索引（オフライン・NumPyの行列1つ）
+
+    1記事1行の行列を .npy に保存して起動時はメモリマップで開き、変更されたファイルの行だけを計算し直す。
+    書き込みも変わった行だけで、既存の行は .npy をその場で上書きし、新しい記事の行は追記用ファイル
+    （生のfloat32）の末尾に足す。削除された記事の行は空きにして次の新しい記事で使い回し、
+    空きが増えたときだけ行列全体を詰めて書き直す。
+    画面からは ``update_in_background`` でバックグラウンドのスレッドに更新させ、検索は更新を待たずに
+    その時点の行列で行う（全ファイルの読み込みとベクトル化でスクリプトスレッドを止めない）。
+    検索はIDFで重み付けしたコサイン類似度で、記事数によらず行列とベクトルの積1回で済む。
+    numpyは索引を使うときに初めて読み込む。
+    """
+
+    def __init__(self, matrix_path=None, dimensions=RELATED_DIMENSIONS):
+        self.matrix_path = Path(matrix_path) if matrix_path else DEFAULT_CACHE_DIR / 'related.npy'
+        self.meta_path = self.matrix_path.with_suffix('.json')
+        self.extra_path = self.matrix_path.with_suffix('.rows.f32')
+        self.dimensions = dimensions
+        self._lock = threading.Lock()
+        self._last_signature = None
+        self._weights = None  # (IDFの2乗, IDF重み付きの行ノルム) は行列が変わるまで使い回す
+        self._updater = None  # バックグラウンドで更新中のスレッド
+        self._pending_update = None  # 次に反映する (ファイル一覧, ジェネレーター)
+        self._load()
+
+    def _load(self):
+        """保存済みの行列をメモリマップで開く（メタデータと食い違う場合は空から作り直す）"""
+        import numpy as np
+        self._matrix = np.zeros((0, self.dimensions), dtype=np.float32)
+        self._rows = []  # 行番号ごとの記事キー（空き行は None）
+        self._docs = {}
+        self._base_rows = 0  # .npy に入っている行数（これより後ろの行は追記用ファイル）
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            rows = meta.get('rows', [])
+            base_rows = meta.get('base_rows', len(rows))
+            base = np.load(self.matrix_path, mmap_mode='r')
+            extra = None
+            if len(rows) > base_rows:
+                extra = np.memmap(self.extra_path, dtype=np.float32, mode='r',
+                                  shape=(len(rows) - base_rows, self.dimensions))
+        except (OSError, ValueError):
+            return
+        if base.shape != (base_rows, self.dimensions) or base.dtype != np.float32 or len(rows) < base_rows:
+            return
+        self._matrix = base if extra is None else np.concatenate([base, extra])
+        self._rows = rows
+        self._docs = meta['docs']
+        self._base_rows = base_rows
+
+    def __len__(self):
+        return len(self._docs)
+
+    def stale_files(self, md_files):
+        """ベクトルが古い（または未計算の）ファイルを返す"""
+        with self._lock:
+            versions = {key: doc['version'] for key, doc in self._docs.items()}
+        return [f for f in md_files if versions.get(f['relative_path']) != file_version_key(f)]
+
+    def update(self, md_files, generator):
+        """ファイル一覧に合わせて行列を差分更新し、計算し直した件数を返す"""
+        signature = tuple((f['relative_path'], file_version_key(f)) for f in md_files)
+        if signature == self._last_signature:
+            return 0
+        import numpy as np
+
+        stale = self.stale_files(md_files)
+        generator.prefetch_files(stale, wait_for_completion=True)
+
+        vectors = {}
+        new_docs = {}
+        for file in stale:
+            content = generator.read_file_content(file['path'], file.get('source', 'local'), sha=file.get('sha'))
+            if content.startswith('ファイル読み取りエラー'):
+                continue
+            vectors[file['relative_path']] = hashed_ngram_vector(f"{file['title']}\n{content}", self.dimensions)
+            new_docs[file['relative_path']] = {
+                'version': file_version_key(file),
+                'title': file['title'],
+                'path': file['path'],
+                'source': file.get('source', 'local'),
+                'sha': file.get('sha') or git_blob_sha(content.encode('utf-8')),
+            }
+
+        current_keys = {f['relative_path'] for f in md_files}
+        with self._lock:
+            slots = {key: i for i, key in enumerate(self._rows) if key is not None}
+            removed = [key for key in slots if key not in current_keys]
+            if not removed and not vectors:
+                self._last_signature = signature
+                return 0
+
+            rows = list(self._rows)
+            writes = {}  # 行番号 -> 書き込むベクトル
+            for key in removed:
+                slot = slots.pop(key)
+                rows[slot] = None
+                writes[slot] = np.zeros(self.dimensions, dtype=np.float32)  # 空き行は0にして検索にかからないようにする
+            free = [i for i, key in enumerate(rows) if key is None]
+            appended = []
+            for key, vector in vectors.items():
+                if key in slots:
+                    slot = slots[key]
+                elif free:
+                    slot = free.pop(0)
+                    rows[slot] = key
+                else:
+                    rows.append(key)
+                    appended.append(vector)
+                    continue
+                writes[slot] = vector
+
+            matrix = np.concatenate([np.asarray(self._matrix), np.asarray(appended, dtype=np.float32).reshape(-1, self.dimensions)])
+            for slot, vector in writes.items():
+                matrix[slot] = vector
+            docs = {key: new_docs.get(key) or self._docs[key] for key in rows if key is not None}
+
+            if not self._rows or len(free) > len(rows) * RELATED_COMPACT_RATIO:
+                live = [i for i, key in enumerate(rows) if key is not None]
+                self._save(matrix[live], [rows[i] for i in live], docs)
+            else:
+                self._save_rows(matrix, rows, docs, writes, len(appended))
+            self._last_signature = signature
+        return len(vectors)
+
+    def update_in_background(self, md_files, generator):
+        """差分更新をバックグラウンドのスレッドで始める（更新中なら、終わったあとに最新の一覧で更新し直す）"""
+        with self._lock:
+            self._pending_update = (md_files, generator)
+            if self._updater is None:
+                self._updater = threading.Thread(target=self._update_loop, name='sns-related-index', daemon=True)
+                self._updater.start()
+
+    @property
+    def is_updating(self):
+        return self._updater is not None
+
+    def _update_loop(self):
+        """依頼された最新の一覧がなくなるまで更新を続ける"""
+        while True:
+            with self._lock:
+                pending, self._pending_update = self._pending_update, None
+                if pending is None:
+                    self._updater = None
+                    return
+            try:
+                self.update(*pending)
+            except Exception:
+                pass  # 次の依頼でやり直す（検索は更新前の行列で続けられる）
+
+    def _save(self, matrix, rows, docs):
+        """行列全体を詰めて書き直す（.npy とメタデータを一時ファイル経由で置き換えてから開き直す）"""
+        import numpy as np
+        self._matrix = matrix
+        self._rows = rows
+        self._docs = docs
+        self._base_rows = len(rows)
+        self._weights = None
+        try:
+            self.matrix_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_matrix = tempfile.mkstemp(dir=self.matrix_path.parent, prefix=f'.{self.matrix_path.name}.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+                os.replace(tmp_matrix, self.matrix_path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_matrix)
+                except OSError:
+                    pass
+                raise
+            self._write_meta()
+            try:
+                os.unlink(self.extra_path)  # 追記していた行は .npy に取り込み済み
+            except FileNotFoundError:
+                pass
+            self._matrix = np.load(self.matrix_path, mmap_mode='r')
+        except OSError:
+            pass  # 保存できなくてもメモリ上の行列で検索は続けられる
+
+    def _save_rows(self, matrix, rows, docs, writes, appended_count):
+        """変わった行だけを書き込む（既存の行はその場で上書きし、新しい行は追記用ファイルの末尾に足す）
+
+        メタデータは最後に書き換えるので、途中で止まっても上書きした行は古いバージョンとして計算し直され、
+        追記した行はメタデータの行数より後ろにあるので読み込み時に無視される。
+        """
+        import numpy as np
+        base_rows = self._base_rows
+        stored_extra = len(self._rows) - base_rows
+        self._matrix = matrix
+        self._rows = rows
+        self._docs = docs
+        self._weights = None
+        try:
+            base_writes = sorted(slot for slot in writes if slot < base_rows)
+            if base_writes:
+                base = np.lib.format.open_memmap(self.matrix_path, mode='r+')
+                base[base_writes] = matrix[base_writes]
+                base.flush()
+                del base
+            extra_writes = sorted(slot for slot in writes if slot >= base_rows)
+            if extra_writes or appended_count:
+                row_bytes = self.dimensions * np.dtype(np.float32).itemsize
+                with open(os.open(self.extra_path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as f:
+                    for slot in extra_writes:
+                        f.seek((slot - base_rows) * row_bytes)
+                        f.write(matrix[slot].tobytes())
+                    f.truncate(stored_extra * row_bytes)  # メタデータに載らなかった書きかけの行を捨てる
+                    f.seek(stored_extra * row_bytes)
+                    f.write(np.ascontiguousarray(matrix[base_rows + stored_extra:]).tobytes())
+            self._write_meta()
+        except (OSError, ValueError):
+            pass  # 保存できなくてもメモリ上の行列で検索は続けられる
+
+    def _write_meta(self):
+        """行の並びと記事の情報をアトミックに書き込む"""
+        meta = {'rows': self._rows, 'docs': self._docs, 'base_rows': self._base_rows}
+        atomic_write_bytes(self.meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    def _idf_weights(self):
+        """IDFの2乗と、IDFで重み付けした各行のノルム（行列の更新後に一度だけ計算）"""
+        import numpy as np
+        if self._weights is None:
+            document_frequency = np.count_nonzero(self._matrix, axis=0)
+            idf = np.log((1 + len(self._docs)) / (1 + document_frequency)).astype(np.float32) + 1.0
+            idf_squared = idf * idf
+            row_norms = np.sqrt(np.square(self._matrix) @ idf_squared)
+            self._weights = (idf_squared, row_norms)
+        return self._weights
+
+    def search(self, query, limit=RELATED_TOP_K, exclude=()):
+        """クエリに近い記事を類似度順に返す"""
+        import numpy as np
+        with self._lock:
+            if not self._docs:
+                return []
+            query_vector = hashed_ngram_vector(query, self.dimensions)
+            idf_squared, row_norms = self._idf_weights()
+            query_norm = np.sqrt(np.square(query_vector) @ idf_squared)
+            if not query_norm:
+                return []
+            scores = (self._matrix @ (query_vector * idf_squared)) / (row_norms * query_norm + 1e-9)
+            order = np.argsort(-scores)
+            results = []
+            for i in order:
+                key = self._rows[i]
+                if scores[i] < RELATED_MIN_SCORE or len(results) >= limit:
+                    break
+                if key is None or key in exclude:
+                    continue
+                results.append(dict(self._docs[key], relative_path=key, score=float(scores[i])))
+            return results
+
+    def related_excerpts(self, query, generator, limit=RELATED_TOP_K, exclude=()):
+        """クエリに近い記事から、それぞれ最もクエリに近い段落を抜粋して返す"""
+        import numpy as np
+        query_vector = hashed_ngram_vector(query, self.dimensions)
+        references = []
+        for doc in self.search(query, limit, exclude):
+            content = generator.read_file_content(doc['path'], doc['source'], sha=doc['sha'] if doc['source'] == 'github' else None)
+            if content.startswith('ファイル読み取りエラー'):
+                continue
+            candidates = split_excerpts(content)
+            if not candidates:
+                continue
+            candidate_vectors = np.vstack([hashed_ngram_vector(text, self.dimensions) for text in candidates])
+            norms = np.linalg.norm(candidate_vectors, axis=1) + 1e-9
+            best = int(np.argmax(candidate_vectors @ query_vector / norms))
+            references.append({
+                'title': doc['title'],
+                'relative_path': doc['relative_path'],
+                'score': doc['score'],
+                'excerpt': candidates[best],
+            })
+        return references
+
+
+_shared_related_indexes = {}
+
+
+def get_related_index(source_key):
+    """プロセス内で共有する関連記事の索引をデータソースごとに取得"""
+    with _shared_search_index_lock:
+        if source_key not in _shared_related_indexes:
+            digest = hashlib.sha256(source_key.encode('utf-8')).hexdigest()[:12]
+            _shared_related_indexes[source_key] = RelatedArticleIndex(DEFAULT_CACHE_DIR / f'related_{digest}.npy')
+        return _shared_related_indexes[source_key]
+
+
+class PostStore:
+    """生成済みの投稿を (本文ハッシュ, プラットフォーム, タイトル, 設定ハッシュ) で保存するSQLiteストア
+
+    設定ハッシュ（``config_hash``）は platform_configs・ハッシュタグのルール・POST_GENERATOR_VERSION から
+    作るため、本文か生成ロジックが変わればキーが変わり、古い投稿は参照されなくなる（``prune_stale`` で削除）。
+    バッチ処理の複数プロセスから同時に書き込めるようWALモードで開く。
+    """
+
+    def __init__(self, db_path=None, max_rows=50000):
+        self.db_path = Path(db_path) if db_path else DEFAULT_CACHE_DIR / 'posts.sqlite'
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS posts (
+                    content_hash TEXT,
+                    platform TEXT,
+                    title TEXT,
+                    config_hash TEXT,
+                    post TEXT,
+                    created_at REAL,
+                    PRIMARY KEY (content_hash, platform, title, config_hash)
+                )"""
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS posts_created_at ON posts (created_at)')
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+
+    def get_posts(self, content_hash, platforms, title, config_hash):
+        """保存済みの投稿をプラットフォームごとに取得（1回の索引検索）"""
+        platforms = list(platforms)
+        if not platforms:
+            return {}
+        placeholders = ', '.join('?' * len(platforms))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT platform, post FROM posts
+                    WHERE content_hash = ? AND title = ? AND config_hash = ? AND platform IN ({placeholders})""",
+                (content_hash, title, config_hash, *platforms)
+            ).fetchall()
+        return dict(rows)
+
+    def put(self, content_hash, platform, title, config_hash, post):
+        """投稿を保存"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?, ?)',
+                (content_hash, platform, title, config_hash, post, time.time())
+            )
+
+    def get_or_create(self, generator, content, platform, title, content_hash=None, config_hash=None):
+        """保存済みの投稿を返し、なければ生成して保存"""
+        content_hash = content_hash or generator.parse_document(content).content_hash
+        config_hash = config_hash or generator.config_hash()
+        post = self.get_posts(content_hash, [platform], title, config_hash).get(platform)
+        if post is None:
+            post = generator.create_post(platform, content, title)
+            if not content.startswith('ファイル読み取りエラー'):  # 一時的な読み取り失敗は保存しない
+                self.put(content_hash, platform, title, config_hash, post)
+        return post
+
+    def prune_stale(self, config_hash):
+        """現在の設定と異なる設定ハッシュの投稿と、上限を超えた古い投稿を削除"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM posts WHERE config_hash != ?', (config_hash,))
+            self._conn.execute(
+                """DELETE FROM posts WHERE rowid IN (
+                    SELECT rowid FROM posts ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_rows,)
+            )
+
+
+_shared_post_store = None
+_shared_post_store_lock = threading.Lock()
+
+
+def get_post_store(config_hash=None):
+    """プロセス内で共有する投稿ストア（初回はconfig_hashと異なる古い投稿を削除）"""
+    global _shared_post_store
+    with _shared_post_store_lock:
+        if _shared_post_store is None:
+            _shared_post_store = PostStore()
+            if config_hash:
+                _shared_post_store.prune_stale(config_hash)
+        return _shared_post_store
+
+
+# OpenRouterの接続先（ローカルのスタブサーバーなどに差し替え可能）
+OPENROUTER_BASE_URL = os.environ.get('SNS_OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')
+
+# 記事生成のパラメータ
+ARTICLE_MAX_TOKENS = 3000
+ARTICLE_TEMPERATURE = 0.7
+
+# 記事ファイルからAIでSNS投稿を作るときのパラメータ
+POST_MAX_TOKENS = 800
+POST_TEMPERATURE = 0.7
+POST_SOURCE_MAX_CHARS = 8000  # プロンプトに含める本文の上限（超える場合は分割して要約してから使う）
+
+# 長い本文の分割要約（map-reduce）のパラメータ
+MAP_CHUNK_MAX_CHARS = 6000
+MAP_SUMMARY_MAX_TOKENS = 500
+MAP_TEMPERATURE = 0.3
+MAP_CONCURRENCY = 16
+
+
+def split_markdown_sections(content, max_chars=MAP_CHUNK_MAX_CHARS):
+    """Markdownを見出し（extract_key_pointsと同じ#行）で区切り、max_chars以下のチャンクにまとめる
+
+    短い節は前の節とつなげ、見出しのない長い節は文字数で分割する。
+    """
+    sections, current = [], []
+    for line in content.split('\n'):
+        if current and classify_line(line.strip()) == 'heading':
+            sections.append('\n'.join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append('\n'.join(current))
+
+    chunks, buffer = [], ''
+    for section in sections:
+        for start in range(0, max(len(section), 1), max_chars):
+            piece = section[start:start + max_chars]
+            if buffer and len(buffer) + len(piece) + 1 > max_chars:
+                chunks.append(buffer)
+                buffer = piece
+            else:
+                buffer = f"{buffer}\n{piece}" if buffer else piece
+    if buffer.strip():
+        chunks.append(buffer)
+    return chunks
+
+
+CANCEL_POLL_INTERVAL = 0.2  # 中止の確認間隔（秒）
+
+
+class GenerationCancelled(Exception):
+    """生成が中止された"""
+
+
+async def run_until_cancelled(coro, cancel_event=None, poll_interval=CANCEL_POLL_INTERVAL):
+    """コルーチンを実行し、cancel_eventがセットされたら実行中のリクエストごと打ち切る"""
+    task = asyncio.ensure_future(coro)
+    if cancel_event is None:
+        return await task
+    while not task.done():
+        if cancel_event.is_set():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise GenerationCancelled()
+        await asyncio.wait({task}, timeout=poll_interval)
+    return task.result()
+
+# OpenRouterに応答のusageへ費用（credits）を含めてもらう
+OPENROUTER_USAGE_BODY = {"usage": {"include": True}}
+
+# モデルごとのストリーミング計測結果（直近のみ保持）
+STREAM_METRICS_HISTORY = 20
+_stream_metrics = {}
+_stream_metrics_lock = threading.Lock()
+
+
+def record_stream_metrics(model, started, first_token_at, finished, tokens):
+    """ストリーミング1回分の初回トークンまでの時間とトークン/秒を記録"""
+    generation_seconds = finished - first_token_at
+    sample = {
+        'time_to_first_token': first_token_at - started,
+        'tokens': tokens,
+        'tokens_per_sec': tokens / generation_seconds if generation_seconds > 0 else 0.0,
+        'total_seconds': finished - started,
+    }
+    with _stream_metrics_lock:
+        history = _stream_metrics.setdefault(model, [])
+        history.append(sample)
+        del history[:-STREAM_METRICS_HISTORY]
+
+
+def get_stream_metrics(model):
+    """モデルごとのストリーミング計測結果（平均値）を取得"""
+    with _stream_metrics_lock:
+        history = list(_stream_metrics.get(model, []))
+    if not history:
+        return None
+    return {
+        'samples': len(history),
+        'time_to_first_token': sum(h['time_to_first_token'] for h in history) / len(history),
+        'tokens_per_sec': sum(h['tokens_per_sec'] for h in history) / len(history),
+        'last': history[-1],
+    }
+
+
+def resolve_openrouter_api_key():
+    """Streamlit SecretsまたはAPI Key入力からOpenRouterのAPIキーを取得"""
+    api_key = get_secret('OPENROUTER_API_KEY')
+    if not api_key and 'openrouter_api_key' in st.session_state:
+        api_key = st.session_state['openrouter_api_key']
+    return api_key
+
+
+class LLMResponseCache:
+    """LLMの応答をSQLiteに保存するキャッシュ（TTL・サイズ上限・同時リクエストの集約付き）
+
+    同じキーの生成が実行中なら、後から来た呼び出しは新たにAPIを呼ばずにその結果を待つ。
+    """
+
+    def __init__(self, db_path=None, ttl_seconds=7 * 24 * 3600, max_bytes=50 * 1024 * 1024):
+        self.db_path = Path(db_path) if db_path else DEFAULT_CACHE_DIR / 'llm_responses.sqlite'
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> {'event', 'result', 'error'}
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    content TEXT,
+                    size INTEGER,
+                    created_at REAL,
+                    last_access REAL
+                )"""
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+
+    @staticmethod
+    def make_key(model, prompt, temperature, max_tokens):
+        """(モデル, プロンプト, temperature, max_tokens) からキャッシュキーを作成"""
+        payload = json.dumps([model, prompt, temperature, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """有効期限内の応答を取得（なければNone）"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT content, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                return None
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            return row[0]
+
+    def put(self, key, model, content):
+        """応答を保存し、サイズ上限を超えたら古いものから削除"""
+        now = time.time()
+        size = len(content.encode('utf-8'))
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model, content, size, now, now)
+            )
+            self._conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl_seconds,))
+            total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._conn.execute('SELECT key, size FROM responses ORDER BY last_access').fetchall()
+                for old_key, old_size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (old_key,))
+                    total -= old_size
+
+    def get_or_generate(self, key, model, producer, use_cache=True):
+        """キャッシュを確認し、なければproducer()で生成して保存（同じキーの同時実行は1回に集約）
 
-    def create_twitter_post(self, content, title):
-        """Twitter用投稿作成"""
-        key_points = self.extract_key_points(content)
-        
-        # タイトルから主要テーマを抽出
-        main_theme = title.split('_')[0] if '_' in title else title[:20]
-        
-        # ハッシュタグを抽出・生成
-        hashtags = []
-        if 'AI' in content.upper():
-            hashtags.append('#AI活用')
-        if '事務' in content or '業務' in content:
-            hashtags.append('#業務効率化')
-        if 'SNS' in content.upper():
-            hashtags.append('#SNS運用')
-        
-        # 3個まで制限
-        hashtags = hashtags[:3]
-        hashtag_text = ' '.join(hashtags)
-        
-        # メイン文章作成（ハッシュタグを除いた文字数で制限）
-        char_limit = 280 - len(hashtag_text) - 5  # 余白を考慮
-        
-        if key_points:
-            main_text = f"{main_theme}について、{key_points[0][:50]}..."
-        else:
-            main_text = f"{main_theme}について書きました！"
-        
-        # 文字数調整
-        if len(main_text) > char_limit:
-            main_text = main_text[:char_limit-3] + "..."
-        
-        tweet = f"{main_text}\n\n{hashtag_text}"
-        
-        return tweet
+        use_cache=False の場合はキャッシュを読まずに生成し直し、結果で上書きする。
+        producer() が例外を投げた場合は保存せず、待っていた呼び出しにも同じ例外を返す。
+        """
+        if use_cache:
+            cached = self.get(key)
+            if cached is not None:
+                return cached
 
-    def create_linkedin_post(self, content, title):
-        """LinkedIn用投稿作成"""
-        key_points = self.extract_key_points(content)
-        
-        # プロフェッショナルな導入
-        intro = f"【{title.replace('_', ' ')}】\n\n"
-        
-        # 主要ポイントを箇条書きで
-        main_content = "主要なポイント：\n"
-        for i, point in enumerate(key_points[:5], 1):
-            clean_point = re.sub(r'^[#\-\*\•✔️]+\s*', '', point)
-            if clean_point:
-                main_content += f"• {clean_point[:100]}\n"
-        
-        # クロージング
-        closing = "\n皆様の業務効率化や働き方改善の参考になれば幸いです。"
-        
-        # ハッシュタグ
-        hashtags = "\n\n#働き方改革 #DX #業務効率化 #AI活用 #キャリアデザイン"
-        
-        post = intro + main_content + closing + hashtags
-        
-        # 文字数制限
-        if len(post) > 1300:
-            post = post[:1297] + "..."
-        
-        return post
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = {'event': threading.Event(), 'result': None, 'error': None}
+                self._inflight[key] = flight
 
-    def create_note_intro(self, content, title):
-        """note用導入文作成"""
-        key_points = self.extract_key_points(content)
-        
-        # タイトル改善
-        clean_title = title.replace('_', ' ').replace('【', '').replace('】', '')
-        
-        # 導入文作成
-        if key_points:
-            first_point = re.sub(r'^[#\-\*\•✔️]+\s*', '', key_points[0])
-            intro = f"こんにちは！\n\n{first_point[:80]}...\n\nこのような経験から、今回は{clean_title}について詳しくお話しします。"
-        else:
-            intro = f"こんにちは！\n\n今回は「{clean_title}」について、私の実体験を交えながらお話しします。"
-        
-        # ハッシュタグ
-        hashtags = "\n\n#働き方 #AI #業務効率化 #キャリア #フリーランス"
-        
-        note_post = intro + hashtags
-        
-        return note_post
+        if not leader:
+            flight['event'].wait()
+            if flight['error'] is not None:
+                raise flight['error']
+            return flight['result']
+
+        try:
+            result = producer()
+            flight['result'] = result
+            self.put(key, model, result)
+            return result
+        except Exception as e:
+            flight['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight['event'].set()
+
+
+_shared_llm_cache = None
+_shared_llm_cache_lock = threading.Lock()
+
+
+def get_llm_response_cache():
+    """プロセス内で共有するLLM応答キャッシュを取得"""
+    global _shared_llm_cache
+    with _shared_llm_cache_lock:
+        if _shared_llm_cache is None:
+            _shared_llm_cache = LLMResponseCache()
+        return _shared_llm_cache
 
 
 class AIArticleGenerator:
-    def __init__(self):
+    def __init__(self, response_cache=None, api_key=None):
         self.available_models = self.get_available_models()
-        self.client = None
-        self.init_openrouter()
+        self.api_key = None
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._response_cache = response_cache
+        self.init_openrouter(api_key)
     
-    def init_openrouter(self):
-        """OpenRouterクライアントを初期化"""
+    def init_openrouter(self, api_key=None):
+        """OpenRouterのAPIキーを設定（クライアントは最初の生成時に作成）"""
         if not OPENAI_AVAILABLE:
             return
         
-        # Streamlit SecretsまたはAPI Key入力から取得
-        api_key = None
-        if hasattr(st, 'secrets') and 'OPENROUTER_API_KEY' in st.secrets:
-            api_key = st.secrets['OPENROUTER_API_KEY']
-        elif 'openrouter_api_key' in st.session_state:
-            api_key = st.session_state['openrouter_api_key']
+        # 指定がなければStreamlit SecretsまたはAPI Key入力から取得
+        api_key = api_key or resolve_openrouter_api_key()
             
         if api_key:
-            self.client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=api_key,
-            )
+            self.api_key = api_key
+            self._client = None
+
+    @property
+    def client(self):
+        """OpenRouterクライアント（初回アクセス時にopenaiを読み込んで作成・APIキーがなければNone）"""
+        if self._client is None and self.api_key:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = load_openai().OpenAI(
+                        base_url=OPENROUTER_BASE_URL,
+                        api_key=self.api_key,
+                    )
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        """作成済みのクライアントを使う（接続先を差し替えるテストやベンチマーク用）"""
+        self._client = client
+
+    @property
+    def response_cache(self):
+        """LLM応答キャッシュ（指定がなければ最初に使うときに共有のものを開く）"""
+        if self._response_cache is None:
+            self._response_cache = get_llm_response_cache()
+        return self._response_cache
     
     def get_available_models(self):
         """利用可能なOpenRouterモデルを取得"""
@@ -318,11 +3539,11 @@ class AIArticleGenerator:
             "openai/gpt-3.5-turbo"
         ]
     
-    def generate_article(self, topic, model='deepseek/deepseek-r1-0528:free', article_type='blog', target_length=1000):
-        """AIを使って記事を生成"""
-        if not self.client:
-            return "❌ OpenRouter APIキーが設定されていません。"
-        
+    def build_article_prompt(self, topic, article_type='blog', target_length=1000, source=None, references=None):
+        """記事タイプに応じたプロンプトを作成
+
+        sourceを渡すと元記事の要点を素材として添え、referencesを渡すと過去記事の抜粋を参考として添える。
+        """
         # プロンプトテンプレート
         prompts = {
             'blog': f"""
@@ -367,20 +3588,770 @@ noteらしい温かみのある記事をお願いします。日本語で回答
         }
         
         prompt = prompts.get(article_type, prompts['blog'])
+        if source:
+            prompt += f"""
+以下の元記事の内容を素材にしてください。元記事にない事実は付け加えないでください。
+
+元記事:
+{source}
+"""
+        if references:
+            excerpts = '\n\n'.join(f"【{reference['title']}】\n{reference['excerpt']}" for reference in references)
+            prompt += f"""
+以下は過去に書いた関連記事の抜粋です。文体や具体例の参考にし、同じ内容の繰り返しは避けてください。
+
+{excerpts}
+"""
+        return prompt
+
+    def build_post_prompt(self, platform, config, title, content):
+        """記事本文とplatform_configsの制約からSNS投稿用のプロンプトを作成"""
+        candidates = ' '.join(config.get('base_hashtags', [])) or 'なし'
+        return f"""
+あなたはSNS運用の専門家です。以下の記事をもとに、{platform}に投稿する文章を書いてください。
+
+記事タイトル: {title}
+
+投稿の条件:
+- 文字数: ハッシュタグを含めて{config['max_chars']}文字以内
+- トーン: {config['tone']}
+- 形式: {config['format']}
+- ハッシュタグ: {config['hashtag_limit']}個まで（候補: {candidates}）
+
+投稿する文章だけを日本語で出力してください。
+
+記事本文:
+{content[:POST_SOURCE_MAX_CHARS]}
+"""
+
+    def build_chunk_summary_prompt(self, title, index, total, chunk):
+        """分割した本文の1チャンクを要約するプロンプトを作成"""
+        return f"""
+以下は「{title}」という記事の一部（{index}/{total}）です。
+この部分の要点を、具体例・数字・体験談を残したまま日本語の箇条書きで簡潔にまとめてください。
+
+{chunk}
+"""
+
+    async def _summarize_chunk_async(self, client, semaphore, model, prompt, use_cache=True, throttle=None):
+        """1チャンク分の要約（mapの1回分）"""
+        cache_key = LLMResponseCache.make_key(model, prompt, MAP_TEMPERATURE, MAP_SUMMARY_MAX_TOKENS)
+        cached = self.response_cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            return cached
+        async with semaphore:
+            if throttle is not None:
+                await throttle()
+            with get_tracer().span('llm.map', model=model) as span:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=MAP_SUMMARY_MAX_TOKENS,
+                    temperature=MAP_TEMPERATURE,
+                    extra_body=OPENROUTER_USAGE_BODY
+                )
+                span.set(**usage_attrs(response.usage))
+        summary = (response.choices[0].message.content or "").strip()
+        if not summary:
+            raise ValueError("要約が空の応答でした")
+        self.response_cache.put(cache_key, model, summary)
+        return summary
+
+    async def condense_document_async(self, client, model, title, content, use_cache=True,
+                                      max_concurrency=MAP_CONCURRENCY, throttle=None):
+        """長い本文を見出しごとに分割して並列に要約し、要約をつないだものを返す（短い本文はそのまま）
+
+        チャンクの要約は同時に実行するので、所要時間はおおよそ1チャンク分の要約で済む。
+        throttle は各リクエストの直前に待つ非同期関数（呼び出し側のレート制限用）。
+        """
+        if len(content) <= POST_SOURCE_MAX_CHARS:
+            return content
+        chunks = split_markdown_sections(content)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        summaries = await asyncio.gather(*(
+            self._summarize_chunk_async(
+                client, semaphore, model,
+                self.build_chunk_summary_prompt(title, index, len(chunks), chunk),
+                use_cache, throttle
+            )
+            for index, chunk in enumerate(chunks, 1)
+        ))
+        return '\n\n'.join(f"【パート{index}】\n{summary}" for index, summary in enumerate(summaries, 1))
+
+    async def generate_post_async(self, client, model, platform, config, title, content, use_cache=True,
+                                  throttle=None):
+        """1記事・1プラットフォーム分の投稿をAIで生成（失敗時は例外を投げる）
+
+        長い本文は先に分割要約（map）してから投稿を作る（reduce）。
+        戻り値は ``{'content', 'cached', 'prompt_tokens', 'completion_tokens', 'cost'}``。
+        """
+        content = await self.condense_document_async(client, model, title, content, use_cache, throttle=throttle)
+        prompt = self.build_post_prompt(platform, config, title, content)
+        cache_key = LLMResponseCache.make_key(model, prompt, POST_TEMPERATURE, POST_MAX_TOKENS)
+        cached = self.response_cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            return {'content': cached, 'cached': True}
+
+        with get_tracer().span('llm.post', model=model, platform=platform) as span:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=POST_MAX_TOKENS,
+                temperature=POST_TEMPERATURE,
+                extra_body=OPENROUTER_USAGE_BODY
+            )
+            usage = usage_attrs(response.usage)
+            span.set(**usage)
+        post = (response.choices[0].message.content or "").strip()
+        if not post:
+            raise ValueError("空の応答が返されました")
+        self.response_cache.put(cache_key, model, post)
+        return dict(usage, content=post, cached=False)
+
+    def _response_cache_key(self, model, prompt):
+        """記事生成リクエストのキャッシュキー"""
+        return LLMResponseCache.make_key(model, prompt, ARTICLE_TEMPERATURE, ARTICLE_MAX_TOKENS)
+
+    def generate_article(self, topic, model='deepseek/deepseek-r1-0528:free', article_type='blog', target_length=1000,
+                         use_cache=True, references=None):
+        """AIを使って記事を生成（use_cache=Falseで再生成・referencesは参考にする過去記事の抜粋）"""
+        if not self.client:
+            return "❌ OpenRouter APIキーが設定されていません。"
+        
+        prompt = self.build_article_prompt(topic, article_type, target_length, references=references)
+        
+        def request_article():
+            with get_tracer().span('llm.request', model=model) as span:
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=ARTICLE_MAX_TOKENS,
+                    temperature=ARTICLE_TEMPERATURE,
+                    extra_body=OPENROUTER_USAGE_BODY
+                )
+                span.set(**usage_attrs(response.usage))
+            content = response.choices[0].message.content
+            if not content:
+                raise ValueError("空の応答が返されました")
+            return content
         
+        # キャッシュ命中も含めた記事生成全体と、実際のAPI呼び出し（llm.request）を分けて測る
+        with get_tracer().span('llm', model=model):
+            try:
+                return self.response_cache.get_or_generate(
+                    self._response_cache_key(model, prompt), model, request_article, use_cache=use_cache
+                )
+            except Exception as e:
+                return f"❌ 記事生成エラー: {str(e)}"
+
+    def generate_article_stream(self, topic, model='deepseek/deepseek-r1-0528:free', article_type='blog',
+                                target_length=1000, cancel_event=None, use_cache=True, references=None):
+        """AIを使って記事を生成し、届いたテキストから順に返す（ストリーミング）"""
+        if not self.client:
+            yield "❌ OpenRouter APIキーが設定されていません。"
+            return
+
+        prompt = self.build_article_prompt(topic, article_type, target_length, references=references)
+        cache_key = self._response_cache_key(model, prompt)
+        if use_cache:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        received = []
+        completed = False
+        started = time.perf_counter()
+        first_token_at = None
+        chunk_count = 0
+        completion_tokens = None
+        usage = None
+        stream = None
         try:
-            response = self.client.chat.completions.create(
+            stream = self.client.chat.completions.create(
                 model=model,
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=3000,
-                temperature=0.7
+                max_tokens=ARTICLE_MAX_TOKENS,
+                temperature=ARTICLE_TEMPERATURE,
+                stream=True,
+                stream_options={"include_usage": True},
+                extra_body=OPENROUTER_USAGE_BODY
+            )
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                if getattr(chunk, 'usage', None) and chunk.usage.completion_tokens:
+                    completion_tokens = chunk.usage.completion_tokens
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue  # 推論モデルの思考部分など本文以外のデルタ
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                chunk_count += 1
+                received.append(text)
+                yield text
+            else:
+                completed = bool(received)
+        except Exception as e:
+            yield f"\n\n❌ 記事生成エラー: {str(e)}"
+        finally:
+            # 中止（キャンセルやStreamlitの再実行）でも接続を閉じて計測を残す
+            if stream is not None:
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+            finished = time.perf_counter()
+            if first_token_at is not None:
+                record_stream_metrics(model, started, first_token_at, finished,
+                                      completion_tokens or chunk_count)
+            get_tracer().record(
+                'llm.stream', finished - started, model=model, completed=completed,
+                time_to_first_token=first_token_at - started if first_token_at is not None else None,
+                **usage_attrs(usage)
             )
-            return response.choices[0].message.content
+            # 最後まで受信できた場合のみキャッシュに保存
+            if completed:
+                self.response_cache.put(cache_key, model, ''.join(received))
+
+    async def _generate_article_async(self, client, semaphore, topic, model, article_type, target_length, timeout,
+                                      use_cache=True, references=None):
+        """1モデル分の記事を非同期に生成（タイムアウト付き）"""
+        prompt = self.build_article_prompt(topic, article_type, target_length, references=references)
+        cache_key = self._response_cache_key(model, prompt)
+        cached = self.response_cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            return {'model': model, 'content': cached, 'error': None, 'seconds': 0.0, 'cached': True}
+        async with semaphore:
+            started = time.perf_counter()
+            usage = None
+            try:
+                response = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=model,
+                        messages=[
+                            {"role": "user", "content": prompt}
+                        ],
+                        max_tokens=ARTICLE_MAX_TOKENS,
+                        temperature=ARTICLE_TEMPERATURE,
+                        extra_body=OPENROUTER_USAGE_BODY
+                    ),
+                    timeout=timeout
+                )
+                usage = response.usage
+                content = response.choices[0].message.content or ""
+                error = None if content.strip() else "空の応答が返されました"
+                if error is None:
+                    self.response_cache.put(cache_key, model, content)
+            except asyncio.TimeoutError:
+                content, error = "", f"{timeout}秒以内に応答がありませんでした"
+            except Exception as e:
+                content, error = "", str(e)
+            get_tracer().record('llm.request', time.perf_counter() - started, model=model, error=error,
+                                **usage_attrs(usage))
+        return {
+            'model': model,
+            'content': content,
+            'error': error,
+            'seconds': time.perf_counter() - started,
+            'cached': False
+        }
+
+    async def generate_articles_concurrently_async(self, topic, models, article_type='blog', target_length=1000,
+                                                   mode='all', timeout=90, max_concurrency=4, use_cache=True,
+                                                   references=None):
+        """同じトピックを複数モデルへ同時に送信
+
+        mode='all' は全モデルの結果をモデル順で返し、mode='first' は最初に成功した1件だけを返して
+        残りのリクエストをキャンセルする。
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        async with load_openai().AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=self.api_key) as client:
+            tasks = [
+                asyncio.create_task(self._generate_article_async(
+                    client, semaphore, topic, model, article_type, target_length, timeout, use_cache, references
+                ))
+                for model in models
+            ]
+            if mode != 'first':
+                return list(await asyncio.gather(*tasks))
+
+            failures = []
+            pending = set(tasks)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        result = task.result()
+                        if result['error'] is None:
+                            return [result]
+                        failures.append(result)
+                return failures
+            finally:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def generate_from_document_async(self, title, content, model, target='article', platform_config=None,
+                                           article_type='blog', target_length=1000, use_cache=True):
+        """元記事の本文から記事（target='article'）またはSNS投稿（target=プラットフォーム名）を生成"""
+        async with load_openai().AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=self.api_key) as client:
+            if target != 'article':
+                result = await self.generate_post_async(client, model, target, platform_config, title, content,
+                                                        use_cache)
+                return result['content']
+
+            source = await self.condense_document_async(client, model, title, content, use_cache)
+            prompt = self.build_article_prompt(title, article_type, target_length, source=source)
+            cache_key = self._response_cache_key(model, prompt)
+            cached = self.response_cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                return cached
+            with get_tracer().span('llm.reduce', model=model) as span:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=ARTICLE_MAX_TOKENS,
+                    temperature=ARTICLE_TEMPERATURE,
+                    extra_body=OPENROUTER_USAGE_BODY
+                )
+                span.set(**usage_attrs(response.usage))
+            article = response.choices[0].message.content
+            if not article:
+                raise ValueError("空の応答が返されました")
+            self.response_cache.put(cache_key, model, article)
+            return article
+
+    def generate_from_document(self, title, content, model, target='article', platform_config=None,
+                               article_type='blog', target_length=1000, use_cache=True, cancel_event=None):
+        """元記事からの生成（同期呼び出し用のラッパー・長い本文は分割要約してから生成）
+
+        cancel_eventがセットされたら、要約（map）と生成（reduce）の途中でも打ち切る。
+        """
+        if not self.client:
+            return "❌ OpenRouter APIキーが設定されていません。"
+        try:
+            return asyncio.run(run_until_cancelled(self.generate_from_document_async(
+                title, content, model, target, platform_config, article_type, target_length, use_cache
+            ), cancel_event))
+        except GenerationCancelled:
+            return "❌ 生成を中止しました。"
         except Exception as e:
             return f"❌ 記事生成エラー: {str(e)}"
 
+    def generate_articles_concurrently(self, topic, models, article_type='blog', target_length=1000,
+                                       mode='all', timeout=90, max_concurrency=4, use_cache=True, references=None):
+        """複数モデルでの同時生成（同期呼び出し用のラッパー）"""
+        if not self.client:
+            return [{'model': model, 'content': '', 'error': "OpenRouter APIキーが設定されていません。", 'seconds': 0.0}
+                    for model in models]
+        return asyncio.run(self.generate_articles_concurrently_async(
+            topic, models, article_type, target_length, mode, timeout, max_concurrency, use_cache, references
+        ))
+
+
+# 記事生成ジョブのワーカー数とモデルごとの同時実行数（環境変数で変更可能）
+JOB_WORKERS = int(os.environ.get('SNS_JOB_WORKERS', 4))
+JOB_MODEL_CONCURRENCY = int(os.environ.get('SNS_JOB_MODEL_CONCURRENCY', 2))
+JOB_PROGRESS_INTERVAL = 0.5  # 生成途中の文章をDBに書き出す間隔（秒）
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+
+class GenerationJobQueue:
+    """記事生成をStreamlitのスクリプトスレッドから切り離して実行する、SQLite永続のジョブキュー
+
+    ``submit`` はジョブIDを返すだけで、生成はワーカースレッドが行う。状態・途中経過・結果はDBに
+    保存するので、再実行や再接続のあとでもジョブIDから取得できる。モデルごとの同時実行数は
+    ``model_concurrency`` で制限し、空きのないモデルのジョブは後回しにして他のモデルのジョブを先に実行する。
+    同じLLMリクエストになるジョブ（記事はLLM応答キャッシュのキーが同じもの）が待機中・実行中なら、
+    後から投入されたものは新しく実行せずにそのジョブに相乗りする（APIキーのないジョブは失敗するだけなので、
+    相乗りの対象にしない）。APIキーはDBに保存せず、投入したプロセスのメモリ上でだけジョブと対応づける。
+    """
+
+    def __init__(self, db_path=None, workers=JOB_WORKERS, model_concurrency=JOB_MODEL_CONCURRENCY,
+                 fallback_generator=None):
+        self.db_path = Path(db_path) if db_path else DEFAULT_CACHE_DIR / 'jobs.sqlite'
+        self.model_concurrency = model_concurrency
+        self.fallback_generator = fallback_generator  # プロセス再起動で引き継いだジョブ用
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._generators = {}     # job_id -> AIArticleGenerator
+        self._cancel_events = {}  # job_id -> threading.Event
+        self._running_models = {}  # model -> 実行中の件数
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT,
+                    model TEXT,
+                    params TEXT,
+                    status TEXT,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    request_key TEXT,
+                    waiters INTEGER DEFAULT 1
+                )"""
+            )
+            # 相乗り用の列がない古いDBに列を追加
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+            if 'request_key' not in columns:
+                self._conn.execute('ALTER TABLE jobs ADD COLUMN request_key TEXT')
+                self._conn.execute('ALTER TABLE jobs ADD COLUMN waiters INTEGER DEFAULT 1')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_request_key ON jobs (request_key, status)')
+            # 前回のプロセスが実行中のまま終了したジョブはやり直す
+            self._conn.execute("UPDATE jobs SET status = 'queued', progress = '' WHERE status = 'running'")
+            self._conn.execute('DELETE FROM jobs WHERE created_at < ?', (time.time() - JOB_RETENTION_SECONDS,))
+        self._threads = [
+            threading.Thread(target=self._worker_loop, name=f'sns-job-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @staticmethod
+    def request_key(ai_generator, kind, model, params):
+        """ジョブが送るLLMリクエストのキー（記事はLLM応答キャッシュと同じキー）"""
+        if kind == 'article' and ai_generator is not None:
+            prompt = ai_generator.build_article_prompt(
+                params['topic'], params.get('article_type', 'blog'), params.get('target_length', 1000),
+                references=params.get('references')
+            )
+            return ai_generator._response_cache_key(model, prompt)
+        payload = {name: value for name, value in params.items() if name != 'use_cache'}
+        return hashlib.sha256(
+            json.dumps([kind, model, payload], ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    def submit(self, ai_generator, kind, model, params):
+        """ジョブを登録してIDを返す（kindは 'article' または 'document'）
+
+        同じリクエストのジョブが待機中・実行中ならそのジョブのIDを返す。APIキーのない投入は
+        （すぐにエラーで終わるため）相乗りせず、他の投入からも相乗りされないよう、キーなしで登録する。
+        """
+        has_api_key = ai_generator is not None and ai_generator.client is not None
+        request_key = self.request_key(ai_generator, kind, model, params) if has_api_key else None
+        with self._wakeup:
+            row = self._conn.execute(
+                "SELECT id, status FROM jobs WHERE request_key = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (request_key, *JOB_ACTIVE_STATUSES)
+            ).fetchone() if request_key else None
+            if row is not None:
+                with self._conn:
+                    self._conn.execute('UPDATE jobs SET waiters = waiters + 1 WHERE id = ?', (row['id'],))
+                if row['status'] == 'queued' and self._generators.get(row['id']) is None:
+                    self._generators[row['id']] = ai_generator
+                return row['id']
+            job_id = uuid.uuid4().hex
+            self._generators[job_id] = ai_generator
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, kind, model, params, status, progress, created_at, request_key, waiters) "
+                    "VALUES (?, ?, ?, ?, 'queued', '', ?, ?, 1)",
+                    (job_id, kind, model, json.dumps(params, ensure_ascii=False), time.time(), request_key)
+                )
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """ジョブの状態を取得（なければNone）"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            if job['status'] == 'queued':
+                job['queue_position'] = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (job['created_at'],)
+                ).fetchone()[0] + 1
+        job['params'] = json.loads(job['params'])
+        return job
+
+    def cancel(self, job_id):
+        """ジョブを中止（待機中ならすぐに、実行中なら受信済みの部分を残して止める）
+
+        他の呼び出し元も相乗りしているジョブは止めずに待ち数だけ減らし、Falseを返す。
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT waiters FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is not None and (row['waiters'] or 1) > 1:
+                self._conn.execute('UPDATE jobs SET waiters = waiters - 1 WHERE id = ?', (job_id,))
+                return False
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            self._generators.pop(job_id, None)  # 待機中に中止したジョブはワーカーに取り出されない
+            event = self._cancel_events.get(job_id)
+            if event is not None:
+                event.set()
+            return True
+
+    def counts(self):
+        """状態ごとのジョブ数"""
+        with self._lock:
+            return dict(self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def _claim(self):
+        """同時実行数に空きのあるモデルのジョブを古い順に1件取り出す（ロック内で呼ぶ）"""
+        rows = self._conn.execute(
+            "SELECT id, kind, model, params FROM jobs WHERE status = 'queued' ORDER BY created_at"
+        ).fetchall()
+        for row in rows:
+            if self._running_models.get(row['model'], 0) >= self.model_concurrency:
+                continue
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), row['id'])
+                )
+            self._running_models[row['model']] = self._running_models.get(row['model'], 0) + 1
+            self._cancel_events[row['id']] = threading.Event()
+            return dict(row, params=json.loads(row['params']), generator=self._generators.pop(row['id'], None))
+        return None
+
+    def _worker_loop(self):
+        """ジョブを取り出して実行し続ける"""
+        while True:
+            with self._wakeup:
+                job = self._claim()
+                while job is None:
+                    self._wakeup.wait(timeout=5)
+                    job = self._claim()
+            try:
+                self._run(job)
+            except Exception as e:
+                self._finish(job['id'], 'error', error=str(e))
+            finally:
+                with self._wakeup:
+                    self._running_models[job['model']] -= 1
+                    self._cancel_events.pop(job['id'], None)
+                    self._generators.pop(job['id'], None)
+                    self._wakeup.notify_all()
+
+    def _update(self, job_id, **fields):
+        """ジョブの列を更新"""
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        self._update(job_id, status=status, result=result, error=error, finished_at=time.time())
+
+    def _run(self, job):
+        """1件のジョブを実行して結果を保存"""
+        ai = job['generator'] or self.fallback_generator
+        if ai is None or not ai.client:
+            self._finish(job['id'], 'error', error="OpenRouter APIキーが設定されていないため実行できません")
+            return
+        params = job['params']
+        cancel_event = self._cancel_events[job['id']]
+
+        if job['kind'] == 'document':
+            result = ai.generate_from_document(
+                params['title'], params['content'], job['model'],
+                target=params.get('target', 'article'),
+                platform_config=params.get('platform_config'),
+                article_type=params.get('article_type', 'blog'),
+                target_length=params.get('target_length', 1000),
+                use_cache=params.get('use_cache', True),
+                cancel_event=cancel_event
+            )
+            if cancel_event.is_set():
+                self._finish(job['id'], 'cancelled')
+            elif result.startswith('❌'):
+                self._finish(job['id'], 'error', error=result)
+            else:
+                self._finish(job['id'], 'done', result=result)
+            return
+
+        received, error = [], None
+        last_flush = time.monotonic()
+        for text in ai.generate_article_stream(
+            topic=params['topic'],
+            model=job['model'],
+            article_type=params.get('article_type', 'blog'),
+            target_length=params.get('target_length', 1000),
+            cancel_event=cancel_event,
+            use_cache=params.get('use_cache', True),
+            references=params.get('references')
+        ):
+            if text.lstrip().startswith('❌'):
+                error = text.strip()
+                continue
+            received.append(text)
+            if time.monotonic() - last_flush >= JOB_PROGRESS_INTERVAL:
+                self._update(job['id'], progress=''.join(received))
+                last_flush = time.monotonic()
+        result = ''.join(received)
+        if cancel_event.is_set():
+            self._finish(job['id'], 'cancelled', result=result)
+        elif error:
+            self._finish(job['id'], 'error', result=result, error=error)
+        else:
+            self._finish(job['id'], 'done', result=result)
+
+
+_shared_job_queue = None
+_shared_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """プロセス内で共有する記事生成ジョブキュー（初回呼び出しでワーカーを起動）"""
+    global _shared_job_queue
+    with _shared_job_queue_lock:
+        if _shared_job_queue is None:
+            api_key = get_secret('OPENROUTER_API_KEY') or os.environ.get('OPENROUTER_API_KEY')
+            with get_tracer().span('init.job_queue'):
+                _shared_job_queue = GenerationJobQueue(
+                    fallback_generator=AIArticleGenerator(api_key=api_key) if api_key else None
+                )
+        return _shared_job_queue
+
+
+@st.fragment(run_every=1.0)
+def show_article_job_progress(job_id, show_partial=True):
+    """実行中の記事生成ジョブの状態を1秒ごとに更新して表示（終わったらページ全体を再実行）"""
+    job = get_job_queue().get(job_id)
+    if job is None or job['status'] not in JOB_ACTIVE_STATUSES:
+        st.rerun()
+    if job['status'] == 'queued':
+        st.info(f"⏳ 順番待ちです（{job['queue_position']}番目）")
+    else:
+        st.info(f"✍️ 生成中です（{len(job['progress'] or '')}文字）。ページを閉じても生成は続きます")
+    if show_partial and job['progress']:
+        st.markdown(job['progress'] + "▌")
+    if st.button("⏹️ 生成を中止", key=f"cancel_{job_id}"):
+        if not get_job_queue().cancel(job_id):
+            # 他のセッションも待っているジョブは止めず、このセッションだけ受け取りをやめる
+            st.session_state.pop('article_job_id', None)
+            st.query_params.pop('job', None)
+            st.rerun()
+
+
+def github_save_owners(generator):
+    """このセッションが保存キューに追加した分の持ち主 (追加時に使う持ち主, 書き込める持ち主の一覧)
+
+    トークンを設定していればトークンごと（再読み込みしても同じ）、なければセッションごとの持ち主になる。
+    トークン設定前にこのセッションで追加した分も、設定後にこのセッションのトークンで書き込む。
+    他のセッション・他のトークンで追加された分は書き込まない。
+    """
+    session_owner = 'session:' + st.session_state.setdefault('save_session_id', uuid.uuid4().hex)
+    authorization = generator._github_headers().get('Authorization')
+    if not authorization:
+        return session_owner, (session_owner,)
+    token_owner = 'token:' + hashlib.sha256(authorization.encode('utf-8')).hexdigest()[:16]
+    return token_owner, (token_owner, session_owner)
+
+
+def flush_github_saves(generator, force=False):
+    """このセッションの保存待ちが閾値に達していれば（forceなら常に）1つのコミットにまとめてGitHubに保存"""
+    queue = get_commit_queue(generator.github_repo, generator.github_branch)
+    headers = generator._github_headers()
+    if 'Authorization' not in headers:
+        if force:
+            st.warning("💡 GitHubに保存するにはGitHubトークンを設定してください（保存待ちの分はそのまま残ります）")
+        return None
+    _, owners = github_save_owners(generator)
+    if not force and not queue.is_due(owners):
+        return None
+    try:
+        with st.spinner("GitHubに保存中..."):
+            result = queue.flush(headers, owners=owners)
+    except requests.RequestException as e:
+        st.error(f"❌ GitHubへの保存に失敗しました: {str(e)}")
+        return None
+    if result:
+        st.success(f"✅ {result['files']}件を1つのコミットで保存しました（{result['commit'][:7]}）")
+    return result
+
+
+def queue_github_save(generator, files):
+    """生成した記事・投稿 [(パス, 本文, メッセージ), ...] を保存キューに追加"""
+    queue = get_commit_queue(generator.github_repo, generator.github_branch)
+    owner, _ = github_save_owners(generator)
+    for path, content, message in files:
+        pending = queue.enqueue(path, content, message, owner=owner)
+    st.success(f"📥 保存キューに追加しました（{pending}件が保存待ち）")
+    flush_github_saves(generator)
+
+
+@st.cache_resource(show_spinner=False)
+def get_post_generator(writing_folder_path=None):
+    """全セッションで共有する投稿ジェネレーター"""
+    with get_tracer().span('init.post_generator'):
+        return SocialMediaPostGenerator(writing_folder_path)
+
+
+@st.cache_resource(show_spinner=False)
+def get_ai_generator(api_key=None):
+    """全セッションで共有するAI記事ジェネレーター（APIキーごとに1つ・AIタブを開くまで作らない）"""
+    with get_tracer().span('init.ai_generator'):
+        return AIArticleGenerator(api_key=api_key)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_md_files(_generator, source_key):
+    """ファイル一覧をキャッシュ（source_keyはデータソースごとの無効化キー）"""
+    return _generator.get_all_md_files()
+
+
+class FileReadError(Exception):
+    """本文の読み取りに失敗した（失敗結果をst.cache_dataに残さないために送出する）"""
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_file_content(_generator, path, source, version_key):
+    """ファイル本文をキャッシュ（version_keyはblob SHAまたは更新日時とサイズ）
+
+    読み取りエラーは一時的なこともあるため、キャッシュせずにFileReadErrorとして送出する。
+    """
+    sha = version_key if source == 'github' else None
+    content = _generator.read_file_content(path, source, sha=sha)
+    if content.startswith('ファイル読み取りエラー'):
+        raise FileReadError(content)
+    return content
+
+
+def load_file_content(generator, file):
+    """選択されたファイルの本文を無効化キー付きで読み込み"""
+    source = file.get('source', 'local')
+    if source == 'github' or str(file['path']).startswith('http'):
+        version_key = file.get('sha') or ''
+        if not version_key:
+            # SHAが分からない場合はキャッシュ層（ETag再検証）に任せる
+            return generator.read_file_content(file['path'], source)
+    else:
+        try:
+            stat = os.stat(file['path'])
+            version_key = f"{stat.st_mtime_ns}:{stat.st_size}"
+        except OSError:
+            return generator.read_file_content(file['path'], source)
+    try:
+        return cached_file_content(generator, file['path'], source, version_key)
+    except FileReadError as e:
+        return str(e)
+
 
 def main():
     try:
@@ -391,12 +4362,13 @@ def main():
         )
     except Exception as e:
         st.error(f"ページ設定エラー: {str(e)}")
+    get_tracer().begin_run()
     
     st.title("🚀 SNS投稿ジェネレーター")
     st.markdown("📱 どのデバイスからでもアクセス可能なクラウド版SNS投稿生成ツール")
     
     # APIキー設定エリア
-    if not (hasattr(st, 'secrets') and 'OPENROUTER_API_KEY' in st.secrets):
+    if not get_secret('OPENROUTER_API_KEY'):
         with st.expander("🔑 APIキー設定"):
             col1, col2 = st.columns([1, 1])
             
@@ -435,32 +4407,72 @@ def main():
         writing_folder_path = r"C:\Users\kaiga\OneDrive\1.Vibe_cording\０．Writing"
         if not os.path.exists(writing_folder_path):
             st.error("⚠️ ローカルWritingフォルダが見つかりません。GitHubデータソースを使用してください。")
-            generator = SocialMediaPostGenerator()  # GitHubモード
+            generator = get_post_generator()  # GitHubモード
         else:
-            generator = SocialMediaPostGenerator(writing_folder_path)
+            generator = get_post_generator(writing_folder_path)
     else:
-        generator = SocialMediaPostGenerator()  # GitHubモード
+        generator = get_post_generator()  # GitHubモード
     
-    # AI記事ジェネレーター初期化
-    ai_generator = AIArticleGenerator()
-    
-    # メインタブ選択
-    tab1, tab2 = st.tabs(["📱 SNS投稿生成", "🤖 AI記事作成"])
+    # メインタブ選択（選択中のタブだけを実行し、AI機能はAIタブを開くまで初期化しない）
+    ai_tab_label = "🤖 AI記事作成"
+    tab1, tab2 = st.tabs(
+        ["📱 SNS投稿生成", ai_tab_label],
+        key='main_tab',
+        on_change='rerun',
+        default=ai_tab_label if st.query_params.get('job') else None
+    )
     
     with tab1:
         # サイドバー：ファイル選択
         st.sidebar.header("📂 ファイル選択")
+        refresh_listing = st.sidebar.button("🔄 ファイル一覧を更新")
+        source_key = str(generator.writing_folder) if generator.writing_folder else generator.github_repo
         try:
-            md_files = generator.get_all_md_files()
+            if generator.writing_folder:
+                # ローカルはマニフェストが差分だけを確認するので毎回そのまま取得する
+                md_files = generator.get_all_md_files(force_refresh=refresh_listing)
+                watch_folder = st.sidebar.checkbox("👀 フォルダの変更を監視する")
+                if watch_folder:
+                    mode = generator.local_manifest.start_watcher()
+                    st.sidebar.caption(f"監視方式: {mode}")
+                else:
+                    generator.local_manifest.stop_watcher()
+            else:
+                if refresh_listing:
+                    generator.get_all_md_files(force_refresh=True)
+                    cached_md_files.clear()
+                md_files = cached_md_files(generator, source_key)
         except Exception as e:
             st.error(f"ファイル読み込みエラー: {str(e)}")
             md_files = []
         
+        # GitHub APIの残り予算（全セッション共通）
+        if not generator.writing_folder:
+            if generator.corpus_bundle is not None and not generator.live_listing:
+                st.sidebar.caption("📦 同梱のコーパスから表示しています（🔄で最新の一覧を取得）")
+            budget = generator.github_budget_status()
+            if budget['remaining'] is not None:
+                reset_label = f"（{budget['reset_in'] / 60:.0f}分後にリセット）" if budget['reset_in'] is not None else ""
+                st.sidebar.caption(f"⏳ GitHub API残り: {budget['remaining']}/{budget['limit']}{reset_label}")
+            if budget['blocked_for'] > 0:
+                st.sidebar.warning(f"⏸️ レート制限のためGitHubへのリクエストを{budget['blocked_for']:.0f}秒間控えています")
+        
         if not md_files:
             st.error("Markdownファイルが見つかりません")
             st.info("GitHubリポジトリが正しく設定されているか確認してください。")
             return
         
+        # 全文検索（索引済みの記事から探すため本文の取得は不要）
+        search_query = st.sidebar.text_input("🔍 記事を検索", placeholder="例: 請求書")
+        search_results = []
+        if search_query:
+            search_index = get_search_index(source_key)
+            with st.spinner("検索インデックスを更新中..."):
+                search_index.update(md_files, generator)
+            search_results = search_index.search(search_query)
+            if not search_results:
+                st.sidebar.info("該当する記事が見つかりませんでした")
+        
         # カテゴリでグループ化
         categories = {}
         for file in md_files:
@@ -469,8 +4481,16 @@ def main():
                 categories[category] = []
             categories[category].append(file)
         
+        # 検索結果から選択
+        if search_results:
+            selected_file = st.sidebar.selectbox(
+                f"検索結果（{len(search_results)}件）",
+                options=search_results,
+                format_func=lambda f: f"{f['title']}（{f['category']}）"
+            )
+            category_files = [selected_file]
         # カテゴリ選択
-        if categories:
+        elif categories:
             selected_category = st.sidebar.selectbox(
                 "カテゴリを選択",
                 options=list(categories.keys())
@@ -485,12 +4505,37 @@ def main():
                 options=file_titles
             )
             
-            # 選択されたファイル情報取得
+            # 選択されたファイル情報取得（一覧に反映されていない上書きも、選択中のファイルは毎回確認する）
             selected_file = next(f for f in category_files if f['title'] == selected_file_title)
+            selected_file = generator.refresh_file(selected_file)
+
+            # 同じカテゴリのファイルをバックグラウンドで先読み
+            generator.prefetch_files(category_files)
+            if st.sidebar.button("📥 全ファイルを先読み"):
+                with st.spinner("ファイルを先読み中..."):
+                    fetched = generator.prefetch_files(md_files, wait_for_completion=True)
+                st.sidebar.success(f"✅ {fetched}件のファイルを先読みしました")
         else:
             st.error("利用可能なファイルがありません")
             return
-        
+
+        # 類似記事の検出（初回のみ全ファイルの署名を計算し、以降は変更分だけ）
+        duplicate_index = None
+        if st.sidebar.checkbox("🧬 重複・類似記事を検出", help="ほぼ同じ内容のファイルをまとめて表示します"):
+            duplicate_index = get_duplicate_index(source_key)
+            with st.spinner("類似記事を検出中..."):
+                duplicate_index.update(md_files, generator)
+            duplicate_clusters = duplicate_index.clusters()
+            with st.sidebar.expander(f"🧬 重複クラスタ（{len(duplicate_clusters)}件）"):
+                if not duplicate_clusters:
+                    st.caption("重複している記事は見つかりませんでした")
+                for cluster in duplicate_clusters:
+                    st.markdown(f"**{cluster[0]['title']}**（{len(cluster)}件）")
+                    st.caption('  \n'.join(
+                        f"{'⭐' if i == 0 else '・'} {entry['relative_path']}（類似度 {entry['similarity']:.0%}）"
+                        for i, entry in enumerate(cluster)
+                    ))
+
         # プラットフォーム選択
         st.sidebar.header("📱 プラットフォーム選択")
         selected_platforms = st.sidebar.multiselect(
@@ -498,6 +4543,16 @@ def main():
             options=['Twitter', 'LinkedIn', 'note'],
             default=['Twitter', 'LinkedIn', 'note']
         )
+        show_suggestions = st.sidebar.checkbox(
+            "💡 記事全体からハッシュタグ候補を提案",
+            help="初回のみ全ファイルを読み込んでTF-IDFで候補を計算します"
+        )
+        hashtag_suggestions = None
+        if show_suggestions:
+            hashtag_suggestions = get_hashtag_suggestions(source_key)
+            if not hashtag_suggestions.is_current(md_files):
+                with st.spinner("ハッシュタグ候補を計算中..."):
+                    hashtag_suggestions.build(md_files, generator)
     
         # メインエリア
         col1, col2 = st.columns([1, 1])
@@ -508,13 +4563,19 @@ def main():
             # ファイル情報表示
             st.info(f"**ファイル**: {selected_file['title']}\n**パス**: {selected_file.get('relative_path', selected_file['path'])}")
             
-            # ファイル内容読み取り
-            content = generator.read_file_content(selected_file['path'], selected_file.get('source', 'local'))
+            if duplicate_index is not None:
+                duplicates = duplicate_index.duplicates_of(selected_file.get('relative_path'))
+                if duplicates:
+                    st.warning("⚠️ ほぼ同じ内容のファイルがあります: " + '、'.join(d['relative_path'] for d in duplicates))
+
+            # 本文は投稿生成で必要になるまで読み込まない
+            document = LazyDocument(generator, selected_file)
             
-            # 内容をプレビュー表示（最初の500文字）
+            # 内容をプレビュー表示（最初の500文字だけを読み込む）
+            preview = document.preview(501)
             st.text_area(
                 "コンテンツプレビュー",
-                value=content[:500] + "..." if len(content) > 500 else content,
+                value=preview[:500] + "..." if len(preview) > 500 else preview,
                 height=300,
                 disabled=True
             )
@@ -522,16 +4583,25 @@ def main():
         with col2:
             st.header("📱 生成された投稿")
             
+            # 一覧のblob SHAが分かれば、保存済みの投稿は本文を読み込まずに1回の検索で取得できる
+            # ローカルは読み込んだ本文のハッシュ（上書き直後でも本文と食い違わない）
+            content_hash = file_content_hash(selected_file)
+            if not content_hash:
+                content_hash = generator.parse_document(document.content).content_hash
+            config_hash = generator.config_hash()
+            post_store = get_post_store(config_hash)
+            stored_posts = post_store.get_posts(content_hash, selected_platforms, selected_file['title'], config_hash)
+            generated_posts = {}
+            
             for platform in selected_platforms:
                 st.subheader(f"{platform} 投稿")
                 
-                # プラットフォーム別投稿生成
-                if platform == 'Twitter':
-                    post_content = generator.create_twitter_post(content, selected_file['title'])
-                elif platform == 'LinkedIn':
-                    post_content = generator.create_linkedin_post(content, selected_file['title'])
-                elif platform == 'note':
-                    post_content = generator.create_note_intro(content, selected_file['title'])
+                # 保存済みの投稿がなければ生成して保存（本文か設定が変われば作り直す）
+                post_content = stored_posts.get(platform)
+                if post_content is None:
+                    post_content = post_store.get_or_create(
+                        generator, document.content, platform, selected_file['title'], content_hash, config_hash
+                    )
                 
                 # 投稿内容表示
                 st.text_area(
@@ -540,97 +4610,309 @@ def main():
                     height=150,
                     key=f"{platform}_{selected_file['title']}"
                 )
+                if hashtag_suggestions is not None:
+                    suggested = hashtag_suggestions.suggest(content_hash, exclude=post_content.split())
+                    if suggested:
+                        st.caption(f"💡 おすすめハッシュタグ: {' '.join(suggested)}")
                 
                 # コピーボタン
                 if st.button(f"{platform}投稿をクリップボードにコピー", key=f"copy_{platform}_{selected_file['title']}"):
                     st.success(f"{platform}投稿をクリップボードにコピーしました！")
+                generated_posts[platform] = post_content
+            
+            if generated_posts and st.button("💾 投稿をGitHubに保存", key=f"save_posts_{selected_file['title']}"):
+                queue_github_save(generator, [
+                    (generated_file_path(selected_file['title'], 'posts', platform), post,
+                     f"{selected_file['title']}の{platform}投稿を追加")
+                    for platform, post in generated_posts.items()
+                ])
     
     with tab2:
-        st.header("🤖 AI記事作成")
-        
-        col1, col2 = st.columns([1, 1])
-        
-        with col1:
-            st.subheader("記事生成設定")
-            
-            # トピック入力
-            topic = st.text_input(
-                "記事のトピック・テーマを入力してください",
-                placeholder="例: AI活用で業務効率化を実現する5つの方法"
-            )
-            
-            # 記事タイプ選択
-            article_type = st.selectbox(
-                "記事のタイプ",
-                options=['blog', 'note', 'business'],
-                format_func=lambda x: {
-                    'blog': '📝 ブログ記事（一般的なブログスタイル）',
-                    'note': '📙 note記事（親しみやすいスタイル）', 
-                    'business': '💼 ビジネス記事（プロフェッショナルスタイル）'
-                }[x]
-            )
+        if tab2.open:
+            # AI記事ジェネレーター初期化（APIキーごとにプロセス内で共有）
+            ai_generator = get_ai_generator(resolve_openrouter_api_key())
             
-            # AIモデル選択
-            selected_model = st.selectbox(
-                "AIモデルを選択",
-                options=ai_generator.available_models,
-                index=0  # DeepSeek R1をデフォルト
-            )
+            st.header("🤖 AI記事作成")
             
-            # 文字数設定
-            target_length = st.slider(
-                "目標文字数",
-                min_value=500,
-                max_value=3000,
-                value=1500,
-                step=100
-            )
+            col1, col2 = st.columns([1, 1])
             
-            # 記事生成ボタン
-            if st.button("🚀 記事を生成", type="primary"):
-                if not topic:
+            with col1:
+                st.subheader("記事生成設定")
+                
+                # トピック入力
+                topic = st.text_input(
+                    "記事のトピック・テーマを入力してください",
+                    placeholder="例: AI活用で業務効率化を実現する5つの方法"
+                )
+                
+                # 記事タイプ選択
+                article_type = st.selectbox(
+                    "記事のタイプ",
+                    options=['blog', 'note', 'business'],
+                    format_func=lambda x: {
+                        'blog': '📝 ブログ記事（一般的なブログスタイル）',
+                        'note': '📙 note記事（親しみやすいスタイル）', 
+                        'business': '💼 ビジネス記事（プロフェッショナルスタイル）'
+                    }[x]
+                )
+                
+                # AIモデル選択
+                selected_model = st.selectbox(
+                    "AIモデルを選択",
+                    options=ai_generator.available_models,
+                    index=0  # DeepSeek R1をデフォルト
+                )
+                
+                # 文字数設定
+                target_length = st.slider(
+                    "目標文字数",
+                    min_value=500,
+                    max_value=3000,
+                    value=1500,
+                    step=100
+                )
+                
+                # ストリーミング表示
+                use_streaming = st.checkbox("⚡ 生成中の文章を逐次表示する", value=True)
+                use_references = st.checkbox(
+                    "📚 過去の記事を参考にする",
+                    value=True,
+                    help="トピックに近い過去記事の抜粋をプロンプトに添えます（索引は変更されたファイルの分だけバックグラウンドで更新します）"
+                )
+                related_index = get_related_index(source_key) if use_references else None
+                if related_index is not None:
+                    # 全ファイルの読み込みとベクトル化はバックグラウンドで行い、生成ボタンでは検索だけを行う
+                    related_index.update_in_background(md_files, generator)
+
+                def find_references(query):
+                    """トピックに近い過去記事の抜粋を取得（索引の更新は待たず、その時点の索引を検索）"""
+                    if related_index is None:
+                        return []
+                    if not len(related_index) and related_index.is_updating:
+                        st.info("📚 過去記事の索引を作成中のため、今回は参考記事なしで生成します")
+                    with st.spinner("関連する過去記事を検索中..."):
+                        references = related_index.related_excerpts(query, generator)
+                    st.session_state['article_references'] = references
+                    return references
+                
+                # 記事生成ボタン（再生成はキャッシュを使わない）
+                button_col1, button_col2 = st.columns([1, 1])
+                with button_col1:
+                    generate_clicked = st.button("🚀 記事を生成", type="primary")
+                with button_col2:
+                    regenerate_clicked = st.button("🔄 再生成", help="キャッシュを使わずに新しく生成します")
+                use_cache = not regenerate_clicked
+                generate_clicked = generate_clicked or regenerate_clicked
+                job_queue = get_job_queue()
+                if generate_clicked and not topic:
                     st.error("トピックを入力してください")
-                else:
-                    with st.spinner("AI記事を生成中..."):
-                        generated_article = ai_generator.generate_article(
-                            topic=topic,
-                            model=selected_model,
-                            article_type=article_type,
-                            target_length=target_length
-                        )
-                        st.session_state['generated_article'] = generated_article
-                        st.session_state['article_topic'] = topic
-        
-        with col2:
-            st.subheader("生成された記事")
+                elif generate_clicked and ai_generator.client is None:
+                    st.error("❌ OpenRouter APIキーが設定されていません。ページ上部の「🔑 APIキー設定」で設定してください")
+                elif generate_clicked:
+                    # 生成はワーカーに任せ、このセッションはジョブIDだけを持つ（URLにも残して再接続後に復元）
+                    job_id = job_queue.submit(ai_generator, 'article', selected_model, {
+                        'topic': topic,
+                        'article_type': article_type,
+                        'target_length': target_length,
+                        'use_cache': use_cache,
+                        'references': find_references(topic),
+                    })
+                    st.session_state['article_job_id'] = job_id
+                    st.query_params['job'] = job_id
+                
+                # 複数モデルで同時生成
+                with st.expander("🆚 複数モデルで同時に生成"):
+                    compare_models = st.multiselect(
+                        "比較するモデル",
+                        options=ai_generator.available_models,
+                        default=ai_generator.available_models[:2]
+                    )
+                    compare_mode = st.radio(
+                        "結果の受け取り方",
+                        options=['all', 'first'],
+                        format_func=lambda x: {
+                            'all': '📊 全モデルの結果を並べて比較',
+                            'first': '🏁 最初に届いた結果を採用'
+                        }[x],
+                        horizontal=True
+                    )
+                    compare_timeout = st.slider("モデルごとのタイムアウト（秒）", min_value=10, max_value=180, value=90, step=10)
+                    if st.button("🚀 同時に生成"):
+                        if not topic:
+                            st.error("トピックを入力してください")
+                        elif not compare_models:
+                            st.error("モデルを1つ以上選択してください")
+                        else:
+                            references = find_references(topic)
+                            with st.spinner(f"{len(compare_models)}モデルで生成中..."):
+                                results = ai_generator.generate_articles_concurrently(
+                                    topic=topic,
+                                    models=compare_models,
+                                    article_type=article_type,
+                                    target_length=target_length,
+                                    mode=compare_mode,
+                                    timeout=compare_timeout,
+                                    references=references
+                                )
+                            st.session_state['model_comparison'] = results
+                            winner = next((r for r in results if r['error'] is None), None)
+                            if compare_mode == 'first' and winner:
+                                st.session_state['generated_article'] = winner['content']
+                                st.session_state['article_topic'] = topic
+                
+                # プロンプトに添えた過去記事
+                if use_references and st.session_state.get('article_references'):
+                    st.caption("📚 参考にした過去記事: " + '、'.join(
+                        f"{reference['title']}（{reference['score']:.2f}）"
+                        for reference in st.session_state['article_references']
+                    ))
+                
+                # 選択中の元記事から生成（長い記事は見出しごとに分割して並列に要約してから生成）
+                with st.expander(f"📄 元記事「{selected_file['title']}」から生成"):
+                    source_target = st.selectbox(
+                        "作成するもの",
+                        options=['article'] + list(generator.platform_configs),
+                        format_func=lambda x: '📝 記事（上の記事タイプ・文字数で作成）' if x == 'article' else f"📱 {x}投稿"
+                    )
+                    source_clicked = st.button("🚀 元記事から生成")
+                    if source_clicked and ai_generator.client is None:
+                        st.error("❌ OpenRouter APIキーが設定されていません。ページ上部の「🔑 APIキー設定」で設定してください")
+                    elif source_clicked:
+                        source_content = document.content
+                        if len(source_content) > POST_SOURCE_MAX_CHARS:
+                            chunk_count = len(split_markdown_sections(source_content))
+                            st.caption(f"📚 長い記事のため{chunk_count}パートに分けて要約してから生成します")
+                        job_id = job_queue.submit(ai_generator, 'document', selected_model, {
+                            'title': selected_file['title'],
+                            'content': source_content,
+                            'target': source_target,
+                            'platform_config': generator.platform_configs.get(source_target),
+                            'article_type': article_type,
+                            'target_length': target_length,
+                        })
+                        st.session_state['article_job_id'] = job_id
+                        st.query_params['job'] = job_id
+                
+                # モデルごとの応答速度
+                metrics = get_stream_metrics(selected_model)
+                if metrics:
+                    st.caption(
+                        f"⏱️ 初回トークンまで {metrics['time_to_first_token']:.1f}秒 / "
+                        f"{metrics['tokens_per_sec']:.1f} tokens/秒（直近{metrics['samples']}回の平均）"
+                    )
             
-            if 'generated_article' in st.session_state:
-                # 記事内容表示
-                article_content = st.text_area(
-                    f"記事内容 ({len(st.session_state['generated_article'])}文字)",
-                    value=st.session_state['generated_article'],
-                    height=400,
-                    key="article_editor"
-                )
+            with col2:
+                st.subheader("生成された記事")
                 
-                # 保存・コピーボタン
-                col2_1, col2_2 = st.columns([1, 1])
+                # 記事生成ジョブの状態（再接続した場合はURLのジョブIDから復元）
+                job_id = st.session_state.get('article_job_id') or st.query_params.get('job')
+                job = job_queue.get(job_id) if job_id else None
+                if job and job['status'] in JOB_ACTIVE_STATUSES:
+                    show_article_job_progress(job_id, use_streaming)
+                elif job:
+                    if job['status'] == 'error':
+                        st.error(job['error'])
+                if job and job['status'] not in JOB_ACTIVE_STATUSES and st.session_state.get('article_job_loaded') != job_id:
+                    # 終わったジョブの結果を読み込む（中止された場合も受信済みの部分は残す）
+                    st.session_state['article_job_loaded'] = job_id
+                    if job['result']:
+                        st.session_state['generated_article'] = job['result']
+                        st.session_state['article_topic'] = job['params'].get('topic') or job['params'].get('title')
                 
-                with col2_1:
-                    if st.button("📋 記事をコピー"):
-                        st.success("✅ 記事をクリップボードにコピーしました！")
+                if 'generated_article' in st.session_state:
+                    # 記事内容表示
+                    article_content = st.text_area(
+                        f"記事内容 ({len(st.session_state['generated_article'])}文字)",
+                        value=st.session_state['generated_article'],
+                        height=400,
+                        key="article_editor"
+                    )
+                    
+                    # 保存・コピーボタン
+                    col2_1, col2_2 = st.columns([1, 1])
+                    
+                    with col2_1:
+                        if st.button("📋 記事をコピー"):
+                            st.success("✅ 記事をクリップボードにコピーしました！")
+                    
+                    with col2_2:
+                        if st.button("💾 記事を保存"):
+                            article_title = st.session_state.get('article_topic') or '記事'
+                            queue_github_save(generator, [
+                                (generated_file_path(article_title), article_content, f"記事「{article_title}」を追加")
+                            ])
                 
-                with col2_2:
-                    if st.button("💾 記事を保存"):
-                        # GitHubに保存する機能（今後実装）
-                        st.info("💡 記事保存機能は今後実装予定です")
+                elif not (job and job['status'] in JOB_ACTIVE_STATUSES):
+                    st.info("👈 左側で設定を行い、「記事を生成」ボタンをクリックしてください")
             
-            else:
-                st.info("👈 左側で設定を行い、「記事を生成」ボタンをクリックしてください")
+            # 複数モデルの比較結果
+            if st.session_state.get('model_comparison'):
+                st.subheader("🆚 モデル比較")
+                results = st.session_state['model_comparison']
+                for result, column in zip(results, st.columns(len(results))):
+                    with column:
+                        cached_label = "・キャッシュ" if result.get('cached') else ""
+                        st.markdown(f"**{result['model']}**（{result['seconds']:.1f}秒{cached_label}）")
+                        if result['error']:
+                            st.error(f"❌ {result['error']}")
+                        else:
+                            st.text_area(
+                                f"記事内容 ({len(result['content'])}文字)",
+                                value=result['content'],
+                                height=300,
+                                key=f"comparison_{result['model']}"
+                            )
+        
+    # GitHubへの保存待ち（件数か待ち時間が閾値に達したら次の操作のついでにまとめてコミット）
+    # 書き込むのはこのセッション（このトークン）で追加した分だけ
+    save_queue = get_commit_queue(generator.github_repo, generator.github_branch)
+    _, save_owners = github_save_owners(generator)
+    if save_queue.count(save_owners):
+        flush_github_saves(generator)
+    if save_queue.count(save_owners):
+        st.sidebar.header("💾 GitHubへの保存")
+        st.sidebar.caption(
+            f"📥 保存待ち: {save_queue.count(save_owners)}件（{save_queue.flush_count}件たまるか"
+            f"{save_queue.flush_seconds / 60:.0f}分たつと1つのコミットで保存）"
+        )
+        failure = save_queue.failure(save_owners)
+        if failure:
+            st.sidebar.warning(
+                f"⚠️ 前回の保存に失敗したため、{time.strftime('%m/%d %H:%M', time.localtime(failure['retry_at']))}"
+                f"までは自動で保存しません: {failure['error'][:200]}"
+            )
+        if st.sidebar.button("⬆️ 今すぐGitHubに保存"):
+            with st.sidebar:
+                flush_github_saves(generator, force=True)
+    
+    # 処理時間の内訳（全セッションの直近の再実行から集計）
+    tracer = get_tracer()
+    with st.expander("⏱️ 処理時間の内訳（デバッグ）"):
+        if tracer.enabled:
+            st.caption(f"段階ごとの所要時間とトークン数を {tracer.trace_path} に書き出しています")
+        stage_stats = tracer.stage_stats()
+        if stage_stats:
+            st.table([
+                {
+                    '段階': stage,
+                    '回数': stat['count'],
+                    'p50 (ms)': f"{stat['p50'] * 1000:.1f}",
+                    'p95 (ms)': f"{stat['p95'] * 1000:.1f}",
+                    '入力トークン': stat['prompt_tokens'],
+                    '出力トークン': stat['completion_tokens'],
+                    '費用': f"{stat['cost']:.4f}",
+                }
+                for stage, stat in stage_stats.items()
+            ])
+            if st.button("🧹 計測結果をクリア"):
+                tracer.clear()
+        elif not tracer.enabled:
+            st.caption("計測は無効です。環境変数 SNS_TRACE=1 を設定して起動すると結果が表示されます")
     
     # フッター情報
     st.markdown("---")
     st.markdown("💡 **使い方**: 左サイドバーでファイルとプラットフォームを選択すると、自動的に最適化された投稿が生成されます")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with get_tracer().span('rerun'):
+        main()
\ No newline at end of file
@@ -0,0 +1,14 @@
+"""テスト共通の設定
+
+アプリのモジュールを読み込む前にキャッシュの保存先を一時フォルダへ切り替え、
+ホームディレクトリのキャッシュを汚さないようにする。
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+os.environ.setdefault('SNS_CACHE_DIR', tempfile.mkdtemp(prefix='sns-test-cache-'))
+os.environ.setdefault('SNS_CORPUS_BUNDLE', os.path.join(os.environ['SNS_CACHE_DIR'], 'corpus_bundle.sqlite'))
@@ -0,0 +1,41 @@
+"""CorpusBundle（一覧・本文・解析結果を1ファイルにまとめたバンドル）のテスト"""
+import pytest
+
+import social_media_post_generator as sgp
+
+
+@pytest.fixture
+def bundle_path(tmp_path):
+    folder = tmp_path / 'vibe-cording-writing'
+    (folder / 'sub').mkdir(parents=True)
+    (folder / 'a.md').write_text('# 見出し\n- 項目\nAIで業務を効率化しました。\n', encoding='utf-8')
+    (folder / 'sub' / 'b.md').write_text('# B\n', encoding='utf-8')
+    path = tmp_path / 'bundle.sqlite'
+    sgp.build_corpus_bundle(folder, path, generator=sgp.SocialMediaPostGenerator(use_bundle=False))
+    return path
+
+
+def test_bundle_lists_files_and_serves_bodies(bundle_path):
+    bundle = sgp.CorpusBundle(bundle_path)
+    files = bundle.md_files(lambda path: f'https://raw.example/{path}')
+    assert [file['relative_path'] for file in files] == ['vibe-cording-writing/a.md', 'vibe-cording-writing/sub/b.md']
+    assert bundle.get_body(files[1]['sha']) == '# B\n'
+    assert bundle.parsed_usable
+
+
+def test_stored_parse_is_ignored_when_rules_change(bundle_path, monkeypatch):
+    monkeypatch.setattr(sgp, 'DEFAULT_HASHTAG_RULES', [{'keywords': ['効率'], 'hashtag': '#効率'}])
+    assert not sgp.CorpusBundle(bundle_path).parsed_usable
+
+
+def test_stored_parse_is_ignored_when_parser_changes(bundle_path, monkeypatch):
+    monkeypatch.setattr(sgp, 'PARSED_DOCUMENT_VERSION', sgp.PARSED_DOCUMENT_VERSION + 1)
+    bundle = sgp.CorpusBundle(bundle_path)
+    assert not bundle.parsed_usable
+
+    sgp.clear_document_cache()
+    sha = bundle.md_files(str)[0]['sha']
+    content = bundle.get_body(sha)
+    assert content.startswith('# 見出し')
+    with sgp._parsed_documents_lock:
+        assert content not in sgp._parsed_documents
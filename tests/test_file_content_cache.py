@@ -0,0 +1,143 @@
+"""FileContentCache（条件付きGETによる再検証・複数プロセスでの共有）のテスト"""
+import json
+
+import requests
+
+import social_media_post_generator as sgp
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class FakeGitHubClient:
+    """決められた応答を順に返し、受け取ったヘッダーを記録する"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.calls.append(dict(headers or {}))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def make_generator(tmp_path, cache, responses):
+    generator = sgp.SocialMediaPostGenerator(
+        file_cache=cache, tree_cache=sgp.GitTreeCache(cache_dir=tmp_path / 'trees'), use_bundle=False
+    )
+    generator.github = FakeGitHubClient(responses)
+    return generator
+
+
+URL = 'https://raw.example/a.md'
+
+
+def test_store_and_get_fresh(tmp_path):
+    cache = sgp.FileContentCache(cache_dir=tmp_path, fresh_seconds=60)
+    assert cache.store(URL, 'こんにちは'.encode('utf-8'), etag='"v1"') == 'こんにちは'
+    assert cache.get_fresh(URL) == 'こんにちは'
+    assert cache.conditional_headers(URL) == {'If-None-Match': '"v1"'}
+
+
+def test_expired_entry_is_revalidated_with_304(tmp_path):
+    cache = sgp.FileContentCache(cache_dir=tmp_path, fresh_seconds=0)
+    generator = make_generator(tmp_path, cache, [
+        FakeResponse(200, b'body v1', {'ETag': '"v1"'}),
+        FakeResponse(304),
+    ])
+    assert generator._read_github_file(URL) == 'body v1'
+    assert generator._read_github_file(URL) == 'body v1'
+    assert generator.github.calls == [{}, {'If-None-Match': '"v1"'}]
+
+
+def test_changed_file_replaces_cached_body(tmp_path):
+    cache = sgp.FileContentCache(cache_dir=tmp_path, fresh_seconds=0)
+    generator = make_generator(tmp_path, cache, [
+        FakeResponse(200, b'body v1', {'ETag': '"v1"'}),
+        FakeResponse(200, b'body v2', {'ETag': '"v2"'}),
+    ])
+    generator._read_github_file(URL)
+    assert generator._read_github_file(URL) == 'body v2'
+    assert cache.conditional_headers(URL) == {'If-None-Match': '"v2"'}
+
+
+def test_304_without_cached_blob_refetches(tmp_path):
+    cache = sgp.FileContentCache(cache_dir=tmp_path, fresh_seconds=0)
+    cache.store(URL, b'body v1', etag='"v1"')
+    sha = sgp.git_blob_sha(b'body v1')
+    (tmp_path / 'blobs' / sha).unlink()
+    cache._memory.clear()
+    generator = make_generator(tmp_path, cache, [FakeResponse(304), FakeResponse(200, b'body v1')])
+    assert generator._read_github_file(URL) == 'body v1'
+    assert len(generator.github.calls) == 2
+
+
+def test_network_error_falls_back_to_stale_body(tmp_path):
+    cache = sgp.FileContentCache(cache_dir=tmp_path, fresh_seconds=0)
+    cache.store(URL, b'stale body')
+    generator = make_generator(tmp_path, cache, [requests.ConnectionError()])
+    assert generator._read_github_file(URL) == 'stale body'
+
+
+def test_index_writes_are_batched(tmp_path):
+    cache = sgp.FileContentCache(cache_dir=tmp_path, save_interval=3600)
+    cache.store(URL, b'first')
+    cache.store('https://raw.example/b.md', b'second')
+    assert not (tmp_path / 'index.json').exists()
+    cache.flush()
+    index = json.loads((tmp_path / 'index.json').read_text(encoding='utf-8'))
+    assert set(index['urls']) == {URL, 'https://raw.example/b.md'}
+
+
+def test_concurrent_writers_merge_their_indexes(tmp_path):
+    first = sgp.FileContentCache(cache_dir=tmp_path, save_interval=3600)
+    second = sgp.FileContentCache(cache_dir=tmp_path, save_interval=3600)
+    first.store('https://raw.example/a.md', b'from first')
+    second.store('https://raw.example/b.md', b'from second')
+    first.flush()
+    second.flush()
+
+    reloaded = sgp.FileContentCache(cache_dir=tmp_path)
+    assert reloaded.get_stale('https://raw.example/a.md') == 'from first'
+    assert reloaded.get_stale('https://raw.example/b.md') == 'from second'
+
+
+def test_blob_evicted_by_another_writer_is_dropped_on_merge(tmp_path):
+    first = sgp.FileContentCache(cache_dir=tmp_path, max_bytes=10, save_interval=0)
+    first.store('https://raw.example/a.md', b'0123456789')
+    second = sgp.FileContentCache(cache_dir=tmp_path, max_bytes=10, save_interval=0)
+    second.store('https://raw.example/b.md', b'abcdefghij')  # aは上限を超えるため削除される
+    first.store('https://raw.example/c.md', b'')
+
+    index = json.loads((tmp_path / 'index.json').read_text(encoding='utf-8'))
+    assert sgp.git_blob_sha(b'0123456789') not in index['blobs']
+    assert 'https://raw.example/a.md' not in index['urls']
+
+
+def test_orphan_blobs_count_towards_size_limit(tmp_path):
+    blob_dir = tmp_path / 'blobs'
+    blob_dir.mkdir(parents=True)
+    for data in (b'a' * 8, b'b' * 8):
+        (blob_dir / sgp.git_blob_sha(data)).write_bytes(data)  # インデックスを書く前に終了したプロセスの残り
+
+    cache = sgp.FileContentCache(cache_dir=tmp_path, max_bytes=10)
+    assert sum(blob['size'] for blob in cache._blobs.values()) <= 10
+    assert len(list(blob_dir.iterdir())) == 1
+
+
+def test_corrupt_index_keeps_blobs_within_limit(tmp_path):
+    cache = sgp.FileContentCache(cache_dir=tmp_path, max_bytes=100, save_interval=0)
+    cache.store(URL, b'x' * 60)
+    (tmp_path / 'index.json').write_text('{"urls": ', encoding='utf-8')
+
+    reloaded = sgp.FileContentCache(cache_dir=tmp_path, max_bytes=100, save_interval=0)
+    reloaded.store('https://raw.example/b.md', b'y' * 60)
+    total = sum(path.stat().st_size for path in (tmp_path / 'blobs').iterdir())
+    assert total <= 100
@@ -0,0 +1,220 @@
+"""GenerationJobQueue（SQLite永続の記事生成ジョブ）のテスト"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+import social_media_post_generator as sgp
+
+
+def wait_for_status(queue, job_id, statuses, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"ジョブが{statuses}になりませんでした: {queue.get(job_id)['status']}")
+
+
+def schema_only_queue(db_path):
+    """テーブルだけを作成する（このキューのワーカーは同時実行数0なので、後から入れたジョブを取り出さない）"""
+    return sgp.GenerationJobQueue(db_path=db_path, workers=1, model_concurrency=0)
+
+
+class FakeStreamingAI:
+    """generate_article_streamだけを持つ記事生成の代わり"""
+
+    client = object()
+
+    def __init__(self, text='生成した記事'):
+        self.text = text
+        self.topics = []
+
+    def build_article_prompt(self, topic, article_type='blog', target_length=1000, source=None, references=None):
+        return f"{topic}:{article_type}:{target_length}"
+
+    def _response_cache_key(self, model, prompt):
+        return f"{model}:{prompt}"
+
+    def generate_article_stream(self, topic, **kwargs):
+        self.topics.append(topic)
+        yield self.text
+
+
+class FakeAsyncCompletions:
+    """要約（map）は遅く返し、呼ばれたプロンプトを記録する"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.prompts = []
+
+    async def create(self, messages, **kwargs):
+        self.prompts.append(messages[0]['content'])
+        await asyncio.sleep(self.delay)
+        message = SimpleNamespace(content='要約')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class FakeAsyncOpenAI:
+    completions = None
+
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=FakeAsyncOpenAI.completions)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def insert_job(db_path, job_id, status, kind='article', model='model-a', params=None, created_at=None):
+    """前回のプロセスが残したジョブを直接書き込む"""
+    conn = sqlite3.connect(str(db_path))
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, model, params, status, progress, created_at, request_key, waiters) "
+            "VALUES (?, ?, ?, ?, ?, '途中まで', ?, ?, 1)",
+            (job_id, kind, model, json.dumps(params or {'topic': job_id}), status,
+             created_at or time.time(), job_id)
+        )
+    conn.close()
+
+
+def test_jobs_left_running_by_a_previous_process_are_rerun(tmp_path):
+    db_path = tmp_path / 'jobs.sqlite'
+    schema_only_queue(db_path)
+    insert_job(db_path, 'interrupted', 'running')
+    insert_job(db_path, 'waiting', 'queued')
+    insert_job(db_path, 'finished', 'done')
+
+    ai = FakeStreamingAI()
+    queue = sgp.GenerationJobQueue(db_path=db_path, workers=2, fallback_generator=ai)
+    for job_id in ('interrupted', 'waiting'):
+        assert wait_for_status(queue, job_id, ('done',))['result'] == '生成した記事'
+    assert queue.get('interrupted')['progress'] == ''  # 途中経過は捨ててやり直す
+    assert queue.get('finished')['status'] == 'done'
+    assert sorted(ai.topics) == ['interrupted', 'waiting']
+
+
+def test_recovered_jobs_without_api_key_fail_cleanly(tmp_path):
+    db_path = tmp_path / 'jobs.sqlite'
+    schema_only_queue(db_path)
+    insert_job(db_path, 'interrupted', 'running')
+
+    queue = sgp.GenerationJobQueue(db_path=db_path, workers=1)
+    job = wait_for_status(queue, 'interrupted', ('error',))
+    assert 'APIキー' in job['error']
+
+
+def test_old_jobs_are_pruned_on_start(tmp_path):
+    db_path = tmp_path / 'jobs.sqlite'
+    schema_only_queue(db_path)
+    insert_job(db_path, 'old', 'done', created_at=time.time() - sgp.JOB_RETENTION_SECONDS - 60)
+
+    queue = sgp.GenerationJobQueue(db_path=db_path, workers=1)
+    assert queue.get('old') is None
+
+
+def test_submitted_article_job_completes(tmp_path):
+    queue = sgp.GenerationJobQueue(db_path=tmp_path / 'jobs.sqlite', workers=1)
+    job_id = queue.submit(FakeStreamingAI(), 'article', 'model-a', {'topic': 'AI'})
+    assert wait_for_status(queue, job_id, ('done',))['result'] == '生成した記事'
+    assert queue.counts() == {'done': 1}
+
+
+def test_cancelling_document_job_stops_before_reduce(tmp_path, monkeypatch):
+    completions = FakeAsyncCompletions(delay=0.5)
+    FakeAsyncOpenAI.completions = completions
+    monkeypatch.setattr(sgp, 'load_openai', lambda: SimpleNamespace(AsyncOpenAI=FakeAsyncOpenAI))
+    ai = sgp.AIArticleGenerator(response_cache=sgp.LLMResponseCache(tmp_path / 'llm.sqlite'), api_key='test')
+    ai.client = object()
+    queue = sgp.GenerationJobQueue(db_path=tmp_path / 'jobs.sqlite', workers=1)
+
+    content = '\n'.join(f"# 見出し{i}\n" + 'あ' * 5000 for i in range(4))
+    job_id = queue.submit(ai, 'document', 'model-a', {'title': '長い記事', 'content': content, 'target': 'article'})
+    wait_for_status(queue, job_id, ('running',))
+    deadline = time.monotonic() + 5
+    while not completions.prompts and time.monotonic() < deadline:
+        time.sleep(0.01)
+    started = time.monotonic()
+    assert queue.cancel(job_id) is True
+
+    job = wait_for_status(queue, job_id, ('cancelled', 'done', 'error'))
+    assert job['status'] == 'cancelled'
+    assert time.monotonic() - started < 0.5 + 1.0
+    # 要約（map）の途中で打ち切ったので、記事を書く（reduce）リクエストは送られていない
+    assert all('の一部（' in prompt for prompt in completions.prompts)
+
+
+def test_cancelling_queued_job_never_runs_it(tmp_path):
+    release = threading.Event()
+
+    class BlockingAI(FakeStreamingAI):
+        def generate_article_stream(self, topic, **kwargs):
+            self.topics.append(topic)
+            release.wait(timeout=10)
+            yield self.text
+
+    ai = BlockingAI()
+    queue = sgp.GenerationJobQueue(db_path=tmp_path / 'jobs.sqlite', workers=1)
+    first = queue.submit(ai, 'article', 'model-a', {'topic': 'first'})
+    wait_for_status(queue, first, ('running',))
+    second = queue.submit(ai, 'article', 'model-b', {'topic': 'second'})
+    assert queue.cancel(second) is True
+    release.set()
+
+    wait_for_status(queue, first, ('done',))
+    assert queue.get(second)['status'] == 'cancelled'
+    assert ai.topics == ['first']
+
+
+def test_model_concurrency_lets_other_models_run_first(tmp_path):
+    release = threading.Event()
+    started = []
+
+    class BlockingAI(FakeStreamingAI):
+        def generate_article_stream(self, topic, **kwargs):
+            started.append(topic)
+            if topic == 'a1':
+                release.wait(timeout=10)
+            yield self.text
+
+    ai = BlockingAI()
+    queue = sgp.GenerationJobQueue(db_path=tmp_path / 'jobs.sqlite', workers=2, model_concurrency=1)
+    a1 = queue.submit(ai, 'article', 'model-a', {'topic': 'a1'})
+    wait_for_status(queue, a1, ('running',))
+    a2 = queue.submit(ai, 'article', 'model-a', {'topic': 'a2'})
+    b1 = queue.submit(ai, 'article', 'model-b', {'topic': 'b1'})
+
+    wait_for_status(queue, b1, ('done',))
+    assert queue.get(a2)['status'] == 'queued'
+    release.set()
+    wait_for_status(queue, a2, ('done',))
+    assert started == ['a1', 'b1', 'a2']
+
+
+def test_keyless_submits_are_never_shared(tmp_path):
+    class KeylessAI(FakeStreamingAI):
+        client = None
+
+    queue = schema_only_queue(tmp_path / 'jobs.sqlite')  # 実行させずに登録だけ確かめる
+    keyless = queue.submit(KeylessAI(), 'article', 'model-a', {'topic': 'AI'})
+    keyed = queue.submit(FakeStreamingAI(), 'article', 'model-a', {'topic': 'AI'})
+
+    assert keyed != keyless  # キーのあるセッションが、失敗するだけのジョブに相乗りしない
+    assert queue.submit(KeylessAI(), 'article', 'model-a', {'topic': 'AI'}) not in (keyless, keyed)
+    assert queue.submit(FakeStreamingAI(), 'article', 'model-a', {'topic': 'AI'}) == keyed
+
+
+def test_cancelling_queued_job_releases_its_generator(tmp_path):
+    queue = schema_only_queue(tmp_path / 'jobs.sqlite')
+    job_id = queue.submit(FakeStreamingAI(), 'article', 'model-a', {'topic': 'AI'})
+    assert job_id in queue._generators
+
+    assert queue.cancel(job_id) is True
+    assert queue.get(job_id)['status'] == 'cancelled'
+    assert job_id not in queue._generators
@@ -0,0 +1,41 @@
+"""GitTreeCache（ブランチ先頭とツリーごとのファイル一覧のキャッシュ）のテスト"""
+import json
+import threading
+
+import social_media_post_generator as sgp
+
+
+def test_heads_from_other_processes_are_kept(tmp_path):
+    first = sgp.GitTreeCache(tmp_path)
+    second = sgp.GitTreeCache(tmp_path)  # 別のプロセスの代わり（読み込み時点ではどちらも空）
+
+    first.set_head('owner/repo@main', 'tree-main')
+    second.set_head('owner/repo@dev', 'tree-dev')
+
+    heads = sgp.GitTreeCache(tmp_path)
+    assert heads.get_head('owner/repo@main')['tree_sha'] == 'tree-main'
+    assert heads.get_head('owner/repo@dev')['tree_sha'] == 'tree-dev'
+
+
+def test_concurrent_writes_publish_whole_files(tmp_path):
+    caches = [sgp.GitTreeCache(tmp_path) for _ in range(4)]
+    entries = [{'path': f'notes/{i}.md', 'type': 'blob', 'sha': f'{i:040x}'} for i in range(500)]
+
+    def write(cache, n):
+        for i in range(20):
+            cache.put_tree('same-tree', entries)
+            cache.set_head(f'owner/repo@branch{n}', f'tree-{i}')
+
+    threads = [threading.Thread(target=write, args=(cache, n)) for n, cache in enumerate(caches)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cache_dir = tmp_path / 'trees'
+    assert json.loads((cache_dir / 'same-tree.json').read_text(encoding='utf-8')) == entries
+    heads = json.loads((cache_dir / 'heads.json').read_text(encoding='utf-8'))
+    assert {key: head['tree_sha'] for key, head in heads.items()} == {
+        f'owner/repo@branch{n}': 'tree-19' for n in range(4)
+    }
+    assert not list(cache_dir.glob('*.tmp'))
@@ -0,0 +1,136 @@
+"""GitHubCommitQueue（保存キューをまとめて1つのコミットにする）のテスト"""
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+import social_media_post_generator as sgp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+from stub_servers import StubGitHubServer  # noqa: E402
+
+HEADERS = {'Authorization': 'token stub'}
+
+
+class FakeResponse:
+    def __init__(self, status_code, text=''):
+        self.status_code = status_code
+        self.text = text
+
+
+class ProtectedBranchClient:
+    """ブランチの更新だけを保護ブランチのエラー（422）で断るクライアント"""
+
+    def __init__(self, client):
+        self.client = client
+        self.ref_updates = 0
+
+    def request(self, method, url, **kwargs):
+        if method == 'PATCH':
+            self.ref_updates += 1
+            return FakeResponse(422, '{"message": "Protected branch update failed for refs/heads/main."}')
+        return self.client.request(method, url, **kwargs)
+
+
+@pytest.fixture
+def github(monkeypatch):
+    with StubGitHubServer({'README.md': b'# stub\n'}) as server:
+        monkeypatch.setattr(sgp, 'GITHUB_API_URL', server.api_url)
+        yield server
+
+
+def make_queue(github, tmp_path, client=None, **kwargs):
+    client = client or sgp.GitHubClient(sgp.get_http_session(), sgp.GitHubRateBudget())
+    return sgp.GitHubCommitQueue(github.repo, github.branch, tmp_path / 'save.sqlite', client=client, **kwargs)
+
+
+def test_flush_writes_one_commit(github, tmp_path):
+    queue = make_queue(github, tmp_path)
+    queue.enqueue('generated/a.md', 'A')
+    queue.enqueue('generated/b.md', 'B')
+
+    result = queue.flush(HEADERS)
+
+    assert result['files'] == 2 and result['attempts'] == 1
+    assert github.files['generated/a.md'] == b'A'
+    assert github.files['generated/b.md'] == b'B'
+    assert len(queue) == 0
+
+
+def test_ref_conflict_is_retried_on_new_head(github, tmp_path, monkeypatch):
+    monkeypatch.setattr(sgp.time, 'sleep', lambda seconds: None)
+    queue = make_queue(github, tmp_path)
+    queue.enqueue('generated/a.md', 'A')
+    github.pending_conflicts = 2
+
+    result = queue.flush(HEADERS)
+
+    assert result['attempts'] == 3
+    assert github.files['generated/a.md'] == b'A'
+    assert any(path.startswith('conflict/') for path in github.files)  # 先に進んだ分も残っている
+    assert len(queue) == 0
+
+
+def test_persistent_conflict_backs_off(github, tmp_path, monkeypatch):
+    monkeypatch.setattr(sgp.time, 'sleep', lambda seconds: None)
+    queue = make_queue(github, tmp_path, flush_count=1)
+    queue.enqueue('generated/a.md', 'A')
+    github.pending_conflicts = sgp.SAVE_MAX_RETRIES + 1
+
+    with pytest.raises(sgp.GitHubSaveError) as excinfo:
+        queue.flush(HEADERS)
+
+    assert excinfo.value.retryable
+    assert len(queue) == 1
+    assert not queue.is_due()
+    assert queue.is_due(now=sgp.time.time() + sgp.SAVE_BACKOFF_SECONDS + 1)
+
+
+def test_flush_only_writes_own_entries(github, tmp_path):
+    queue = make_queue(github, tmp_path, flush_count=2)
+    queue.enqueue('generated/mine.md', 'mine', owner='token:me')
+    queue.enqueue('generated/theirs.md', 'theirs', owner='token:other')
+
+    assert not queue.is_due(['token:me'])
+    assert queue.count(['token:me']) == 1
+    result = queue.flush(HEADERS, owners=['token:me', 'session:me'])
+
+    assert result['files'] == 1
+    assert 'generated/theirs.md' not in github.files
+    assert [entry['path'] for entry in queue.pending()] == ['generated/theirs.md']
+
+
+def test_protected_branch_parks_queue(github, tmp_path):
+    client = ProtectedBranchClient(sgp.GitHubClient(sgp.get_http_session(), sgp.GitHubRateBudget()))
+    queue = make_queue(github, tmp_path, client=client, flush_count=1)
+    queue.enqueue('generated/a.md', 'A', owner='token:me')
+
+    with pytest.raises(sgp.GitHubSaveError) as excinfo:
+        queue.flush_if_due(HEADERS, owners=['token:me'])
+
+    assert not excinfo.value.retryable
+    assert client.ref_updates == 1  # 競合ではないので作り直さない
+    failure = queue.failure(['token:me'])
+    assert 'Protected branch' in failure['error']
+    assert failure['retry_at'] >= sgp.time.time() + sgp.SAVE_PARK_SECONDS - 60
+
+    # 止めている間は新しく追加しても自動では書き込まない
+    queue.enqueue('generated/b.md', 'B', owner='token:me')
+    assert queue.flush_if_due(HEADERS, owners=['token:me']) is None
+    assert client.ref_updates == 1
+    assert queue.failure(['token:other']) is None
+
+
+def test_old_database_is_migrated(tmp_path):
+    db_path = tmp_path / 'save.sqlite'
+    conn = sqlite3.connect(str(db_path))
+    conn.execute('CREATE TABLE pending (path TEXT PRIMARY KEY, content TEXT, message TEXT, queued_at REAL)')
+    conn.execute("INSERT INTO pending VALUES ('generated/a.md', 'A', 'msg', 1.0)")
+    conn.commit()
+    conn.close()
+
+    queue = sgp.GitHubCommitQueue('owner/repo', 'main', db_path, client=object())
+
+    assert queue.pending() == [{'path': 'generated/a.md', 'message': 'msg', 'queued_at': 1.0, 'owner': ''}]
+    assert queue.is_due(now=1.0 + sgp.SAVE_FLUSH_SECONDS)
@@ -0,0 +1,32 @@
+"""HashtagEngine（キーワード→ハッシュタグのルール判定）のテスト"""
+import social_media_post_generator as sgp
+
+
+def test_overlapping_keywords_all_match():
+    engine = sgp.HashtagEngine([
+        {'keywords': ['AI'], 'hashtag': '#AI'},
+        {'keywords': ['AIツール'], 'hashtag': '#AIツール'},
+        {'keywords': ['ツール'], 'hashtag': '#ツール'},
+    ])
+    assert engine.match('AIツールを使う') == ['#AI', '#AIツール', '#ツール']
+    assert engine.match('AIを使う') == ['#AI']
+
+
+def test_keywords_are_case_insensitive_and_returned_in_rule_order():
+    engine = sgp.HashtagEngine(sgp.DEFAULT_HASHTAG_RULES)
+    assert engine.match('sns運用と事務作業をai で効率化') == ['#AI活用', '#業務効率化', '#SNS運用']
+    assert engine.match('関係のない本文') == []
+
+
+def test_matches_same_rules_as_substring_checks():
+    engine = sgp.HashtagEngine(sgp.DEFAULT_HASHTAG_RULES)
+    for text in ['AIで業務を変える', '事務職のSNS', 'PAIR', '']:
+        expected = [
+            rule['hashtag'] for rule in sgp.DEFAULT_HASHTAG_RULES
+            if any(keyword.lower() in text.lower() for keyword in rule['keywords'])
+        ]
+        assert engine.match(text) == expected
+
+
+def test_empty_rules():
+    assert sgp.HashtagEngine([]).match('AI') == []
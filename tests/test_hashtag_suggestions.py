@@ -0,0 +1,78 @@
+"""HashtagSuggestionStore（コーパス全体のTF-IDFによるハッシュタグ候補）のテスト"""
+import threading
+
+import social_media_post_generator as sgp
+
+
+def test_suggestions_are_found_by_loaded_content_for_crlf_files(tmp_path):
+    folder = tmp_path / 'writing'
+    folder.mkdir()
+    (folder / 'crlf.md').write_bytes('# プロンプト設計\r\nプロンプトの工夫で回答が変わる。\r\n'.encode('utf-8'))
+    (folder / 'lf.md').write_bytes('# 確定申告\n確定申告の準備を進める。\n'.encode('utf-8'))
+    generator = sgp.SocialMediaPostGenerator(folder)
+    md_files = generator.get_all_md_files()
+
+    store = sgp.HashtagSuggestionStore(tmp_path / 'suggestions.json')
+    assert store.build(md_files, generator) is True
+    by_title = {file['title']: file for file in md_files}
+    for title, tag in (('crlf', '#プロンプト'), ('lf', '#確定申告')):
+        content = generator.read_file_content(by_title[title]['path'])
+        assert tag in store.suggest(sgp.file_content_hash(by_title[title], content))
+    assert store.is_current(md_files)
+    assert store.build(md_files, generator) is False
+
+
+def test_file_content_hash_uses_blob_sha_or_loaded_content():
+    assert sgp.file_content_hash({'sha': 'a' * 40}, 'body') == 'a' * 40
+    # ローカルのマニフェストのハッシュは古いことがあるので、読み込んだ本文から計算する
+    assert sgp.file_content_hash({'content_hash': 'b' * 40}, 'body') == sgp.git_blob_sha(b'body')
+    assert sgp.file_content_hash({'content_hash': 'b' * 40}) is None
+    assert sgp.file_content_hash({}) is None
+
+
+def test_in_place_edit_generates_a_new_post(tmp_path):
+    folder = tmp_path / 'writing'
+    folder.mkdir()
+    path = folder / 'note.md'
+    path.write_text('# 社内のAI活用\nAIで議事録を自動化した。\n', encoding='utf-8')
+    generator = sgp.SocialMediaPostGenerator(folder)
+    store = sgp.PostStore(tmp_path / 'posts.sqlite')
+    config_hash = generator.config_hash()
+
+    def post_for_listed_file():
+        file = generator.get_all_md_files()[0]
+        content = generator.read_file_content(file['path'])
+        return store.get_or_create(generator, content, 'Twitter', file['title'],
+                                   sgp.file_content_hash(file, content), config_hash)
+
+    first = post_for_listed_file()
+    stat = path.stat()
+    path.write_text('# SNSの運用\nSNSの投稿を毎週まとめている。\n', encoding='utf-8')
+    # ディレクトリの更新日時は変わらないので、一覧（マニフェスト）のハッシュは古いまま
+    assert generator.get_all_md_files()[0]['content_hash'] == sgp.git_blob_sha(
+        '# 社内のAI活用\nAIで議事録を自動化した。\n'.encode('utf-8'))
+    assert path.stat().st_mtime_ns != stat.st_mtime_ns
+
+    second = post_for_listed_file()
+    assert '#AI活用' in first
+    assert second != first
+    assert '#SNS運用' in second and '#AI活用' not in second
+
+
+def test_concurrent_builds_publish_a_whole_store(tmp_path):
+    folder = tmp_path / 'writing'
+    folder.mkdir()
+    for i in range(30):
+        (folder / f'note{i}.md').write_text(f'# メモ{i}\n確定申告とプロンプト設計{i}の話。\n', encoding='utf-8')
+    generator = sgp.SocialMediaPostGenerator(folder)
+    md_files = generator.get_all_md_files()
+    stores = [sgp.HashtagSuggestionStore(tmp_path / 'suggestions.json') for _ in range(4)]
+
+    threads = [threading.Thread(target=store.build, args=(md_files, generator)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sgp.HashtagSuggestionStore(tmp_path / 'suggestions.json').is_current(md_files)
+    assert not list(tmp_path.glob('*.tmp'))
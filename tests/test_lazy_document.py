@@ -0,0 +1,49 @@
+"""LazyDocument（プレビューは先頭だけを読む）のテスト"""
+import social_media_post_generator as sgp
+
+
+class CountingGenerator:
+    def __init__(self, prefix='先頭'):
+        self.prefix = prefix
+        self.prefix_reads = []
+        self.full_reads = 0
+
+    def cached_body(self, sha):
+        return None
+
+    def read_file_prefix(self, url, max_chars=500):
+        self.prefix_reads.append(max_chars)
+        return self.prefix
+
+    def read_file_content(self, path, source, sha=None):
+        self.full_reads += 1
+        return '本文全体'
+
+
+def test_local_preview_reads_only_prefix(tmp_path):
+    path = tmp_path / 'long.md'
+    path.write_text('あ' * 10000, encoding='utf-8')
+    document = sgp.LazyDocument(CountingGenerator(), {'path': str(path), 'source': 'local'})
+
+    assert document.preview(501) == 'あ' * 501
+    assert not document.is_loaded
+
+
+def test_remote_preview_uses_range_read():
+    generator = CountingGenerator()
+    document = sgp.LazyDocument(generator, {'path': 'https://raw.example/a.md', 'source': 'github'})
+
+    assert document.preview(501) == '先頭'
+    assert generator.prefix_reads == [501]
+    assert generator.full_reads == 0
+
+
+def test_content_is_loaded_once():
+    generator = CountingGenerator()
+    document = sgp.LazyDocument(generator, {'path': 'https://raw.example/b.md', 'source': 'github'})
+
+    assert document.content == '本文全体'
+    assert document.content == '本文全体'
+    assert document.preview(2) == '本文'
+    assert generator.full_reads == 1
+    assert generator.prefix_reads == []
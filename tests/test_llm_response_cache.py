@@ -0,0 +1,133 @@
+"""LLM応答キャッシュと同じリクエストの集約のテスト"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import social_media_post_generator as sgp
+
+
+class FakeStream:
+    """releaseがセットされるまで最初のチャンクを送らないストリーム"""
+
+    def __init__(self, texts, release):
+        self.texts = texts
+        self.release = release
+
+    def __iter__(self):
+        self.release.wait(timeout=10)
+        for text in self.texts:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+    def close(self):
+        pass
+
+
+class FakeOpenAIClient:
+    """chat.completions.create の呼び出し回数を数える"""
+
+    def __init__(self, texts, release):
+        self.texts = texts
+        self.release = release
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if stream:
+            return FakeStream(self.texts, self.release)
+        self.release.wait(timeout=10)
+        message = SimpleNamespace(content=''.join(self.texts))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def make_ai(tmp_path, client):
+    ai = sgp.AIArticleGenerator(response_cache=sgp.LLMResponseCache(tmp_path / 'llm.sqlite'), api_key='test')
+    ai.client = client
+    return ai
+
+
+def wait_for_status(queue, job_id, statuses, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"ジョブが{statuses}になりませんでした: {queue.get(job_id)['status']}")
+
+
+ARTICLE_PARAMS = {'topic': 'AIと働き方', 'article_type': 'blog', 'target_length': 1000, 'use_cache': True,
+                  'references': []}
+
+
+def test_cache_hit_skips_producer(tmp_path):
+    cache = sgp.LLMResponseCache(tmp_path / 'llm.sqlite')
+    cache.put('key', 'model', 'cached article')
+    assert cache.get_or_generate('key', 'model', lambda: 'new article') == 'cached article'
+    assert cache.get_or_generate('key', 'model', lambda: 'new article', use_cache=False) == 'new article'
+    assert cache.get('key') == 'new article'
+
+
+def test_expired_entry_is_ignored(tmp_path):
+    cache = sgp.LLMResponseCache(tmp_path / 'llm.sqlite', ttl_seconds=0)
+    cache.put('key', 'model', 'old article')
+    time.sleep(0.01)
+    assert cache.get('key') is None
+
+
+def test_concurrent_blocking_requests_share_one_call(tmp_path):
+    release = threading.Event()
+    client = FakeOpenAIClient(['本文'], release)
+    ai = make_ai(tmp_path, client)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(ai.generate_article, 'AIと働き方', 'model-a') for _ in range(2)]
+        time.sleep(0.1)
+        release.set()
+        results = [future.result() for future in futures]
+    assert results == ['本文', '本文']
+    assert client.calls == 1
+
+
+def test_identical_concurrent_article_jobs_call_llm_once(tmp_path):
+    release = threading.Event()
+    client = FakeOpenAIClient(['こんにちは', '、世界'], release)
+    ai = make_ai(tmp_path, client)
+    queue = sgp.GenerationJobQueue(db_path=tmp_path / 'jobs.sqlite', workers=4)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        job_ids = list(pool.map(lambda _: queue.submit(ai, 'article', 'model-a', dict(ARTICLE_PARAMS)), range(2)))
+    wait_for_status(queue, job_ids[0], ('running',))
+    # 実行中のジョブにも相乗りする
+    job_ids.append(queue.submit(ai, 'article', 'model-a', dict(ARTICLE_PARAMS)))
+    release.set()
+
+    assert len(set(job_ids)) == 1
+    job = wait_for_status(queue, job_ids[0], ('done',))
+    assert job['result'] == 'こんにちは、世界'
+    assert client.calls == 1
+
+
+def test_different_requests_are_not_merged(tmp_path):
+    release = threading.Event()
+    release.set()
+    ai = make_ai(tmp_path, FakeOpenAIClient(['本文'], release))
+    queue = sgp.GenerationJobQueue(db_path=tmp_path / 'jobs.sqlite', workers=2)
+    first = queue.submit(ai, 'article', 'model-a', dict(ARTICLE_PARAMS))
+    second = queue.submit(ai, 'article', 'model-b', dict(ARTICLE_PARAMS))
+    assert first != second
+
+
+def test_cancel_by_one_waiter_keeps_shared_job_running(tmp_path):
+    release = threading.Event()
+    client = FakeOpenAIClient(['本文'], release)
+    ai = make_ai(tmp_path, client)
+    queue = sgp.GenerationJobQueue(db_path=tmp_path / 'jobs.sqlite', workers=1)
+    job_id = queue.submit(ai, 'article', 'model-a', dict(ARTICLE_PARAMS))
+    assert queue.submit(ai, 'article', 'model-a', dict(ARTICLE_PARAMS)) == job_id
+
+    assert queue.cancel(job_id) is False
+    release.set()
+    assert wait_for_status(queue, job_id, ('done', 'cancelled'))['status'] == 'done'
@@ -0,0 +1,37 @@
+"""画面用の本文キャッシュ（cached_file_content）のテスト"""
+import social_media_post_generator as sgp
+
+
+class FlakyGenerator:
+    """最初の読み取りだけ失敗する"""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+
+    def read_file_content(self, path, source, sha=None):
+        self.calls += 1
+        return self.results.pop(0)
+
+
+def test_read_error_is_not_cached(tmp_path):
+    generator = FlakyGenerator(["ファイル読み取りエラー: HTTP 502", "本文"])
+    file = {'path': 'https://raw.example/flaky.md', 'source': 'github', 'sha': 'a' * 40}
+
+    assert sgp.load_file_content(generator, file) == "ファイル読み取りエラー: HTTP 502"
+    assert sgp.load_file_content(generator, file) == "本文"
+    assert sgp.load_file_content(generator, file) == "本文"
+    assert generator.calls == 2
+
+
+def test_local_file_is_cached_until_it_changes(tmp_path):
+    path = tmp_path / 'note.md'
+    path.write_text('v1', encoding='utf-8')
+    generator = FlakyGenerator(["v1", "v2"])
+    file = {'path': str(path), 'source': 'local'}
+
+    assert sgp.load_file_content(generator, file) == "v1"
+    assert sgp.load_file_content(generator, file) == "v1"
+    path.write_text('v2 changed', encoding='utf-8')
+    assert sgp.load_file_content(generator, file) == "v2"
+    assert generator.calls == 2
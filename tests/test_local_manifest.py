@@ -0,0 +1,139 @@
+"""LocalManifest（ローカルフォルダの差分更新と監視通知の反映）のテスト"""
+import shutil
+
+import pytest
+
+import social_media_post_generator as sgp
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+
+
+def relative_paths(manifest):
+    return [file['relative_path'].replace('\\', '/') for file in manifest.md_files()]
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / 'writing'
+    write(root / 'a.md', '# A')
+    write(root / 'sub' / 'b.md', '# B')
+    write(root / 'sub' / 'deep' / 'c.md', '# C')
+    return root
+
+
+@pytest.fixture
+def watched(root, tmp_path):
+    """監視中と同じ状態（通知のあったパスだけを処理する）のマニフェスト"""
+    manifest = sgp.LocalManifest(root, manifest_path=tmp_path / 'manifest.json')
+    manifest.refresh()
+    manifest._watcher = ('test', None)
+    return manifest
+
+
+def test_initial_scan_lists_markdown_files(root, tmp_path):
+    write(root / 'notes.txt', 'not markdown')
+    manifest = sgp.LocalManifest(root, manifest_path=tmp_path / 'manifest.json')
+    assert manifest.refresh() is True
+    assert relative_paths(manifest) == ['a.md', 'sub/b.md', 'sub/deep/c.md']
+    assert manifest.refresh() is False
+
+
+def test_manifest_is_reloaded_from_disk(root, tmp_path):
+    sgp.LocalManifest(root, manifest_path=tmp_path / 'manifest.json').refresh()
+    reloaded = sgp.LocalManifest(root, manifest_path=tmp_path / 'manifest.json')
+    assert reloaded.refresh() is False
+    assert relative_paths(reloaded) == ['a.md', 'sub/b.md', 'sub/deep/c.md']
+
+
+def test_non_markdown_events_are_ignored_without_losing_the_batch(watched, root):
+    write(root / 'sub' / 'notes.txt', 'メモ')
+    write(root / 'sub' / '.b.md.swp', 'swap')
+    write(root / 'sub' / 'new.md', '# New')
+    watched._dirty_paths |= {
+        str(root / 'sub' / 'notes.txt'), str(root / 'sub' / '.b.md.swp'), str(root / 'sub' / 'new.md')
+    }
+    assert watched.refresh() is True
+    assert relative_paths(watched) == ['a.md', 'sub/b.md', 'sub/deep/c.md', 'sub/new.md']
+    assert not watched._dirty_paths
+
+
+def test_deleted_file_event_removes_entry(watched, root):
+    (root / 'sub' / 'b.md').unlink()
+    watched._dirty_paths |= {str(root / 'sub' / 'b.md'), str(root / 'sub')}
+    assert watched.refresh() is True
+    assert relative_paths(watched) == ['a.md', 'sub/deep/c.md']
+
+
+def test_deleted_directory_event_forgets_subtree(watched, root):
+    shutil.rmtree(root / 'sub')
+    watched._dirty_paths.add(str(root / 'sub'))
+    assert watched.refresh() is True
+    assert relative_paths(watched) == ['a.md']
+
+
+def test_new_directory_event_scans_new_subtree(watched, root):
+    write(root / 'new' / 'nested' / 'd.md', '# D')
+    watched._dirty_paths |= {str(root), str(root / 'new')}
+    assert watched.refresh() is True
+    assert 'new/nested/d.md' in relative_paths(watched)
+
+
+def test_modified_file_event_updates_hash(watched, root):
+    before = {file['relative_path']: file['content_hash'] for file in watched.md_files()}
+    write(root / 'a.md', '# A（追記しました）')
+    watched._dirty_paths.add(str(root / 'a.md'))
+    assert watched.refresh() is True
+    after = {file['relative_path']: file['content_hash'] for file in watched.md_files()}
+    assert after['a.md'] != before['a.md']
+
+
+def test_directory_replaced_by_file_is_forgotten(watched, root):
+    shutil.rmtree(root / 'sub' / 'deep')
+    write(root / 'sub' / 'deep', 'now a file')
+    watched._dirty_paths.add(str(root / 'sub' / 'deep'))
+    assert watched.refresh() is True
+    assert relative_paths(watched) == ['a.md', 'sub/b.md']
+
+
+def test_md_files_list_is_reused_until_files_change(watched, root):
+    first = watched.md_files()
+    assert watched.md_files()[0] is first[0]
+    write(root / 'z.md', '# Z')
+    watched._dirty_paths.add(str(root))
+    watched.refresh()
+    assert watched.md_files()[0] is not first[0]
+    assert relative_paths(watched)[-1] == 'z.md'
+
+
+def test_check_files_detects_overwrites_without_watcher(root, tmp_path):
+    manifest = sgp.LocalManifest(root, manifest_path=tmp_path / 'manifest.json')
+    manifest.refresh()
+    write(root / 'sub' / 'b.md', '# B（上書き）')
+    assert manifest.refresh(check_files=True) is True
+
+
+def test_refresh_file_picks_up_overwrite_missed_by_refresh(root, tmp_path):
+    manifest = sgp.LocalManifest(root, manifest_path=tmp_path / 'manifest.json')
+    manifest.refresh()
+    before = {file['relative_path']: file for file in manifest.md_files()}['a.md']
+    write(root / 'a.md', '# A（上書きで長くなった）')
+
+    assert manifest.refresh() is False  # ディレクトリの更新日時は変わらないので見えない
+    refreshed = manifest.refresh_file('a.md')
+
+    assert refreshed['content_hash'] == sgp.git_blob_sha((root / 'a.md').read_bytes())
+    assert refreshed['content_hash'] != before['content_hash']
+    assert {file['relative_path']: file for file in manifest.md_files()}['a.md'] == refreshed
+    assert sgp.LocalManifest(root, manifest_path=tmp_path / 'manifest.json').refresh_file('a.md') == refreshed
+
+
+def test_refresh_file_returns_none_for_deleted_file(root, tmp_path):
+    manifest = sgp.LocalManifest(root, manifest_path=tmp_path / 'manifest.json')
+    manifest.refresh()
+    (root / 'a.md').unlink()
+
+    assert manifest.refresh_file('a.md') is None
+    assert 'a.md' not in relative_paths(manifest)
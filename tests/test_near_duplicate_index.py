@@ -0,0 +1,85 @@
+"""NearDuplicateIndex（MinHash/LSHによる類似記事の検出）のテスト"""
+import json
+
+import social_media_post_generator as sgp
+
+ROWS = sgp.DUPLICATE_ROWS
+SIGNATURE_LENGTH = sgp.DUPLICATE_BANDS * sgp.DUPLICATE_ROWS
+
+
+class FakeGenerator:
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    def prefetch_files(self, md_files, wait_for_completion=False):
+        pass
+
+    def read_file_content(self, path, source='local', sha=None):
+        return self.bodies[path]
+
+
+def make_files(bodies):
+    return [
+        {'title': name, 'path': name, 'relative_path': name, 'category': 'メイン', 'source': 'github',
+         'sha': sgp.git_blob_sha(body.encode('utf-8'))}
+        for name, body in bodies.items()
+    ]
+
+
+def insert_signature(index, doc_key, minhash, length=100):
+    with index._conn:
+        index._conn.execute(
+            'INSERT INTO signatures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (doc_key, doc_key, '', doc_key, 'github', doc_key, doc_key, length, json.dumps(minhash))
+        )
+
+
+def test_near_duplicates_are_clustered_with_longest_as_representative(tmp_path):
+    base = 'AIで事務作業を効率化する方法について、具体的な手順と体験談をまとめました。' * 20
+    bodies = {
+        'draft.md': base,
+        'final.md': base + '最後に、導入してみた感想を追記します。',
+        'other.md': '確定申告の準備はいつから始めるべきか、スケジュールを整理しました。' * 20,
+    }
+    index = sgp.NearDuplicateIndex(tmp_path / 'duplicates.sqlite')
+    files = make_files(bodies)
+    assert index.update(files, FakeGenerator(bodies)) == 3
+
+    clusters = index.clusters()
+    assert [[entry['relative_path'] for entry in cluster] for cluster in clusters] == [['final.md', 'draft.md']]
+    assert index.redundant_paths() == {'draft.md'}
+    assert [entry['relative_path'] for entry in index.duplicates_of('final.md')] == ['draft.md']
+    assert index.duplicates_of('other.md') == []
+    assert index.update(files, FakeGenerator(bodies)) == 0
+
+
+def test_removed_files_leave_their_clusters(tmp_path):
+    base = '同じ内容の記事です。' * 50
+    bodies = {'a.md': base, 'b.md': base + '追記'}
+    index = sgp.NearDuplicateIndex(tmp_path / 'duplicates.sqlite')
+    index.update(make_files(bodies), FakeGenerator(bodies))
+    assert index.redundant_paths() == {'a.md'}
+
+    del bodies['a.md']
+    index.update(make_files(bodies), FakeGenerator(bodies))
+    assert index.clusters() == []
+
+
+def test_every_pair_in_a_shared_bucket_is_compared(tmp_path):
+    """先頭のaとは似ていないbとcが、aと同じバケットにしか一緒に入らなくても検出される"""
+    shared = list(range(1000, 1000 + 2 * ROWS))  # バンド0・1はa・b・cで共通
+    a = shared + [2000 + i for i in range(SIGNATURE_LENGTH - len(shared))]
+    b = shared + [3000 + i for i in range(SIGNATURE_LENGTH - len(shared))]
+    c = list(b)
+    for band in range(2, sgp.DUPLICATE_BANDS):
+        c[band * ROWS] += 50000  # 各バンドで1行だけ変えて、バンド2以降ではbと同じバケットに入らないようにする
+    assert sgp.estimate_jaccard(b, c) >= sgp.DUPLICATE_THRESHOLD
+    assert sgp.estimate_jaccard(a, b) < sgp.DUPLICATE_THRESHOLD
+
+    index = sgp.NearDuplicateIndex(tmp_path / 'duplicates.sqlite')
+    insert_signature(index, 'a.md', a)
+    insert_signature(index, 'b.md', b, length=200)
+    insert_signature(index, 'c.md', c)
+
+    clusters = index.clusters()
+    assert [[entry['relative_path'] for entry in cluster] for cluster in clusters] == [['b.md', 'c.md']]
@@ -0,0 +1,161 @@
+"""RelatedArticleIndex（関連記事検索用のベクトル索引）のテスト"""
+import threading
+import time
+
+import numpy as np
+
+import social_media_post_generator as sgp
+
+DIMENSIONS = 256
+
+BODIES = {
+    'cats.md': '猫の飼い方。キャットフードの選び方と爪とぎの置き場所について。猫は高いところが好き。',
+    'dogs.md': '犬の散歩。リードの選び方と散歩の時間について。犬は毎日の散歩が大切。',
+    'coffee.md': 'コーヒーの淹れ方。豆の挽き方とお湯の温度、ドリップの速さについて。',
+    'tea.md': '紅茶の淹れ方。茶葉の量とお湯の温度、蒸らし時間について。',
+}
+
+
+class FakeGenerator:
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.reads = []
+
+    def prefetch_files(self, md_files, wait_for_completion=False):
+        pass
+
+    def read_file_content(self, path, source='local', sha=None):
+        self.reads.append(path)
+        return self.bodies[path]
+
+
+def make_files(bodies):
+    return [
+        {'title': name, 'path': name, 'relative_path': name, 'category': 'メイン', 'source': 'github',
+         'sha': sgp.git_blob_sha(body.encode('utf-8'))}
+        for name, body in bodies.items()
+    ]
+
+
+def build(tmp_path, bodies):
+    index = sgp.RelatedArticleIndex(tmp_path / 'related.npy', dimensions=DIMENSIONS)
+    index.update(make_files(bodies), FakeGenerator(bodies))
+    return index
+
+
+def reopen(tmp_path):
+    return sgp.RelatedArticleIndex(tmp_path / 'related.npy', dimensions=DIMENSIONS)
+
+
+def top(index, query):
+    results = index.search(query, limit=1)
+    return results[0]['relative_path'] if results else None
+
+
+def test_search_finds_closest_article(tmp_path):
+    index = build(tmp_path, BODIES)
+
+    assert len(index) == 4
+    assert top(index, 'コーヒー豆の挽き方') == 'coffee.md'
+    assert top(index, '犬の散歩のリード') == 'dogs.md'
+
+
+def test_unchanged_files_are_not_reread(tmp_path):
+    index = build(tmp_path, BODIES)
+    generator = FakeGenerator(BODIES)
+
+    assert index.update(make_files(BODIES), generator) == 0
+    assert reopen(tmp_path).update(make_files(BODIES), generator) == 0
+    assert generator.reads == []
+
+
+def test_changed_row_is_overwritten_in_place(tmp_path):
+    index = build(tmp_path, BODIES)
+    before = (tmp_path / 'related.npy').stat().st_ino
+    bodies = dict(BODIES, **{'tea.md': '登山の準備。靴とザックの選び方、山小屋の予約について。'})
+
+    assert index.update(make_files(bodies), FakeGenerator(bodies)) == 1
+
+    assert (tmp_path / 'related.npy').stat().st_ino == before  # 置き換えずにその場で書き換えている
+    assert not (tmp_path / 'related.rows.f32').exists()
+    reopened = reopen(tmp_path)
+    assert top(reopened, '登山靴とザック') == 'tea.md'
+    np.testing.assert_array_equal(np.asarray(reopened._matrix), np.asarray(index._matrix))
+
+
+def test_new_rows_are_appended_and_reloaded(tmp_path):
+    index = build(tmp_path, BODIES)
+    before = (tmp_path / 'related.npy').read_bytes()
+    bodies = dict(BODIES, **{'bread.md': 'パンの焼き方。強力粉とイーストの量、発酵の時間について。'})
+
+    assert index.update(make_files(bodies), FakeGenerator(bodies)) == 1
+
+    assert (tmp_path / 'related.npy').read_bytes() == before
+    assert (tmp_path / 'related.rows.f32').stat().st_size == DIMENSIONS * 4
+    reopened = reopen(tmp_path)
+    assert len(reopened) == 5
+    assert top(reopened, 'パンの発酵とイースト') == 'bread.md'
+
+
+def test_uncommitted_appended_rows_are_ignored(tmp_path):
+    index = build(tmp_path, BODIES)
+    bodies = dict(BODIES, **{'bread.md': 'パンの焼き方。強力粉とイーストの量、発酵の時間について。'})
+    index.update(make_files(bodies), FakeGenerator(bodies))
+    with open(tmp_path / 'related.rows.f32', 'ab') as f:
+        f.write(np.ones(DIMENSIONS, dtype=np.float32).tobytes())  # メタデータを書く前に止まった追記
+
+    reopened = reopen(tmp_path)
+    assert len(reopened) == 5
+    more = dict(bodies, **{'rice.md': 'ご飯の炊き方。お米の研ぎ方と水加減、浸水の時間について。'})
+    reopened.update(make_files(more), FakeGenerator(more))
+
+    assert (tmp_path / 'related.rows.f32').stat().st_size == 2 * DIMENSIONS * 4
+    assert top(reopen(tmp_path), 'お米の水加減') == 'rice.md'
+
+
+def test_removed_rows_are_reused_then_compacted(tmp_path):
+    bodies = dict(BODIES, **{f'note{i}.md': f'メモ{i}。特に関係のない雑記。' for i in range(4)})
+    index = build(tmp_path, bodies)
+
+    remaining = {key: body for key, body in bodies.items() if key != 'cats.md'}
+    index.update(make_files(remaining), FakeGenerator(remaining))
+    assert None in index._rows
+    assert top(reopen(tmp_path), '猫の爪とぎ') != 'cats.md'
+
+    refilled = dict(remaining, **{'bread.md': 'パンの焼き方。強力粉とイーストの量、発酵の時間について。'})
+    index.update(make_files(refilled), FakeGenerator(refilled))
+    assert None not in index._rows
+    assert len(index._rows) == 8
+
+    few = {key: bodies[key] for key in ('dogs.md', 'coffee.md')}
+    index.update(make_files(few), FakeGenerator(few))
+    reopened = reopen(tmp_path)
+    assert sorted(reopened._rows) == ['coffee.md', 'dogs.md']  # 空きが増えたので詰めて書き直している
+    assert top(reopened, 'コーヒー豆の挽き方') == 'coffee.md'
+
+
+def test_background_update_does_not_block_and_picks_up_latest_listing(tmp_path):
+    release = threading.Event()
+
+    class SlowGenerator(FakeGenerator):
+        def prefetch_files(self, md_files, wait_for_completion=False):
+            release.wait(timeout=10)
+
+    bodies = dict(BODIES, **{'bread.md': 'パンの焼き方。強力粉とイーストの量、発酵の時間について。'})
+    generator = SlowGenerator(bodies)
+    index = sgp.RelatedArticleIndex(tmp_path / 'related.npy', dimensions=DIMENSIONS)
+
+    started = time.monotonic()
+    index.update_in_background(make_files(BODIES), generator)
+    index.update_in_background(make_files(bodies), generator)  # 更新中に一覧が変わった
+    assert time.monotonic() - started < 1.0
+    assert index.is_updating
+    assert index.search('パンの発酵とイースト') == []  # 更新中もその時点の索引で検索できる
+
+    release.set()
+    deadline = time.monotonic() + 10
+    while index.is_updating and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not index.is_updating
+    assert len(index) == 5
+    assert top(index, 'パンの発酵とイースト') == 'bread.md'